@@ -0,0 +1,292 @@
+import asyncio
+import atexit
+import logging
+import os
+import sys
+import threading
+
+import aiohttp
+from web3 import AsyncWeb3, Web3
+from web3.middleware import ExtraDataToPOAMiddleware
+from web3.providers import AsyncHTTPProvider
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+import config
+import chain_profile
+import chain_registry
+import fee_oracle
+import metrics
+import preflight
+from fee_oracle import FEE_HISTORY_BLOCKS, REWARD_PERCENTILES
+from providers import RPC_POOL_SIZE, RPC_TIMEOUT
+
+
+# Пользовательское исключение
+class NetworkHandlerError(Exception):
+    pass
+
+
+# Одна aiohttp-сессия на цикл событий: сессия привязана к своему циклу
+_sessions = {}
+_lock = threading.Lock()
+# Фоновый цикл для синхронных обёрток (run_sync)
+_loop = None
+
+
+def get_session():
+    """Общая сессия текущего цикла событий с пулом соединений на хост."""
+    loop = asyncio.get_running_loop()
+    with _lock:
+        session = _sessions.get(loop)
+        if session is None or session.closed:
+            session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit_per_host=RPC_POOL_SIZE),
+                timeout=aiohttp.ClientTimeout(total=RPC_TIMEOUT),
+            )
+            _sessions[loop] = session
+        return session
+
+async def close_sessions():
+    """Закрывает сессию текущего цикла - вызывать в конце asyncio.run."""
+    with _lock:
+        session = _sessions.pop(asyncio.get_running_loop(), None)
+    if session is not None:
+        await session.close()
+
+def run_sync(coro, timeout=None):
+    """Выполняет корутину в фоновом цикле и ждёт результат из синхронного кода."""
+    global _loop
+    with _lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name='async-network', daemon=True).start()
+            atexit.register(_shutdown)
+    return asyncio.run_coroutine_threadsafe(coro, _loop).result(timeout)
+
+def _shutdown():
+    try:
+        asyncio.run_coroutine_threadsafe(close_sessions(), _loop).result(5)
+    except Exception:
+        pass
+
+
+class InstrumentedAsyncHTTPProvider(AsyncHTTPProvider):
+    """AsyncHTTPProvider с замером каждого RPC-вызова по сети и методу."""
+
+    def __init__(self, *args, chain_name=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.chain_name = chain_name
+
+    async def make_request(self, method, params):
+        with metrics.rpc_timer(self.chain_name, method) as status:
+            response = await super().make_request(method, params)
+            status['ok'] = response.get('error') is None
+            return response
+
+
+async def make_async_web3(rpc_url, chain_name=None):
+    """AsyncWeb3 поверх общей сессии цикла.
+
+    Переключение между несколькими RPC (FailoverProvider) есть только в
+    синхронном клиенте - из списка берём первый адрес.
+    """
+    if isinstance(rpc_url, (list, tuple)):
+        rpc_url = rpc_url[0]
+    provider = InstrumentedAsyncHTTPProvider(rpc_url, chain_name=chain_name)
+    await provider.cache_async_session(get_session())
+    return AsyncWeb3(provider)
+
+async def _request(web3, method, params):
+    # Сырой запрос: без форматтеров web3 и без PoA-middleware
+    response = await web3.provider.make_request(method, params)
+    if response.get('error') is not None or 'result' not in response:
+        raise ValueError(f"{method}: {response.get('error')}")
+    return response['result']
+
+async def probe(web3, chain_name):
+    """Профиль сети: chainId, последний блок и версия клиента запрашиваются одновременно."""
+    chain_id, latest, client_version = await asyncio.gather(
+        _request(web3, 'eth_chainId', []),
+        _request(web3, 'eth_getBlockByNumber', ['latest', False]),
+        _request(web3, 'web3_clientVersion', []),
+        return_exceptions=True,
+    )
+    for value in (chain_id, latest):
+        if isinstance(value, Exception):
+            raise value
+    old_number = chain_profile.old_block_number(latest)
+    old = None
+    if old_number is not None:
+        old = await _request(web3, 'eth_getBlockByNumber', [hex(old_number), False])
+    return chain_profile.build_profile(chain_name, chain_id, latest, old, web3.provider.endpoint_uri,
+                                       client_version if isinstance(client_version, str) else None)
+
+async def get_profile(web3, chain_name, ttl=chain_profile.PROFILE_TTL):
+    """Профиль сети из общего с синхронным кодом кэша, при устаревании - опрашивает."""
+    profile = chain_profile.fresh(chain_name, web3.provider.endpoint_uri, ttl)
+    if profile is not None:
+        return profile
+    profile = await probe(web3, chain_name)
+    chain_profile.store(chain_name, profile)
+    return profile
+
+
+class AsyncNetworkHandler:
+    """Асинхронный NetworkHandler на AsyncWeb3 - сети опрашиваются через asyncio.gather.
+
+    Создаётся через `await AsyncNetworkHandler.create(chain_name)`.
+    """
+
+    def __init__(self, chain_name):
+        self.chain_name = chain_name
+        self.rpc_url = chain_registry.rpc(chain_name)
+        self.web3 = None
+        self.account_address = Web3.to_checksum_address(config.main_addr)
+        if not self.account_address:
+            raise NetworkHandlerError(f"Адрес аккаунта не найден для сети {chain_name}")
+        self.private_key = config.PRIVATE_KEY_MAIN
+        if not config.PRIVATE_KEY_MAIN:
+            raise NetworkHandlerError(f"Приватный ключ не найден для сети {chain_name}")
+        # Последний pre-flight снимок из get_tx_params
+        self.snapshot = None
+
+    @classmethod
+    async def create(cls, chain_name):
+        logging.info(f"Подключаемся к: {chain_name}")
+        handler = cls(chain_name)
+        with metrics.phase(chain_name, 'connect', 'deploy'):
+            await handler._connect()
+        return handler
+
+    async def _connect(self):
+        """Подключается к сети и сохраняет AsyncWeb3."""
+        if not self.rpc_url:
+            raise NetworkHandlerError(f"RPC для сети {self.chain_name} не найден")
+        web3 = await make_async_web3(self.rpc_url, chain_name=self.chain_name)
+        # Профиль опрашивает сеть - отдельная проверка is_connected не нужна
+        try:
+            self.profile = await get_profile(web3, self.chain_name)
+        except Exception as e:
+            raise NetworkHandlerError(f"Не удалось подключиться к {self.chain_name}: {e}")
+        self.is_pos = not self.profile['is_poa'] and self.profile['eip1559']
+        self.chain_id = self.profile['chain_id']
+        self.native_token = self.profile['native_token']
+        if not self.is_pos:
+            web3.middleware_onion.inject(ExtraDataToPOAMiddleware, layer=0)
+        logging.info(f"Подключено к {self.chain_name} ID: {self.chain_id}")
+        self.web3 = web3
+
+    async def is_pos_network(self):
+        """Проверяет, является ли сеть PoS."""
+        try:
+            block = await _request(self.web3, 'eth_getBlockByNumber', ['latest', False])
+            return chain_profile._extra_data_size(block.get('extraData')) < 33
+        except Exception as e:
+            logging.warning(f"Ошибка проверки сети, считаем PoA: {e}")
+            return False
+
+    async def get_balance(self):
+        """Возвращает баланс аккаунта в wei."""
+        try:
+            return preflight._to_int(await _request(self.web3, 'eth_getBalance', [self.account_address, 'latest']))
+        except Exception as e:
+            logging.error(f"Ошибка получения баланса: {e}")
+            return 0
+
+    def to_ether(self, wei):
+        return Web3.from_wei(wei, 'ether')
+
+    async def fetch_snapshot(self, nonce=None):
+        """Баланс, nonce, блок и комиссии - одновременными запросами.
+
+        Необязательные значения (чаевые, gasPrice, feeHistory) при ошибке RPC
+        остаются None, как в preflight.fetch.
+        """
+        requests = {
+            'balance': ('eth_getBalance', [self.account_address, 'latest']),
+            'block': ('eth_getBlockByNumber', ['latest', False]),
+            'gas_price': ('eth_gasPrice', []),
+        }
+        if nonce is None:
+            requests['nonce'] = ('eth_getTransactionCount', [self.account_address, 'pending'])
+        if self.is_pos:
+            requests['max_priority_fee'] = ('eth_maxPriorityFeePerGas', [])
+            requests['fee_history'] = ('eth_feeHistory', [hex(FEE_HISTORY_BLOCKS), 'latest', REWARD_PERCENTILES])
+        responses = await asyncio.gather(*(_request(self.web3, method, params) for method, params in requests.values()),
+                                         return_exceptions=True)
+        results, errors = {}, {}
+        for name, response in zip(requests, responses):
+            if isinstance(response, Exception):
+                errors[name] = str(response)
+            else:
+                results[name] = response
+        for name in ('balance', 'block') + (('nonce',) if nonce is None else ()):
+            if name not in results:
+                raise ValueError(f'pre-flight: не удалось получить {name}: {errors.get(name)}')
+
+        block = results['block']
+        return preflight.Preflight(
+            chain_id=self.chain_id,
+            balance=preflight._to_int(results['balance']),
+            nonce=nonce if nonce is not None else preflight._to_int(results['nonce']),
+            block_number=preflight._to_int(block['number']),
+            base_fee=preflight._to_int(block.get('baseFeePerGas')),
+            max_priority_fee=preflight._to_int(results.get('max_priority_fee')),
+            gas_price=preflight._to_int(results.get('gas_price')),
+            fee_history=results.get('fee_history'),
+            errors=errors,
+        )
+
+    async def get_tx_params(self, gas_limit, nonce=None, urgency='normal'):
+        """Создаёт параметры транзакции с учётом типа сети; nonce=None - берётся из сети."""
+        if not self.web3:
+            return None
+        try:
+            with metrics.phase(self.chain_name, 'fee', 'deploy'):
+                self.snapshot = await self.fetch_snapshot(nonce)
+                # Всё нужное уже в снимке - fee_oracle в сеть не ходит
+                fees = fee_oracle.quote(None, self.chain_name, urgency, self.snapshot, eip1559=self.is_pos)
+        except fee_oracle.FeeTooHigh as e:
+            logging.warning(f"Комиссия слишком высокая: {e}")
+            return None
+        except Exception as e:
+            logging.error(f"Ошибка создания параметров транзакции: {e}")
+            return None
+        logging.info(str(fees))
+        if self.snapshot.balance < gas_limit * fees.max_price():
+            logging.warning(f"Недостаточно средств в {self.chain_name}: "
+                            f"{self.to_ether(self.snapshot.balance)} {self.native_token}")
+        return {
+            'from': self.account_address,
+            'nonce': self.snapshot.nonce,
+            'gas': gas_limit,
+            'chainId': self.chain_id,
+            **fees.tx_fields(),
+            }
+
+
+async def connect_all(chain_list):
+    """Подключается ко всем сетям одновременно: {chain_name: handler}, ошибки - в лог."""
+    results = await asyncio.gather(*(AsyncNetworkHandler.create(name) for name in chain_list),
+                                   return_exceptions=True)
+    handlers = {}
+    for name, result in zip(chain_list, results):
+        if isinstance(result, Exception):
+            logging.error(f"{result}")
+        else:
+            handlers[name] = result
+    return handlers
+
+async def _balances(chain_list):
+    try:
+        handlers = await connect_all(chain_list)
+        balances = await asyncio.gather(*(handler.get_balance() for handler in handlers.values()))
+        for handler, balance in zip(handlers.values(), balances):
+            logging.info(f"{handler.chain_name}: {handler.to_ether(balance)} {handler.native_token}")
+    finally:
+        await close_sessions()
+
+if __name__ == "__main__":
+    chain_list = chain_registry.select(chain_registry.names())
+    asyncio.run(_balances(chain_list))
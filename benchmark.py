@@ -0,0 +1,261 @@
+import argparse
+import contextlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from eth_account import Account
+from web3 import Web3
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+import config
+import chain_profile
+import chain_registry
+import receipt_tracker
+from standin_rpc import StandinChain, anvil_available
+
+
+# Сети из реестра, пригодные для gm (irys без контракта не участвует)
+DEFAULT_CHAINS = chain_registry.names('gm')
+SCENARIOS = ('gm', 'send', 'deploy')
+# Ключ только для локальных сетей бенчмарка
+BENCH_PRIVATE_KEY = '0x' + '42' * 32
+
+# RPC-метод -> фаза отправки
+PHASES = {
+    'eth_chainId': 'connect',
+    'web3_clientVersion': 'connect',
+    'net_version': 'connect',
+    'eth_estimateGas': 'estimate',
+    'eth_feeHistory': 'fee',
+    'eth_gasPrice': 'fee',
+    'eth_maxPriorityFeePerGas': 'fee',
+    'eth_sendRawTransaction': 'broadcast',
+}
+
+
+class PhaseRecorder:
+    """Собирает длительности по фазам со всех потоков."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}
+
+    def add(self, phase, seconds):
+        with self._lock:
+            self.samples.setdefault(phase, []).append(seconds)
+
+    def summary(self):
+        return {phase: _percentiles(values) for phase, values in sorted(self.samples.items())}
+
+
+def _percentiles(values):
+    values = sorted(values)
+    pick = lambda q: values[min(int(q * len(values)), len(values) - 1)]
+    return {
+        'count': len(values),
+        'p50': round(pick(0.50), 6),
+        'p90': round(pick(0.90), 6),
+        'p99': round(pick(0.99), 6),
+        'max': round(values[-1], 6),
+    }
+
+@contextlib.contextmanager
+def instrumented(recorder):
+    """Временно оборачивает провайдер, подпись и трекер квитанций замерами времени."""
+    original_request = Web3.HTTPProvider.make_request
+    original_batch = Web3.HTTPProvider.make_batch_request
+    # Дескриптор (combomethod) - чтобы вернуть именно его, а не привязанный метод
+    original_sign_descriptor = Account.__dict__['sign_transaction']
+    original_sign = Account.sign_transaction
+    original_watch = receipt_tracker.ReceiptTracker.watch
+
+    def make_request(self, method, params):
+        start = time.perf_counter()
+        try:
+            return original_request(self, method, params)
+        finally:
+            recorder.add(PHASES.get(method, 'read'), time.perf_counter() - start)
+
+    def make_batch_request(self, requests):
+        start = time.perf_counter()
+        try:
+            return original_batch(self, requests)
+        finally:
+            recorder.add('preflight', time.perf_counter() - start)
+
+    def sign_transaction(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            # original_sign уже привязан к классу (combomethod), а обёртка вызывается
+            # и через экземпляр (web3.eth.account), и через класс (presign, replacement)
+            return original_sign(*args, **kwargs)
+        finally:
+            recorder.add('sign', time.perf_counter() - start)
+
+    def watch(self, tx_hash, from_block=None):
+        start = time.perf_counter()
+        future = original_watch(self, tx_hash, from_block)
+        future.add_done_callback(lambda f: recorder.add('confirm', time.perf_counter() - start))
+        return future
+
+    Web3.HTTPProvider.make_request = make_request
+    Web3.HTTPProvider.make_batch_request = make_batch_request
+    Account.sign_transaction = staticmethod(sign_transaction)
+    receipt_tracker.ReceiptTracker.watch = watch
+    try:
+        yield recorder
+    finally:
+        Web3.HTTPProvider.make_request = original_request
+        Web3.HTTPProvider.make_batch_request = original_batch
+        Account.sign_transaction = original_sign_descriptor
+        receipt_tracker.ReceiptTracker.watch = original_watch
+
+def start_chains(chain_names, backend, block_time, latency, fail_rate):
+    """Поднимает по локальной сети на каждое имя и подменяет RPC в config."""
+    chains = {name: StandinChain(backend, block_time, latency, fail_rate, seed=i)
+              for i, name in enumerate(chain_names)}
+    account = Account.from_key(BENCH_PRIVATE_KEY)
+    config.PRIVATE_KEY_MAIN = BENCH_PRIVATE_KEY
+    config.main_addr = account.address
+    config.rpc_name_dict = {name: chain.url for name, chain in chains.items()}
+    for chain in chains.values():
+        chain.fund(account.address)
+        chain.reset_calls()
+    return chains
+
+def run_scenario(name, chain_names, workers):
+    """Запускает main() соответствующего скрипта, возвращает ошибку или None."""
+    try:
+        if name == 'gm':
+            import onchaingm
+            onchaingm.main(chain_names, max_workers=workers)
+        elif name == 'send':
+            import send_token
+            send_token.main(chain_names)
+        elif name == 'deploy':
+            import create_token_class
+            create_token_class.main(chain_names)
+    except SystemExit as e:
+        # compile_contract завершает процесс, если solc недоступен
+        return f'SystemExit({e.code})'
+    except Exception as e:
+        return f'{type(e).__name__}: {e}'
+    return None
+
+def _git_version():
+    try:
+        return subprocess.check_output(['git', 'describe', '--always', '--dirty'],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def isolate_state():
+    """Уводит всё состояние скриптов во временный каталог и возвращает его.
+
+    Локальные сети называются как боевые: их профили, оценки газа, адреса
+    контрактов и записи журнала не должны попасть в рабочие файлы - иначе
+    настоящий запуск продолжит чужой прогон и пропустит сети как выполненные.
+    """
+    import deployments
+    import gas_cache
+    import gm_indexer
+    import journal
+    import reconciler
+    state_dir = tempfile.mkdtemp(prefix='bench-')
+    chain_profile.PROFILE_PATH = os.path.join(state_dir, 'profiles.json')
+    chain_profile._profiles = None
+    gas_cache.GAS_CACHE_PATH = os.path.join(state_dir, 'gas_cache.json')
+    gas_cache._entries = None
+    deployments.REGISTRY_PATH = os.path.join(state_dir, 'deployments.json')
+    deployments._registry = None
+    journal.JOURNAL_PATH = os.path.join(state_dir, 'journal.sqlite3')
+    journal._local.__dict__.clear()
+    journal._runs.clear()
+    gm_indexer.INDEX_PATH = os.path.join(state_dir, 'gm_index.sqlite3')
+    gm_indexer._local.__dict__.clear()
+    reconciler.RESULTS_PATH = os.path.join(state_dir, 'tx_results.json')
+    return state_dir
+
+def benchmark(scenarios, chain_names, backend, block_time, latency, fail_rate, workers=None):
+    isolate_state()
+    if workers is None:
+        workers = chain_registry.limit('max_workers', chain_registry.DEFAULT_MAX_WORKERS)
+    report = {
+        'version': _git_version(),
+        'timestamp': time.time(),
+        'backend': backend,
+        'chains': len(chain_names),
+        'block_time': block_time,
+        'rpc_latency': latency,
+        'fail_rate': fail_rate,
+        'workers': workers,
+        'scenarios': {},
+    }
+    for scenario in scenarios:
+        chains = start_chains(chain_names, backend, block_time, latency, fail_rate)
+        recorder = PhaseRecorder()
+        # Каждый сценарий - с холодными кэшами профилей и трекеров
+        chain_profile._profiles = None
+        receipt_tracker._trackers.clear()
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull), instrumented(recorder):
+            start = time.perf_counter()
+            error = run_scenario(scenario, chain_names, workers)
+            wall_time = time.perf_counter() - start
+        rpc_calls = {}
+        for chain in chains.values():
+            for method, count in chain.calls.items():
+                rpc_calls[method] = rpc_calls.get(method, 0) + count
+            chain.close()
+        tx_count = rpc_calls.get('eth_sendRawTransaction', 0)
+        report['scenarios'][scenario] = {
+            'error': error,
+            'wall_time': round(wall_time, 4),
+            'tx_count': tx_count,
+            'tx_per_s': round(tx_count / wall_time, 3) if wall_time else None,
+            'rpc_calls_total': sum(rpc_calls.values()),
+            'rpc_calls': dict(sorted(rpc_calls.items())),
+            'phases': recorder.summary(),
+        }
+    return report
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Бенчмарк onchaingm на локальных сетях')
+    parser.add_argument('--scenarios', default='gm,send,deploy', help='через запятую: gm, send, deploy')
+    parser.add_argument('--chains', type=int, default=len(DEFAULT_CHAINS),
+                        help=f'сколько сетей поднять (до {len(DEFAULT_CHAINS)})')
+    parser.add_argument('--backend', choices=['eth-tester', 'anvil'], default='eth-tester')
+    parser.add_argument('--block-time', type=float, default=1.0, help='секунд на блок (0 - блок на каждую транзакцию)')
+    parser.add_argument('--latency', type=float, default=0.05, help='задержка ответа RPC, секунд')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='доля ответов 503')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='параллельность для сценария gm (по умолчанию - max_workers из [limits] chains.toml)')
+    parser.add_argument('--output', help='файл для JSON-отчёта (по умолчанию stdout)')
+    args = parser.parse_args(argv)
+
+    if args.backend == 'anvil' and not anvil_available():
+        parser.error('anvil не найден в PATH')
+    scenarios = [name for name in args.scenarios.split(',') if name]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f'неизвестные сценарии: {", ".join(sorted(unknown))}')
+    chain_names = DEFAULT_CHAINS[:max(args.chains, 1)]
+
+    report = benchmark(scenarios, chain_names, args.backend, args.block_time,
+                       args.latency, args.fail_rate, args.workers)
+    data = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(data + '\n')
+    else:
+        print(data)
+    return report
+
+if __name__ == '__main__':
+    main()
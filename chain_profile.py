@@ -0,0 +1,131 @@
+import json
+import os
+import sys
+import threading
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+import config
+import chain_registry
+
+
+# Статические свойства сетей почти не меняются, перепроверяем раз в сутки
+PROFILE_TTL = 24 * 3600
+PROFILE_PATH = getattr(config, 'CHAIN_PROFILES_PATH', None) or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '.chain_profiles.json')
+# Сколько блоков назад смотреть для оценки времени блока
+BLOCK_TIME_WINDOW = 100
+
+_lock = threading.Lock()
+_profiles = None
+
+
+def _load():
+    global _profiles
+    if _profiles is None:
+        try:
+            with open(PROFILE_PATH, encoding='utf-8') as f:
+                _profiles = json.load(f)
+        except (OSError, ValueError):
+            _profiles = {}
+    return _profiles
+
+def _save():
+    tmp_path = f'{PROFILE_PATH}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(_profiles, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, PROFILE_PATH)
+
+def _native_token(chain_name):
+    return chain_registry.native_token(chain_name)
+
+def _get_block(web3, block_id):
+    # Сырой запрос: на PoA-сетях без middleware get_block падает на extraData
+    response = web3.provider.make_request('eth_getBlockByNumber', [block_id, False])
+    if response.get('error') or not response.get('result'):
+        raise ValueError(f"не удалось получить блок {block_id}: {response.get('error')}")
+    return response['result']
+
+def _to_int(value):
+    return int(value, 16) if isinstance(value, str) else int(value)
+
+def _extra_data_size(value):
+    if isinstance(value, str):
+        return (len(value) - 2) // 2
+    return len(value or b'')
+
+def old_block_number(latest):
+    """Номер блока, по которому считается время блока (или None)."""
+    number = _to_int(latest['number'])
+    old_number = max(number - BLOCK_TIME_WINDOW, 0)
+    return old_number if old_number < number else None
+
+def _client_version(web3):
+    # Смена версии клиента - признак обновления сети (сбрасывает кэш оценок газа)
+    try:
+        return web3.provider.make_request('web3_clientVersion', []).get('result')
+    except Exception:
+        return None
+
+def build_profile(chain_name, chain_id, latest, old, rpc_url, client_version=None):
+    """Профиль из уже полученных chainId, последнего и старого блока (сырые RPC-ответы)."""
+    block_time = None
+    if old is not None:
+        block_time = ((_to_int(latest['timestamp']) - _to_int(old['timestamp']))
+                      / (_to_int(latest['number']) - _to_int(old['number'])))
+    # Явный флаг реестра важнее догадки по extraData
+    poa = chain_registry.poa(chain_name)
+    return {
+        'chain_id': _to_int(chain_id),
+        'is_poa': poa if poa is not None else _extra_data_size(latest.get('extraData')) > 32,
+        'eip1559': latest.get('baseFeePerGas') is not None,
+        'native_token': _native_token(chain_name),
+        'block_time': block_time,
+        'rpc_url': rpc_url,
+        'client_version': client_version,
+        'updated_at': time.time(),
+    }
+
+def probe(web3, chain_name):
+    """Опрашивает сеть и возвращает её профиль."""
+    latest = _get_block(web3, 'latest')
+    old_number = old_block_number(latest)
+    old = _get_block(web3, hex(old_number)) if old_number is not None else None
+    return build_profile(chain_name, web3.eth.chain_id, latest, old,
+                         getattr(web3.provider, 'endpoint_uri', None), _client_version(web3))
+
+def fresh(chain_name, rpc_url, ttl=PROFILE_TTL):
+    """Профиль из кэша, если он не устарел и снят с того же RPC (или None)."""
+    with _lock:
+        profile = _load().get(chain_name)
+    poa = chain_registry.poa(chain_name)
+    if (profile and time.time() - profile['updated_at'] < ttl
+            and profile.get('rpc_url') == rpc_url
+            and (poa is None or profile['is_poa'] == poa)):
+        return profile
+    return None
+
+def store(chain_name, profile):
+    with _lock:
+        _load()[chain_name] = profile
+        _save()
+
+def get_profile(web3, chain_name, ttl=PROFILE_TTL):
+    """Профиль сети из кэша, при устаревании или смене RPC - опрашивает заново."""
+    profile = fresh(chain_name, getattr(web3.provider, 'endpoint_uri', None), ttl)
+    if profile is not None:
+        return profile
+    profile = probe(web3, chain_name)
+    store(chain_name, profile)
+    return profile
+
+def cached(chain_name):
+    """Профиль из кэша без обращения к сети (или None)."""
+    with _lock:
+        return _load().get(chain_name)
+
+def invalidate(chain_name):
+    with _lock:
+        if _load().pop(chain_name, None) is not None:
+            _save()
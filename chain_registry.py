@@ -0,0 +1,175 @@
+import os
+import sys
+import threading
+from dataclasses import dataclass, field
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11
+    import tomli as tomllib
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+import config
+
+
+# Реестр сетей читается один раз за процесс и дальше живёт в памяти
+REGISTRY_PATH = getattr(config, 'CHAIN_REGISTRY_PATH', None) or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'chains.toml')
+OPERATIONS = ('gm', 'send', 'deploy', 'clone', 'index')
+# Операции, которым нужен контракт onchaingm
+GM_OPERATIONS = ('gm', 'index')
+DEFAULT_MAX_WORKERS = 5
+
+_lock = threading.Lock()
+_registry = None
+
+
+@dataclass(frozen=True)
+class Chain:
+    name: str
+    rpc: tuple = ()
+    ws_rpc: str | None = None
+    gm_contract: str = ''
+    multicall: str | None = None
+    poa: bool | None = None           # None - по extraData блока (chain_profile)
+    native_token: str | None = None
+    fee_cap_gwei: float | None = None
+    rpc_rate: float = 0               # запросов/сек к RPC сети, 0 - без ограничения
+    enabled: bool = True
+    default: bool = True              # входит в списки по умолчанию (names)
+    operations: frozenset = field(default_factory=lambda: frozenset(OPERATIONS))
+
+    def problem(self, operation=None, check_rpc=True):
+        """Почему сеть не может выполнить operation (None - может). Без обращения к сети."""
+        if not self.enabled:
+            return 'выключена в реестре'
+        if operation is not None and operation not in self.operations:
+            return f'{operation} не включён для сети'
+        if operation in GM_OPERATIONS and not self.gm_contract:
+            return 'нет адреса контракта onchaingm'
+        if check_rpc and not rpc(self.name):
+            return 'нет RPC'
+        return None
+
+
+def _chain(name, values):
+    rpc_urls = values.get('rpc') or ()
+    if isinstance(rpc_urls, str):
+        rpc_urls = (rpc_urls,)
+    unknown = set(values.get('operations', ())) - set(OPERATIONS)
+    if unknown:
+        raise ValueError(f"{REGISTRY_PATH}: {name}: неизвестные операции {', '.join(sorted(unknown))}")
+    return Chain(
+        name=name,
+        rpc=tuple(rpc_urls),
+        ws_rpc=values.get('ws_rpc'),
+        gm_contract=values.get('gm_contract', ''),
+        multicall=values.get('multicall'),
+        poa=values.get('poa'),
+        native_token=values.get('native_token'),
+        fee_cap_gwei=values.get('fee_cap_gwei'),
+        rpc_rate=values.get('rpc_rate', 0),
+        enabled=values.get('enabled', True),
+        default=values.get('default', True),
+        operations=frozenset(values.get('operations', OPERATIONS)),
+    )
+
+def load(path=None):
+    """{имя: Chain} в порядке файла; поля сети дополняются из [defaults]."""
+    global _registry
+    with _lock:
+        if _registry is None or path is not None:
+            with open(path or REGISTRY_PATH, 'rb') as f:
+                data = tomllib.load(f)
+            defaults = data.get('defaults', {})
+            chains = {name: _chain(name, dict(defaults, **values)) for name, values in data.get('chains', {}).items()}
+            _registry = {'chains': chains, 'limits': data.get('limits', {}), 'scripts': data.get('scripts', {})}
+        return _registry['chains']
+
+def get(chain_name):
+    return load().get(chain_name)
+
+def limit(name, default=None):
+    """Значение из [limits] реестра."""
+    load()
+    return _registry['limits'].get(name, default)
+
+def names(operation=None):
+    """Сети по умолчанию для операции: включённые, не исключённые из списков по умолчанию
+    (default = false) и с нужными адресами (RPC не проверяется)."""
+    return [name for name, chain in load().items()
+            if chain.default and chain.problem(operation, check_rpc=False) is None]
+
+def defaults(script, operation=None):
+    """Сети по умолчанию для сценария: список из [scripts] реестра, иначе names(operation)."""
+    load()
+    chain_list = _registry['scripts'].get(script)
+    return list(chain_list) if chain_list is not None else names(operation)
+
+def select(chain_list=None, operation=None):
+    """Сети из chain_list (по умолчанию - все из реестра), пригодные для operation.
+
+    Пропуск выключенных и недонастроенных сетей печатается; к сети при этом
+    никто не подключается. Сеть, которой нет в реестре, проверяется только на RPC.
+    """
+    if chain_list is None:
+        chain_list = list(load())
+    selected = []
+    for name in chain_list:
+        chain = get(name) or Chain(name)
+        reason = chain.problem(operation)
+        if reason is None:
+            selected.append(name)
+        else:
+            print(f'{name}: пропускаем - {reason}')
+    return selected
+
+def _override(dict_name, chain_name):
+    return getattr(config, dict_name, {}).get(chain_name)
+
+def rpc(chain_name):
+    """RPC сети: config.rpc_name_dict (там могут быть ключи доступа), иначе реестр."""
+    value = _override('rpc_name_dict', chain_name)
+    if value:
+        return value
+    chain = get(chain_name)
+    if chain is None or not chain.rpc:
+        return None
+    return list(chain.rpc) if len(chain.rpc) > 1 else chain.rpc[0]
+
+def ws_rpc(chain_name):
+    return _override('ws_rpc_name_dict', chain_name) or getattr(get(chain_name), 'ws_rpc', None)
+
+def gm_contract(chain_name):
+    return getattr(get(chain_name), 'gm_contract', '')
+
+def multicall(chain_name):
+    return _override('multicall_address_dict', chain_name) or getattr(get(chain_name), 'multicall', None)
+
+def poa(chain_name):
+    """PoA-флаг из реестра или None, если не задан."""
+    return getattr(get(chain_name), 'poa', None)
+
+def native_token(chain_name):
+    return _override('native_token_dict', chain_name) or getattr(get(chain_name), 'native_token', None) or 'ETH'
+
+def fee_cap_gwei(chain_name):
+    value = _override('fee_cap_dict', chain_name)
+    return value if value is not None else getattr(get(chain_name), 'fee_cap_gwei', None)
+
+def rpc_rate(chain_name):
+    return getattr(get(chain_name), 'rpc_rate', 0)
+
+def print_registry(operation=None):
+    print(f"{'chain':<14} {'enabled':<8} {'poa':<5} {'cap':>6} {'rate':>5}  {'operations':<30} problem")
+    for name, chain in load().items():
+        poa_flag = '-' if chain.poa is None else ('да' if chain.poa else 'нет')
+        operations = ','.join(op for op in OPERATIONS if op in chain.operations)
+        print(f"{name:<14} {'да' if chain.enabled else 'нет':<8} {poa_flag:<5} {fee_cap_gwei(name) or '-':>6} "
+              f"{chain.rpc_rate or '-':>5}  {operations:<30} {chain.problem(operation) or ''}")
+    print()
+
+if __name__ == "__main__":
+    print_registry()
+    print(f'script done\n')
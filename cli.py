@@ -0,0 +1,260 @@
+"""Единая точка входа: gm, send, deploy, balance, scan, index, reconcile, chains.
+
+Модули сценариев (web3, solcx, ABI контрактов) импортируются только
+подкомандой, которой они нужны; config - при первом обращении.
+`balance` обходится без web3 вовсе: сырой JSON-RPC через urllib.
+"""
+import argparse
+import importlib
+import os
+import sys
+import time
+
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+CONFIG_DIR = os.path.abspath(os.path.join(PACKAGE_DIR, '../'))
+# Что импортирует каждая подкоманда - по этим же спискам меряется холодный старт
+COMMAND_IMPORTS = {
+    'balance': ['json', 'urllib.request', 'decimal', 'concurrent.futures', 'chain_registry', 'chain_profile'],
+    'gm': ['onchaingm', 'scheduler'],
+    'send': ['send_token'],
+    'deploy': ['create_token_class'],
+    'scan': ['readiness'],
+    'index': ['gm_indexer'],
+    'reconcile': ['reconciler'],
+    'chains': ['chain_registry'],
+}
+COLD_START_TARGET = 0.15  # секунд на импорты balance - проверка должна быть мгновенной
+
+# (модуль, секунд) в порядке импорта, для --import-times
+_import_times = []
+
+
+def _import(name):
+    """Импорт с замером времени (повторный - бесплатно, из sys.modules)."""
+    if name in sys.modules:
+        return sys.modules[name]
+    start = time.perf_counter()
+    module = importlib.import_module(name)
+    _import_times.append((name, time.perf_counter() - start))
+    return module
+
+def _config():
+    # config лежит уровнем выше, как и в остальных скриптах
+    if CONFIG_DIR not in sys.path:
+        sys.path.append(CONFIG_DIR)
+    return _import('config')
+
+def _chains(args, operation=None):
+    # Без явного списка - сети из реестра chains.toml, пригодные для операции
+    return args.chains or _import('chain_registry').names(operation)
+
+def cmd_gm(args):
+    _config()
+    if args.schedule:
+        return _import('scheduler').main(_chains(args, 'gm'))
+    onchaingm = _import('onchaingm')
+    # Без --workers - [limits] max_workers из chains.toml
+    max_workers = args.workers if args.workers is not None else onchaingm.MAX_WORKERS
+    return onchaingm.main(_chains(args, 'gm'), max_workers=max_workers, batch_size=args.batch,
+                          confirm=not args.no_wait)
+
+def cmd_send(args):
+    _config()
+    return _import('send_token').main(_chains(args, 'send'), batched=args.batched, _count=args.count,
+                                      confirm=not args.no_wait)
+
+def cmd_deploy(args):
+    _config()
+    return _import('create_token_class').main(_chains(args, 'clone' if args.factory else 'deploy'), use_factory=args.factory, count=args.count,
+                                              confirm=not args.no_wait)
+
+def cmd_scan(args):
+    _config()
+    return _import('readiness').main(_chains(args), args.address or None)
+
+def cmd_index(args):
+    _config()
+    gm_indexer = _import('gm_indexer')
+    if args.local:
+        # Только локальный индекс - без единого запроса в сеть
+        address = args.address or sys.modules['config'].main_addr
+        return gm_indexer.print_summary(address, gm_indexer.summary(address))
+    return gm_indexer.main(_chains(args, 'index'), args.address)
+
+def cmd_reconcile(args):
+    _config()
+    reconciler = _import('reconciler')
+    return reconciler.main(args.flows or reconciler.FLOWS, args.timeout)
+
+def _rpc(url, method, params, timeout):
+    json = _import('json')
+    request = _import('urllib.request')
+    body = json.dumps({'jsonrpc': '2.0', 'id': 1, 'method': method, 'params': params}).encode()
+    req = request.Request(url, data=body, headers={'Content-Type': 'application/json'})
+    with request.urlopen(req, timeout=timeout) as response:
+        payload = json.loads(response.read())
+    if payload.get('error'):
+        raise ValueError(payload['error'])
+    return payload['result']
+
+def cmd_balance(args):
+    config = _config()
+    decimal = _import('decimal')
+    futures = _import('concurrent.futures')
+    chain_registry = _import('chain_registry')
+    chain_profile = _import('chain_profile')
+    address = args.address or config.main_addr
+    timeout = getattr(config, 'RPC_TIMEOUT', 20)
+
+    def fetch(name):
+        url = chain_registry.rpc(name)
+        if isinstance(url, (list, tuple)):
+            url = url[0]
+        if not url:
+            return name, None, 'нет RPC'
+        try:
+            return name, int(_rpc(url, 'eth_getBalance', [address, 'latest'], timeout), 16), None
+        except Exception as e:
+            return name, None, str(e) or type(e).__name__
+
+    chains = chain_registry.select(_chains(args))
+    if not chains:
+        return
+    with futures.ThreadPoolExecutor(max_workers=min(len(chains), 16)) as pool:
+        results = list(pool.map(fetch, chains))
+    print(f'{address}')
+    for name, wei, error in results:
+        token = ((chain_profile.cached(name) or {}).get('native_token')
+                 or getattr(config, 'native_token_dict', {}).get(name, 'ETH'))
+        if error:
+            print(f'{name:<14} {"-":>24}        {error}')
+        else:
+            print(f'{name:<14} {decimal.Decimal(wei) / 10**18:>24.8f} {token:<6}')
+    return results
+
+def _import_profile(modules):
+    """(секунд на импорт, [(cumulative мкс, пакет)]) в свежем интерпретаторе."""
+    subprocess = _import('subprocess')
+    code = (f'import sys, time; sys.path.append({CONFIG_DIR!r}); t = time.perf_counter(); '
+            f'import {", ".join(modules)}; print(time.perf_counter() - t)')
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [PACKAGE_DIR, os.environ.get('PYTHONPATH')])))
+
+    def run(source):
+        proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', source],
+                              capture_output=True, text=True, env=env, cwd=PACKAGE_DIR)
+        if proc.returncode != 0:
+            raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+        top = {}
+        for line in proc.stderr.splitlines():
+            if not line.startswith('import time:') or 'cumulative' in line:
+                continue
+            _, cumulative, package = line[len('import time:'):].split('|')
+            # Вложенные импорты идут с отступом - берём только верхний уровень
+            if not package.startswith('  '):
+                top[package.strip()] = int(cumulative)
+        return proc.stdout, top
+
+    # Импорты самого интерпретатора (site, encodings) в разбивку не входят
+    _, baseline = run('pass')
+    stdout, top = run(code)
+    breakdown = sorted(((us, name) for name, us in top.items() if name not in baseline), reverse=True)
+    return float(stdout.strip().splitlines()[-1]), breakdown
+
+def cmd_chains(args):
+    _config()
+    return _import('chain_registry').print_registry(args.operation)
+
+def cmd_imports(args):
+    commands = args.commands or list(COMMAND_IMPORTS)
+    for command in commands:
+        if command not in COMMAND_IMPORTS:
+            print(f'{command}: нет такой подкоманды\n')
+            continue
+        try:
+            seconds, breakdown = _import_profile(COMMAND_IMPORTS[command])
+        except Exception as e:
+            print(f'{command}: ошибка импорта: {e}\n')
+            continue
+        verdict = ''
+        if command == 'balance':
+            verdict = ' (цель {:.2f} с: {})'.format(COLD_START_TARGET, 'ok' if seconds <= COLD_START_TARGET else 'превышена')
+        print(f'{command}: {seconds:.3f} с{verdict}')
+        for us, name in breakdown[:args.top]:
+            print(f'    {us / 1000:>8.1f} мс  {name}')
+        print()
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='cli.py', description='onchaingm: GM, переводы, токены, балансы')
+    parser.add_argument('--import-times', action='store_true', help='показать время импортов подкоманды')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    gm = sub.add_parser('gm', help='sendGM в сетях')
+    gm.add_argument('chains', nargs='*')
+    gm.add_argument('--workers', type=int, default=None,
+                    help='сетей одновременно (по умолчанию - max_workers из [limits] chains.toml)')
+    gm.add_argument('--batch', type=int, default=None,
+                    help='вызовов в одной транзакции через Multicall3. ВНИМАНИЕ: отправителем в logGM '
+                         'будет агрегатор, а не кошелёк - такие GM не засчитываются аккаунту '
+                         '(история и серии в cli.py index)')
+    gm.add_argument('--schedule', action='store_true', help='ежедневный режим (scheduler)')
+    gm.add_argument('--no-wait', action='store_true', help='не ждать подтверждений (потом cli.py reconcile)')
+    gm.set_defaults(func=cmd_gm)
+
+    send = sub.add_parser('send', help='переводы самому себе')
+    send.add_argument('chains', nargs='*')
+    send.add_argument('--count', type=int, default=5)
+    send.add_argument('--batched', action='store_true', help='одной транзакцией через Multicall3')
+    send.add_argument('--no-wait', action='store_true', help='не ждать подтверждений (потом cli.py reconcile)')
+    send.set_defaults(func=cmd_send)
+
+    deploy = sub.add_parser('deploy', help='развернуть ERC20')
+    deploy.add_argument('chains', nargs='*')
+    deploy.add_argument('--factory', action='store_true', help='клоны через фабрику CREATE2')
+    deploy.add_argument('--count', type=int, default=1)
+    deploy.add_argument('--no-wait', action='store_true', help='не ждать подтверждений (потом cli.py reconcile)')
+    deploy.set_defaults(func=cmd_deploy)
+
+    balance = sub.add_parser('balance', help='балансы без web3')
+    balance.add_argument('chains', nargs='*')
+    balance.add_argument('--address', default=None)
+    balance.set_defaults(func=cmd_balance)
+
+    scan = sub.add_parser('scan', help='готовность сетей: балансы, nonce, комиссии по всем аккаунтам')
+    scan.add_argument('chains', nargs='*')
+    scan.add_argument('--address', action='append', help='адрес (можно несколько), по умолчанию - все аккаунты')
+    scan.set_defaults(func=cmd_scan)
+
+    index = sub.add_parser('index', help='индекс logGM: история и серии GM по аккаунту')
+    index.add_argument('chains', nargs='*')
+    index.add_argument('--address', default=None)
+    index.add_argument('--local', action='store_true', help='не догонять сеть, только локальный индекс')
+    index.set_defaults(func=cmd_index)
+
+    reconcile = sub.add_parser('reconcile', help='сверить транзакции, отправленные с --no-wait')
+    reconcile.add_argument('flows', nargs='*', help='по умолчанию - gm, gm_batch, send, send_batch, deploy, deploy_token')
+    reconcile.add_argument('--timeout', type=int, default=600, help='секунд ждать оставшиеся в пути')
+    reconcile.set_defaults(func=cmd_reconcile)
+
+    chains = sub.add_parser('chains', help='реестр сетей chains.toml и причины пропуска')
+    chains.add_argument('--operation', choices=('gm', 'send', 'deploy', 'clone', 'index'), default=None)
+    chains.set_defaults(func=cmd_chains)
+
+    imports = sub.add_parser('imports', help='разбивка холодного старта по подкомандам')
+    imports.add_argument('commands', nargs='*', metavar='command', help=', '.join(COMMAND_IMPORTS))
+    imports.add_argument('--top', type=int, default=8)
+    imports.set_defaults(func=cmd_imports)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        args.func(args)
+    finally:
+        if args.import_times and _import_times:
+            print('импорты:')
+            for name, seconds in sorted(_import_times, key=lambda item: -item[1]):
+                print(f'    {seconds * 1000:>8.1f} мс  {name}')
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+import hashlib
+import json
+import os
+import re
+
+
+SOLC_VERSION = '0.8.26'
+# Артефакты компиляции (ABI + bytecode) лежат рядом со скриптами
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.compile_cache')
+
+IMPORT_RE = re.compile(r'''import\s+(?:[^'"]*?\s+from\s+)?["']([^"']+)["']''')
+
+# Скомпилированное в этом процессе, чтобы не читать файл на каждую сеть
+_memory_cache = {}
+
+
+def default_remappings():
+    npm_path = os.path.join(os.path.expanduser("~"), "node_modules")
+    return {"@openzeppelin": f"{npm_path}/@openzeppelin"}
+
+def _resolve_path(import_path, remappings, base_dir):
+    for prefix, target in remappings.items():
+        if import_path.startswith(prefix):
+            return target + import_path[len(prefix):]
+    if import_path.startswith('.') and base_dir:
+        return os.path.normpath(os.path.join(base_dir, import_path))
+    return import_path
+
+def resolved_imports(source, remappings, base_dir=None, seen=None):
+    """Возвращает {путь: содержимое} всех импортов, рекурсивно."""
+    if seen is None:
+        seen = {}
+    for import_path in IMPORT_RE.findall(source):
+        path = _resolve_path(import_path, remappings, base_dir)
+        if path in seen:
+            continue
+        try:
+            with open(path, encoding='utf-8') as f:
+                content = f.read()
+        except OSError:
+            # Отсутствующий файл тоже входит в ключ - компиляция всё равно упадёт
+            seen[path] = None
+            continue
+        seen[path] = content
+        resolved_imports(content, remappings, os.path.dirname(path), seen)
+    return seen
+
+def cache_key(source, solc_version, remappings, output_values=('abi', 'bin')):
+    """Хэш исходника, версии solc, ремаппингов и содержимого всех импортов."""
+    digest = hashlib.sha256()
+    digest.update(solc_version.encode())
+    digest.update(','.join(output_values).encode())
+    digest.update(json.dumps(remappings, sort_keys=True).encode())
+    digest.update(source.encode())
+    for path, content in sorted(resolved_imports(source, remappings).items()):
+        digest.update(path.encode())
+        digest.update(b'\0' if content is None else content.encode())
+    return digest.hexdigest()
+
+def _load(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _store(path, compiled):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(compiled, f)
+    os.replace(tmp_path, path)
+
+def compile_cached(source, solc_version=SOLC_VERSION, remappings=None, output_values=('abi', 'bin')):
+    """Как solcx.compile_source, но с кэшем артефактов на диске.
+
+    При попадании в кэш solc не устанавливается и не запускается.
+    """
+    if remappings is None:
+        remappings = default_remappings()
+    key = cache_key(source, solc_version, remappings, output_values)
+    if key in _memory_cache:
+        return dict(_memory_cache[key])
+    path = os.path.join(CACHE_DIR, f'{key}.json')
+    compiled = _load(path)
+    if compiled is None:
+        from solcx import compile_source, install_solc, set_solc_version
+        install_solc(solc_version)
+        set_solc_version(solc_version)
+        compiled = compile_source(source, output_values=list(output_values), import_remappings=remappings)
+        _store(path, compiled)
+    _memory_cache[key] = compiled
+    return dict(compiled)
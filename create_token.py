@@ -1,13 +1,28 @@
 from web3 import Web3
+from web3.middleware import ExtraDataToPOAMiddleware
 import os, sys
 import hashlib
 import time
 import random
-from solcx import compile_source, install_solc, set_solc_version
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
 
 import config
+import chain_profile
+import chain_registry
+import providers
+import fee_oracle
+import receipt_tracker
+import metrics
+import journal
+import readiness
+import gas_cache
+import reconciler
+from compile_cache import compile_cached
+
+
+# Свой поток журнала: запуск create_token_class (поток deploy) не выдаётся за этот
+JOURNAL_FLOW = 'deploy_token'
 
 
 def is_poa_network(web3):
@@ -18,36 +33,23 @@ def is_poa_network(web3):
         return True  # По умолчанию считаем PoA
 
 def get_contract_address_onchaingm(chain_name):
-    contract_addresses_dict = {
-        "eth_sepolia":  "0x905415eb04E331d9edA60c67fcAa36e019Ab3C96",
-        'base_sepolia': '0xd932af3476A503ff3B07FDFf1A9B9e3febd29f29',
-        "monad":        "0xe48DF32fe1D7d4b73d1Af33A2edd65495945fDcD",
-        "mega":         "0x28D63f2386fC39D0B89608Fd25F51B31055B7892",
-        'somnia':       '0x7B2865d1387b1a5ce2D2465cfF8c6C3058a66De4',
-        "rise":         "0x779F6E324f16604B0F31B2D12a0C2EEeBB7f83F8",
-        "moca":         "0x69ff78Ec3A743D040f6D1434737aeb1F67db3eA6",
-        "kite":         "0x8Ce0D61503a90CC6dd6ae8F1AAf7FA6e2B32d30f", #poa
-        'incentiv':     '0x139c68fC3ffA5685D43d72b5Da5755241b0D0137', #poa
-        'camp':         '0x13B01762426C4386D24C0e211fC67b0fc71dcfEE',
-        'pharos':       '0x55F8D7108867f71827bEF25B261822dd4df5d9C5',
-        '0g':           '0xcdfE091654eb9Bea9406052E9c1Ffe715c6030be',
-        'sahara':       '0x7345847282E87fa3Ae842CBdAD4D1b7fAc17B24C', #poa
-        'nexus':        '0x0492225322A80f531bd746110b8138d8361B9Fc5',
-        'seismic':      '0xe19F5585061452c29f5E187DF93e12eB0794686f',
-        'irys':         '',
-    }
-    return contract_addresses_dict.get(chain_name)
+    return chain_registry.gm_contract(chain_name)
 
 def get_chain_rpc(chain_name):
-    return config.rpc_name_dict.get(chain_name)
+    return chain_registry.rpc(chain_name)
 
 def getWeb3(chain_name):
     rpc_url = get_chain_rpc(chain_name)
-    web3 = Web3(Web3.HTTPProvider(rpc_url))
-    # Проверяем подключение
-    if not web3.is_connected():
-        print(f'failed to connect to the {chain_name}\n')
-        return
+    web3 = providers.make_web3(rpc_url, chain_name=chain_name)
+    with metrics.phase(chain_name, 'connect', 'deploy'):
+        # Проверяем подключение
+        if not web3.is_connected():
+            print(f'failed to connect to the {chain_name}\n')
+            return
+        # Статические свойства сети берём из кэша профилей
+        profile = chain_profile.get_profile(web3, chain_name)
+    if profile['is_poa']:
+        web3.middleware_onion.inject(ExtraDataToPOAMiddleware, layer=0)
     return web3
 
 def get_balance(web3, account_address):
@@ -71,11 +73,8 @@ contract MyToken is ERC20 {
 
 def get_contract_data(solidity_code):
     try:
-        # Устанавливаем и используем версию solc
-        install_solc('0.8.26')  # Устанавливаем solc 0.8.26
-        set_solc_version('0.8.26')  # Указываем версию для компиляции
-        npm_path = os.path.join(os.path.expanduser("~"), "node_modules")
-        compiled = compile_source(solidity_code, output_values=['abi', 'bin'], import_remappings={"@openzeppelin": f"{npm_path}/@openzeppelin"})
+        # solc 0.8.26, артефакт берётся из кэша, если исходник и импорты не менялись
+        compiled = compile_cached(solidity_code)
         contract_id, contract_data = compiled.popitem()
         return contract_id, contract_data
     except Exception as e:
@@ -83,8 +82,6 @@ def get_contract_data(solidity_code):
         exit()
         return None, None
 
-contract_id, contract_data = get_contract_data(solidity_code)
-
 # Генерация уникального имени токена
 def generate_unique_token_name():
     unique_str = str(time.time()) + str(random.random())
@@ -92,7 +89,8 @@ def generate_unique_token_name():
     token_name = "Token_" + hash_str[:8]
     return token_name
 
-def create_token(chain_name):
+def create_token(chain_name, confirm=True):
+    # confirm=False - вернуться сразу после отправки, квитанцию сверит reconciler
     web3 = getWeb3(chain_name)
     if not web3:
         print("Ошибка подключения к сети")
@@ -105,13 +103,29 @@ def create_token(chain_name):
     # Преобразуем в checksum-формат
     account_address = Web3.to_checksum_address(account_address)
     # Получаем chainId
-    chain_id = web3.eth.chain_id
+    profile = chain_profile.get_profile(web3, chain_name)
+    chain_id = profile['chain_id']
     print(f"\nПодключено к {chain_name} ID: {chain_id}")
-    native_token = 'ETH' # добавить функцию получение имени токена
+    native_token = profile['native_token']
 
     balance_eth = get_balance(web3, account_address)
     print(f"Баланс: {balance_eth} ETH")
 
+    # Прерванный запуск: подтверждённое развёртывание не повторяем, отправленное - ждём
+    try:
+        confirmed, resumed = journal.reconcile(web3, chain_name, JOURNAL_FLOW)
+    except Exception as e:
+        print(f'обработанная ошибка сверки журнала в {chain_name}:\n{e}')
+        return
+    if confirmed:
+        print(f"{chain_name}: развёртывание из журнала подтверждено в блоке {confirmed[-1]['block']}\n")
+        return
+    if resumed:
+        print(f"{chain_name}: ждём развёртывание из журнала {resumed[-1]['hash']}")
+        if not confirm:
+            return resumed[-1]['hash']
+        return wait_receipt(web3, chain_name, resumed[-1]['hash'])
+
     contract_id, contract_data = get_contract_data(solidity_code)
     if not contract_data:
         return
@@ -125,80 +139,97 @@ def create_token(chain_name):
 
     initial_supply = web3.to_wei(1000000, 'ether')  # 1M токенов
 
-    # Оценка газа
+    constructor = contract.constructor(token_name, token_symbol, initial_supply)
+    # Все поля заданы - build_transaction только кодирует конструктор, без RPC
+    call = {'from': account_address,
+            'data': constructor.build_transaction({'from': account_address, 'gas': 0,
+                                                   'gasPrice': 0, 'chainId': 0, 'nonce': 0})['data']}
+    # Оценка газа: конструктор той же формы уже оценивали - берём из кэша,
+    # запас - по расходу в прошлых квитанциях
     try:
-        gas_estimate = contract.constructor(token_name, token_symbol, initial_supply).estimate_gas({
-            'from': account_address
-        })
-        gas_limit = gas_estimate + int(gas_estimate * 0.1)  # 10% запас
+        with metrics.phase(chain_name, 'estimate', 'deploy'):
+            gas_estimate = gas_cache.estimate(web3, chain_name, call)
+        gas_limit = gas_cache.gas_limit(chain_name, call, gas_estimate)
         print(f"Оценка газа: {gas_estimate}, Лимит газа: {gas_limit}")
     except Exception as e:
         print(f"Ошибка оценки газа: {e}")
         return
-    # Определяем параметры газа (EIP-1559)
+    # Комиссии по перцентилям eth_feeHistory (EIP-1559), на старых сетях - gasPrice
     try:
-        max_priority_fee = web3.eth.max_priority_fee  # Рекомендуемая приоритетная комиссия
-    except ValueError:
-        max_priority_fee = web3.to_wei('2', 'gwei')  # Запасное значение
-    
-    try:
-        base_fee = web3.eth.get_block('latest')['baseFeePerGas']
-        max_fee_per_gas = base_fee + max_priority_fee
-        max_fee_limit = web3.to_wei('200', 'gwei')
-        print(f"Базовая комиссия: {web3.from_wei(base_fee, 'gwei')} gwei")
-        print(f"Приоритетная комиссия: {web3.from_wei(max_priority_fee, 'gwei')} gwei")
-        print(f"Максимальная комиссия: {web3.from_wei(max_fee_per_gas, 'gwei')} gwei")
-
-        if max_fee_per_gas > max_fee_limit:
-            print("Комиссия слишком высокая, транзакция не отправлена")
-            exit()
-
-        # Рассчитываем стоимость
-        estimated_cost_wei = gas_limit * max_fee_per_gas
-        estimated_cost_eth = web3.from_wei(estimated_cost_wei, 'ether')
-        print(f"Оценочная стоимость транзакции: {estimated_cost_eth} {native_token}")
-            # Проверка баланса
-        gas_cost = gas_limit * max_fee_per_gas
-        balance_wei = web3.eth.get_balance(account_address)
-        if balance_wei < gas_cost:
-            print(f"Недостаточно средств: требуется {web3.from_wei(gas_cost, 'ether')} {native_token}, доступно {balance_eth}")
-            return
-        # Строим транзакцию
-        tx = contract.constructor(token_name, token_symbol, initial_supply).build_transaction({
-        'from': account_address,
-        'nonce': web3.eth.get_transaction_count(account_address),
-        'gas': gas_limit,
-        'maxFeePerGas': max_fee_per_gas,
-        'maxPriorityFeePerGas': max_priority_fee,
-        'chainId': chain_id
-    })
-    except Exception as e:
-        print(f'обработанная ошибка:\n{e}')
-        gas_price = web3.eth.gas_price
-        print(f"Gas Price: {web3.from_wei(gas_price, 'gwei')} gwei")
-        tx = contract.constructor(token_name, token_symbol, initial_supply).build_transaction({
+        with metrics.phase(chain_name, 'fee', 'deploy'):
+            fees = fee_oracle.quote(web3, chain_name, 'normal', eip1559=profile['eip1559'])
+    except fee_oracle.FeeTooHigh as e:
+        print(f"Комиссия слишком высокая, транзакция не отправлена: {e}")
+        return
+    print(fees)
+
+    # Рассчитываем стоимость
+    gas_cost = gas_limit * fees.max_price()
+    print(f"Оценочная стоимость транзакции: {web3.from_wei(gas_cost, 'ether')} {native_token}")
+    # Проверка баланса
+    balance_wei = web3.eth.get_balance(account_address)
+    if balance_wei < gas_cost:
+        print(f"Недостаточно средств: требуется {web3.from_wei(gas_cost, 'ether')} {native_token}, доступно {balance_eth}")
+        return
+    # Строим транзакцию
+    tx = constructor.build_transaction({
         'from': account_address,
         'nonce': web3.eth.get_transaction_count(account_address),
         'gas': gas_limit,
-        'gasPrice': gas_price,
-        'chainId': chain_id
+        'chainId': chain_id,
+        **fees.tx_fields(),
     })
 
-    # Подписываем и отправляем
-    signed_tx = web3.eth.account.sign_transaction(tx, private_key)
-    tx_hash = web3.eth.send_raw_transaction(signed_tx.raw_transaction)
-    receipt = web3.eth.wait_for_transaction_receipt(tx_hash)
+    # Подписываем, пишем в журнал и только потом отправляем
+    with metrics.phase(chain_name, 'sign', 'deploy'):
+        signed_tx = web3.eth.account.sign_transaction(tx, private_key)
+    journal.record(chain_name, JOURNAL_FLOW, account_address, tx['nonce'], signed_tx.raw_transaction, signed_tx.hash)
+    with metrics.phase(chain_name, 'broadcast', 'deploy'):
+        tx_hash = web3.eth.send_raw_transaction(signed_tx.raw_transaction)
+    journal.mark(chain_name, tx_hash, 'sent')
+    print(f"Транзакция отправлена: {tx_hash.hex()}")
+    if not confirm:
+        return tx_hash
+    return wait_receipt(web3, chain_name, tx_hash, gas_estimate, tx, call)
+
+def wait_receipt(web3, chain_name, tx_hash, gas_estimate=None, tx=None, call=None):
+    # Не дождались - запись остаётся в журнале, следующий запуск подхватит её
+    try:
+        with metrics.phase(chain_name, 'confirm', 'deploy'):
+            receipt = receipt_tracker.get_tracker(web3, chain_name).wait(tx_hash)
+    except TimeoutError as e:
+        print(f"{chain_name}: {e}\n")
+        return
+    journal.mark_receipt(chain_name, receipt)
+    if call is not None:
+        gas_cache.learn(chain_name, call, receipt, tx['gas'])
+    metrics.record_tx(chain_name, 'deploy', receipt.transactionHash, receipt, gas_estimate, tx, fee_oracle.fee_cap(chain_name))
     if receipt.status == 1:
         print(f"Контракт развёрнут по адресу: {receipt.contractAddress}\nТранзакция подтверждена в блоке: {receipt.blockNumber}\n")
     else:
         print("Транзакция провалилась\n")
-
-def main(chain_list):
+    return receipt
+
+def main(chain_list, confirm=True):
+    # confirm=False - только отправка, подтверждения собирает reconciler
+    # Недофинансированные сети отсеиваем до компиляции и оценки газа
+    chain_list = readiness.filter_ready(chain_registry.select(chain_list, 'deploy'), 'deploy')
+    # Прерванный запуск продолжается: сети, где токен уже развёрнут, пропускаем без RPC
+    journal.start_run(JOURNAL_FLOW, detached=not confirm)
+    done = journal.completed(JOURNAL_FLOW)
     for name in chain_list:
-        create_token(name)
+        if done.get(name) and not journal.has_pending(JOURNAL_FLOW, name):
+            print(f'{name}: уже выполнено в этом запуске, пропускаем')
+            continue
+        create_token(name, confirm)
+    if not confirm:
+        print(f'подтверждения не ждали - статусы соберёт reconciler ({reconciler.RESULTS_PATH})')
+        return
+    done = journal.completed(JOURNAL_FLOW)
+    if all(done.get(name) for name in chain_list):
+        journal.finish_run(JOURNAL_FLOW)
 
 if __name__ == '__main__':
-    chain_list = ['irys', 'eth_sepolia', 'monad', 'mega', 'somnia', 'rise', 'base_sepolia', 'moca', 'kite', 'incentiv', 'camp', 'pharos', '0g', 'sahara', 'nexus']
-    #chain_list = ['base_sepolia', ]
+    chain_list = chain_registry.defaults('create_token', 'deploy')
     main(chain_list)
     print(f'script done\n')
\ No newline at end of file
@@ -4,9 +4,7 @@ import time
 import random
 import hashlib
 import logging
-from web3 import Web3
 from web3.middleware import ExtraDataToPOAMiddleware
-from solcx import compile_source, install_solc, set_solc_version
 
 
 # Настройка логирования
@@ -14,7 +12,17 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 
 # Подключаем конфигурацию
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
-import config
+import chain_registry
+import providers
+import fee_oracle
+import receipt_tracker
+import metrics
+import journal
+import readiness
+import gas_cache
+import replacement
+from async_network import AsyncNetworkHandler, NetworkHandlerError, run_sync
+from compile_cache import compile_cached
 
 # Solidity-код контракта
 SOLIDITY_CODE = """
@@ -30,37 +38,31 @@ contract MyToken is ERC20 {
 }
 """
 
-# Пользовательское исключение
-class NetworkHandlerError(Exception):
-    pass
-
 class NetworkHandler:
+    """Синхронная обёртка над AsyncNetworkHandler.
+
+    Сетевые запросы выполняются асинхронным обработчиком в фоновом цикле,
+    self.web3 - синхронный клиент для контрактов (deploy_contract, фабрика).
+    """
+
     def __init__(self, chain_name):
-        logging.info(f"Подключаемся к: {chain_name}")
         self.chain_name = chain_name
-        self.rpc_url = config.rpc_name_dict.get(chain_name)
+        self.rpc_url = chain_registry.rpc(chain_name)
         self.web3 = self._connect()
-        self.account_address = Web3.to_checksum_address(config.main_addr)
-        if not self.account_address:
-            raise NetworkHandlerError(f"Адрес аккаунта не найден для сети {chain_name}")
-        self.private_key = config.PRIVATE_KEY_MAIN
-        if not config.PRIVATE_KEY_MAIN:
-            raise NetworkHandlerError(f"Приватный ключ не найден для сети {chain_name}")
-        
+        self.account_address = self._async.account_address
+        self.private_key = self._async.private_key
 
     def _connect(self):
         """Подключается к сети и возвращает объект Web3."""
-        if not self.rpc_url:
-            raise NetworkHandlerError(f"RPC для сети {self.chain_name} не найден")
-        web3 = Web3(Web3.HTTPProvider(self.rpc_url))
-        self.is_pos = self.is_pos_network(web3)
-        self.chain_id = web3.eth.chain_id if web3 else None
+        self._async = run_sync(AsyncNetworkHandler.create(self.chain_name))
+        self.profile = self._async.profile
+        self.is_pos = self._async.is_pos
+        self.chain_id = self._async.chain_id
+        self.native_token = self._async.native_token
+        # Профиль уже в кэше - синхронный клиент создаётся без запросов к сети
+        web3 = providers.make_web3(self.rpc_url, chain_name=self.chain_name)
         if not self.is_pos:
             web3.middleware_onion.inject(ExtraDataToPOAMiddleware, layer=0)
-        if not web3.is_connected():
-            raise NetworkHandlerError(f"Не удалось подключиться к {self.chain_name}")
-        else:
-            logging.info(f"Подключено к {self.chain_name} ID: {self.chain_id}")
         return web3
 
     def is_pos_network(self, web3):
@@ -74,61 +76,19 @@ class NetworkHandler:
 
     def get_balance(self):
         """Возвращает баланс аккаунта в wei."""
-        try:
-            return self.web3.eth.get_balance(self.account_address)
-        except Exception as e:
-            logging.error(f"Ошибка получения баланса: {e}")
-            return 0
+        return run_sync(self._async.get_balance())
     
     def to_ether(self, wei):
         return self.web3.from_wei(wei, 'ether')
 
-    def get_tx_params(self, gas_limit, nonce):
+    def get_tx_params(self, gas_limit, nonce, urgency='normal'):
         """Создаёт параметры транзакции с учётом типа сети."""
-        if not self.web3:
-            return None
-        try:
-            if self.is_pos:
-                max_priority_fee = self.web3.eth.max_priority_fee
-                base_fee = self.web3.eth.get_block('latest')['baseFeePerGas']
-                max_fee_per_gas = base_fee + max_priority_fee
-                max_fee_limit = self.web3.to_wei('200', 'gwei')
-                if max_fee_per_gas > max_fee_limit:
-                    logging.warning("Комиссия слишком высокая")
-                    return None
-                logging.info(f"Базовая комиссия: {self.web3.from_wei(base_fee, 'gwei')} gwei")
-                logging.info(f"Приоритетная комиссия: {self.web3.from_wei(max_priority_fee, 'gwei')} gwei")
-                return {
-                    'from': self.account_address,
-                    'nonce': nonce,
-                    'gas': gas_limit,
-                    'maxFeePerGas': max_fee_per_gas,
-                    'maxPriorityFeePerGas': max_priority_fee,
-                    'chainId': self.chain_id
-                    }  
-            else:
-                gas_price = self.web3.eth.gas_price
-                logging.info(f"Gas Price: {self.web3.from_wei(gas_price, 'gwei')} gwei")
-                return {
-                    'from': self.account_address,
-                    'nonce': nonce,
-                    'gas': gas_limit,
-                    'gasPrice': gas_price,
-                    'chainId': self.chain_id
-                    }
-
-        except Exception as e:
-            logging.error(f"Ошибка создания параметров транзакции: {e}")
-            return None
+        return run_sync(self._async.get_tx_params(gas_limit, nonce, urgency))
 
 def compile_contract(solidity_code):
-    """Компилирует Solidity-код."""
+    """Компилирует Solidity-код (с кэшем артефактов на диске)."""
     try:
-        install_solc('0.8.26')
-        set_solc_version('0.8.26')
-        npm_path = os.path.join(os.path.expanduser("~"), "node_modules")
-        compiled = compile_source(solidity_code, output_values=['abi', 'bin'], 
-                                 import_remappings={"@openzeppelin": f"{npm_path}/@openzeppelin"})
+        compiled = compile_cached(solidity_code)
         contract_id, contract_data = compiled.popitem()
         if not contract_data:
             logging.error(f"Ошибка получения данных контракта: {e}")
@@ -144,56 +104,133 @@ def generate_unique_token_name():
     hash_str = hashlib.sha256(unique_str.encode()).hexdigest()
     return "Token_" + hash_str[:8], "TKN" + hash_str[:3]
 
-def create_token(chain_name):
-    """Создаёт токен в указанной сети."""
-    try:
-        handler = NetworkHandler(chain_name)
-    except (Exception, NetworkHandlerError) as e:
-        logging.error(f"{e}")
-        return
-    
-    balance_wei = handler.get_balance()
-    logging.info(f"Баланс: {handler.to_ether(balance_wei)} ETH")
+def deploy_contract(handler, contract_data, constructor_args=(), flow='deploy', confirm=True):
+    """Разворачивает скомпилированный контракт, возвращает квитанцию или None.
 
-    contract_id, contract_data = compile_contract(SOLIDITY_CODE)
+    confirm=False - возвращает хэш сразу после отправки, квитанцию сверит reconciler.
+    """
+    chain_name = handler.chain_name
     contract = handler.web3.eth.contract(abi=contract_data['abi'], bytecode=contract_data['bin'])
-    token_name, token_symbol = generate_unique_token_name()
-    initial_supply = handler.web3.to_wei(1000000, 'ether')
-
+    constructor = contract.constructor(*constructor_args)
+    # Все поля заданы - build_transaction только кодирует конструктор, без RPC
+    call = {'from': handler.account_address,
+            'data': constructor.build_transaction({'from': handler.account_address, 'gas': 0,
+                                                   'gasPrice': 0, 'chainId': 0, 'nonce': 0})['data']}
     try:
-        gas_estimate = contract.constructor(token_name, token_symbol, initial_supply).estimate_gas({
-            'from': handler.account_address
-        })
-        gas_limit = int(gas_estimate * 1.1)
+        # Конструктор той же формы уже оценивали - берём из кэша
+        with metrics.phase(chain_name, 'estimate', flow):
+            gas_estimate = gas_cache.estimate(handler.web3, chain_name, call)
+        gas_limit = gas_cache.gas_limit(chain_name, call, gas_estimate)
         logging.info(f"Оценка газа: {gas_estimate}, Лимит газа: {gas_limit}")
     except Exception as e:
         logging.error(f"Ошибка оценки газа: {e}")
-        return
+        return None
 
     nonce = handler.web3.eth.get_transaction_count(handler.account_address)
     tx_params = handler.get_tx_params(gas_limit, nonce)
     if not tx_params:
-        return
-
-    tx = contract.constructor(token_name, token_symbol, initial_supply).build_transaction(tx_params)
-    signed_tx = handler.web3.eth.account.sign_transaction(tx, handler.private_key)
-    tx_hash = handler.web3.eth.send_raw_transaction(signed_tx.raw_transaction)
+        return None
+
+    tx = constructor.build_transaction(tx_params)
+    with metrics.phase(chain_name, 'sign', flow):
+        signed_tx = handler.web3.eth.account.sign_transaction(tx, handler.private_key)
+    journal.record(chain_name, flow, handler.account_address, nonce, signed_tx.raw_transaction, signed_tx.hash)
+    with metrics.phase(chain_name, 'broadcast', flow):
+        tx_hash = handler.web3.eth.send_raw_transaction(signed_tx.raw_transaction)
+    journal.mark(chain_name, tx_hash, 'sent')
     logging.info(f"Транзакция отправлена: {tx_hash.hex()}")
+    if not confirm:
+        return tx_hash
 
-    receipt = handler.web3.eth.wait_for_transaction_receipt(tx_hash)
+    # Застрявшее развёртывание заменяется тем же nonce с поднятыми комиссиями
+    replacer = replacement.Replacer(handler.web3, chain_name, handler.private_key, handler.account_address, flow)
+    try:
+        with metrics.phase(chain_name, 'confirm', flow):
+            receipt = replacer.wait(receipt_tracker.get_tracker(handler.web3, chain_name), tx_hash,
+                                    signed_tx.raw_transaction, nonce)
+    except TimeoutError as e:
+        # Запись остаётся в журнале - следующий запуск или reconciler её дождётся
+        metrics.record_tx(chain_name, flow, tx_hash, None, gas_estimate, tx, fee_oracle.fee_cap(chain_name))
+        logging.error(f"{chain_name}: {e}")
+        return None
+    journal.mark_receipt(chain_name, receipt)
+    gas_cache.learn(chain_name, call, receipt, gas_limit)
+    metrics.record_tx(chain_name, flow, receipt.transactionHash, receipt, gas_estimate, tx,
+                      fee_oracle.fee_cap(chain_name))
     if receipt.status == 1:
         logging.info(f"Контракт развёрнут: {receipt.contractAddress}, блок: {receipt.blockNumber}")
     else:
         logging.warning("Транзакция провалилась")
+    return receipt
 
-def main(chain_list):
+def create_token(chain_name, confirm=True):
+    """Создаёт токен в указанной сети."""
+    try:
+        handler = NetworkHandler(chain_name)
+    except (Exception, NetworkHandlerError) as e:
+        logging.error(f"{e}")
+        return
+    
+    balance_wei = handler.get_balance()
+    logging.info(f"Баланс: {handler.to_ether(balance_wei)} ETH")
+
+    # Прерванный запуск: подтверждённое развёртывание не повторяем, отправленное - ждём
+    try:
+        confirmed, resumed = journal.reconcile(handler.web3, chain_name, 'deploy')
+    except Exception as e:
+        logging.error(f"Ошибка сверки журнала в {chain_name}: {e}")
+        return
+    if confirmed:
+        logging.info(f"{chain_name}: развёртывание из журнала подтверждено в блоке {confirmed[-1]['block']}")
+        return
+    if resumed:
+        row = resumed[-1]
+        logging.info(f"{chain_name}: ждём развёртывание из журнала {row['hash']}")
+        if not confirm:
+            return row['hash']
+        replacer = replacement.Replacer(handler.web3, chain_name, handler.private_key, handler.account_address, 'deploy')
+        try:
+            receipt = replacer.wait(receipt_tracker.get_tracker(handler.web3, chain_name), row['hash'], row['raw'], row['nonce'])
+        except TimeoutError as e:
+            logging.error(f"{chain_name}: {e}")
+            return None
+        journal.mark_receipt(chain_name, receipt)
+        return receipt
+
+    contract_id, contract_data = compile_contract(SOLIDITY_CODE)
+    token_name, token_symbol = generate_unique_token_name()
+    initial_supply = handler.web3.to_wei(1000000, 'ether')
+    return deploy_contract(handler, contract_data, (token_name, token_symbol, initial_supply), confirm=confirm)
+
+def main(chain_list, use_factory=False, count=1, confirm=True):
+    """use_factory - токены клонами через фабрику CREATE2, сети параллельно.
+
+    confirm=False - только отправка (без фабрики), квитанции собирает reconciler.
+    """
+    # Недофинансированные сети отсеиваем до компиляции и оценки газа
+    operation = 'clone' if use_factory else 'deploy'
+    chain_list = readiness.filter_ready(chain_registry.select(chain_list, operation), operation)
+    if use_factory:
+        import token_factory
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=5, thread_name_prefix='factory') as pool:
+            return dict(zip(chain_list, pool.map(lambda name: token_factory.create_tokens(name, count), chain_list)))
+    # Запуск в журнале: прерванный продолжается, а при confirm=False по нему
+    # reconciler найдёт отправленные транзакции
+    journal.start_run('deploy', detached=not confirm)
+    done = journal.completed('deploy')
     for name in chain_list:
-        create_token(name)
+        if done.get(name) and not journal.has_pending('deploy', name):
+            logging.info(f"{name}: уже выполнено в этом запуске, пропускаем")
+            continue
+        create_token(name, confirm)
+    done = journal.completed('deploy')
+    if confirm and all(done.get(name) for name in chain_list):
+        journal.finish_run('deploy')
 
 
 if __name__ == "__main__":
     logging.info("скрипт выполняется")
-    #chain_list = ['irys', 'eth_sepolia', 'monad', 'mega', 'somnia', 'rise', 'base_sepolia', 'moca', 'kite', 'incentiv', 'camp', 'pharos', '0g', 'sahara', 'nexus']
-    chain_list = ['moca', 'mega']
+    chain_list = chain_registry.defaults('create_token_class', 'deploy')
     main(chain_list)
     logging.info("Скрипт завершён")
\ No newline at end of file
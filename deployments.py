@@ -0,0 +1,41 @@
+import json
+import os
+import sys
+import threading
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+import config
+
+
+# Адреса контрактов, развёрнутых скриптами: {вид: {сеть: адрес}}
+REGISTRY_PATH = getattr(config, 'DEPLOYMENTS_PATH', None) or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '.deployments.json')
+
+_lock = threading.Lock()
+_registry = None
+
+
+def _load():
+    global _registry
+    if _registry is None:
+        try:
+            with open(REGISTRY_PATH, encoding='utf-8') as f:
+                _registry = json.load(f)
+        except (OSError, ValueError):
+            _registry = {}
+    return _registry
+
+def get(kind, chain_name):
+    with _lock:
+        return _load().get(kind, {}).get(chain_name)
+
+def save(kind, chain_name, address):
+    with _lock:
+        registry = _load()
+        registry.setdefault(kind, {})[chain_name] = address
+        tmp_path = f'{REGISTRY_PATH}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(registry, f, indent=2, sort_keys=True)
+        # Запись атомарная - параллельный запуск не увидит обрезанный файл
+        os.replace(tmp_path, REGISTRY_PATH)
@@ -0,0 +1,172 @@
+import os
+import sys
+import threading
+import time
+from dataclasses import dataclass
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+import config
+import chain_profile
+import chain_registry
+
+
+# eth_feeHistory: сколько блоков смотреть и какие перцентили чаевых брать
+FEE_HISTORY_BLOCKS = 10
+REWARD_PERCENTILES = [10, 50, 90]
+# Срочность -> (индекс перцентиля чаевых, запас на рост base fee)
+# base fee растёт максимум на 12.5% за блок: 1.125 ~ 1 блок, 1.27 ~ 2 блока, 2.0 ~ 6 блоков
+URGENCY = {
+    'low': (0, 1.125),
+    'normal': (1, 1.27),
+    'high': (2, 2.0),
+}
+# Для сетей без EIP-1559 - множитель к eth_gasPrice
+GAS_PRICE_MULTIPLIER = {'low': 1.0, 'normal': 1.0, 'high': 1.2}
+DEFAULT_FEE_CAP_GWEI = 200
+FALLBACK_PRIORITY_FEE = 2 * 10**9  # 2 gwei, как раньше
+
+_lock = threading.Lock()
+# chain_name -> {'block': int, 'time': float, 'history': dict}
+_history_cache = {}
+
+
+class FeeTooHigh(Exception):
+    pass
+
+
+@dataclass
+class FeeQuote:
+    """Рассчитанные комиссии для транзакции."""
+    eip1559: bool
+    base_fee: int | None = None
+    max_priority_fee: int | None = None
+    max_fee_per_gas: int | None = None
+    gas_price: int | None = None
+
+    @classmethod
+    def from_tx(cls, tx):
+        """Комиссии из уже собранной транзакции."""
+        if 'maxFeePerGas' in tx:
+            return cls(eip1559=True, max_priority_fee=tx['maxPriorityFeePerGas'],
+                       max_fee_per_gas=tx['maxFeePerGas'])
+        return cls(eip1559=False, gas_price=tx['gasPrice'])
+
+    def tx_fields(self):
+        if self.eip1559:
+            return {'maxFeePerGas': self.max_fee_per_gas, 'maxPriorityFeePerGas': self.max_priority_fee}
+        return {'gasPrice': self.gas_price}
+
+    def max_price(self):
+        """Максимальная цена за единицу газа (для оценки стоимости)."""
+        return self.max_fee_per_gas if self.eip1559 else self.gas_price
+
+    def __str__(self):
+        gwei = lambda wei: f'{wei / 10**9:.4f} gwei'
+        if self.eip1559:
+            return (f'Базовая комиссия: {gwei(self.base_fee)}, '
+                    f'приоритетная: {gwei(self.max_priority_fee)}, '
+                    f'максимальная: {gwei(self.max_fee_per_gas)}')
+        return f'Gas Price: {gwei(self.gas_price)}'
+
+
+def fee_cap(chain_name):
+    """Потолок цены газа для сети в wei (config.fee_cap_dict или реестр, в gwei)."""
+    cap_gwei = chain_registry.fee_cap_gwei(chain_name)
+    if cap_gwei is None:
+        cap_gwei = DEFAULT_FEE_CAP_GWEI
+    return int(cap_gwei * 10**9)
+
+def _to_int(value):
+    return int(value, 16) if isinstance(value, str) else int(value)
+
+def fetch_history(web3):
+    response = web3.provider.make_request(
+        'eth_feeHistory', [hex(FEE_HISTORY_BLOCKS), 'latest', REWARD_PERCENTILES])
+    if response.get('error') or not response.get('result'):
+        return None
+    return response['result']
+
+def _history(web3, chain_name, snapshot):
+    """История комиссий с кэшем на блок: из pre-flight, из кэша или запросом."""
+    block = snapshot.block_number if snapshot is not None else None
+    if snapshot is not None and snapshot.fee_history:
+        with _lock:
+            _history_cache[chain_name] = {'block': block, 'time': time.monotonic(),
+                                          'history': snapshot.fee_history}
+        return snapshot.fee_history
+    with _lock:
+        cached = _history_cache.get(chain_name)
+    if cached:
+        if block is not None and cached['block'] == block:
+            return cached['history']
+        # Без номера блока считаем кэш свежим в пределах одного блока
+        block_time = (chain_profile.cached(chain_name) or {}).get('block_time') or 2
+        if block is None and time.monotonic() - cached['time'] < block_time:
+            return cached['history']
+    if web3 is None:
+        # Асинхронные вызовы передают всё в снимке, синхронного клиента у них нет
+        return None
+    history = fetch_history(web3)
+    if history:
+        newest = _to_int(history['oldestBlock']) + len(history.get('reward') or []) - 1
+        with _lock:
+            _history_cache[chain_name] = {'block': block if block is not None else newest,
+                                          'time': time.monotonic(), 'history': history}
+    return history
+
+def _median(values):
+    values = sorted(values)
+    return values[len(values) // 2] if values else None
+
+def quote(web3, chain_name, urgency='normal', snapshot=None, eip1559=None):
+    """Комиссии на основе перцентилей eth_feeHistory.
+
+    При превышении потолка сети бросает FeeTooHigh - процесс не завершается.
+    """
+    urgency = urgency.lower() if urgency.lower() in URGENCY else 'normal'
+    cap = fee_cap(chain_name)
+
+    history = None
+    if eip1559 is not False:
+        history = _history(web3, chain_name, snapshot)
+    # Последний элемент baseFeePerGas - base fee следующего блока
+    base_fees = [_to_int(fee) for fee in (history or {}).get('baseFeePerGas') or []]
+    if eip1559 is None:
+        if base_fees:
+            eip1559 = base_fees[-1] > 0
+        elif snapshot is not None:
+            eip1559 = snapshot.base_fee is not None
+        else:
+            eip1559 = (chain_profile.cached(chain_name) or {}).get('eip1559', False)
+
+    if not eip1559:
+        gas_price = snapshot.gas_price if snapshot is not None and snapshot.gas_price is not None else None
+        if gas_price is None:
+            gas_price = web3.eth.gas_price
+        gas_price = int(gas_price * GAS_PRICE_MULTIPLIER[urgency])
+        if gas_price > cap:
+            raise FeeTooHigh(f'gas price {gas_price / 10**9:.2f} gwei выше потолка {cap / 10**9:.2f} gwei')
+        return FeeQuote(eip1559=False, gas_price=gas_price)
+
+    index, headroom = URGENCY[urgency]
+    if base_fees:
+        next_base_fee = base_fees[-1]
+    elif snapshot is not None and snapshot.base_fee is not None:
+        next_base_fee = snapshot.base_fee
+    else:
+        next_base_fee = web3.eth.get_block('latest')['baseFeePerGas']
+    rewards = [_to_int(block[index]) for block in (history or {}).get('reward') or [] if block]
+    priority_fee = _median([reward for reward in rewards if reward > 0])
+    if priority_fee is None:
+        # Пустые блоки: берём рекомендацию ноды
+        priority_fee = snapshot.max_priority_fee if snapshot is not None else None
+    if priority_fee is None:
+        priority_fee = FALLBACK_PRIORITY_FEE
+
+    if next_base_fee + priority_fee > cap:
+        raise FeeTooHigh(f'base fee {next_base_fee / 10**9:.2f} gwei + чаевые выше потолка {cap / 10**9:.2f} gwei')
+    # Запас на рост base fee ограничиваем потолком - транзакция всё ещё проходит
+    max_fee_per_gas = min(int(next_base_fee * headroom) + priority_fee, cap)
+    return FeeQuote(eip1559=True, base_fee=next_base_fee, max_priority_fee=priority_fee,
+                    max_fee_per_gas=max_fee_per_gas)
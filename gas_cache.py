@@ -0,0 +1,141 @@
+import json
+import os
+import sys
+import threading
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+import config
+import chain_profile
+import preflight
+
+
+# Одинаковые по форме вызовы (sendGM("GM"), перевод себе, конструктор токена)
+# стоят одинаково - eth_estimateGas для них повторять незачем
+GAS_CACHE_PATH = getattr(config, 'GAS_CACHE_PATH', None) or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '.gas_cache.json')
+GAS_CACHE_TTL = getattr(config, 'GAS_CACHE_TTL', 3 * 24 * 3600)   # страховка от незамеченных обновлений сети
+DEFAULT_MARGIN = 0.10     # запас, пока не видели ни одной квитанции
+MIN_MARGIN = 0.02         # запас поверх наблюдаемого расхода
+MIN_SAMPLES = 2           # квитанций до перехода на выученный запас
+
+_lock = threading.Lock()
+_entries = None
+
+
+def _load():
+    global _entries
+    if _entries is None:
+        try:
+            with open(GAS_CACHE_PATH, encoding='utf-8') as f:
+                _entries = json.load(f)
+        except (OSError, ValueError):
+            _entries = {}
+    return _entries
+
+def _save():
+    tmp_path = f'{GAS_CACHE_PATH}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(_entries, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, GAS_CACHE_PATH)
+
+def _data(call):
+    data = call.get('data') or call.get('input') or '0x'
+    return data if isinstance(data, str) else '0x' + bytes(data).hex()
+
+def shape(call):
+    """Форма вызова: адрес (или create), селектор, длина calldata, есть ли value."""
+    data = _data(call)
+    to = (call.get('to') or 'create').lower()
+    value = 'value' if call.get('value') else 'zero'
+    return f'{to}:{data[:10]}:{(len(data) - 2) // 2}:{value}'
+
+def _client_version(chain_name):
+    return (chain_profile.cached(chain_name) or {}).get('client_version')
+
+def get(chain_name, call):
+    """Оценка газа из кэша или None (устарела, другая версия клиента, нет записи)."""
+    with _lock:
+        entry = _load().get(chain_name, {}).get(shape(call))
+    if entry is None:
+        return None
+    if time.time() - entry['updated_at'] > GAS_CACHE_TTL or entry.get('client') != _client_version(chain_name):
+        invalidate(chain_name, call)
+        return None
+    return entry['estimate']
+
+def put(chain_name, call, estimate):
+    with _lock:
+        entries = _load().setdefault(chain_name, {})
+        entry = entries.get(shape(call)) or {'ratio': None, 'samples': 0}
+        entry.update(estimate=estimate, client=_client_version(chain_name), updated_at=time.time())
+        entries[shape(call)] = entry
+        _save()
+
+def invalidate(chain_name, call=None):
+    """Сбрасывает запись вызова (или всю сеть при call=None)."""
+    with _lock:
+        entries = _load()
+        if call is None:
+            removed = entries.pop(chain_name, None) is not None
+        else:
+            removed = entries.get(chain_name, {}).pop(shape(call), None) is not None
+        if removed:
+            _save()
+
+def gas_limit(chain_name, call, estimate):
+    """Лимит газа: оценка плюс запас, выученный по gasUsed квитанций (по умолчанию 10%)."""
+    with _lock:
+        entry = _load().get(chain_name, {}).get(shape(call))
+    if entry is None or entry['samples'] < MIN_SAMPLES or entry['ratio'] is None:
+        return int(estimate * (1 + DEFAULT_MARGIN))
+    # ratio - наибольшее gasUsed / оценка; ниже оценки лимит не опускаем
+    return int(estimate * max(entry['ratio'], 1) * (1 + MIN_MARGIN))
+
+def learn(chain_name, call, receipt, limit=None):
+    """Учитывает фактический gasUsed; revert или исчерпание лимита сбрасывают запись."""
+    if receipt is None:
+        return
+    used = receipt['gasUsed']
+    if receipt['status'] != 1 or (limit and used >= limit):
+        invalidate(chain_name, call)
+        return
+    with _lock:
+        entry = _load().get(chain_name, {}).get(shape(call))
+        if entry is None:
+            return
+        ratio = used / entry['estimate']
+        entry['ratio'] = max(entry['ratio'] or 0, ratio)
+        entry['samples'] += 1
+        _save()
+
+def estimate(web3, chain_name, call):
+    """eth_estimateGas с кэшем; ошибка оценки сбрасывает запись и пробрасывается."""
+    cached = get(chain_name, call)
+    if cached is not None:
+        return cached
+    try:
+        value = web3.eth.estimate_gas(call)
+    except Exception:
+        invalidate(chain_name, call)
+        raise
+    put(chain_name, call, value)
+    return value
+
+def fetch(web3, chain_name, account_address, estimate_tx):
+    """preflight.fetch, где оценка газа берётся из кэша - без eth_estimateGas в батче.
+
+    В снимке заполняются gas_estimate и gas_limit (с выученным запасом).
+    """
+    cached = get(chain_name, estimate_tx)
+    snapshot = preflight.fetch(web3, account_address, None if cached is not None else estimate_tx)
+    if cached is not None:
+        snapshot.gas_estimate = cached
+    elif snapshot.gas_estimate is not None:
+        put(chain_name, estimate_tx, snapshot.gas_estimate)
+    else:
+        invalidate(chain_name, estimate_tx)
+        return snapshot
+    snapshot.gas_limit = gas_limit(chain_name, estimate_tx, snapshot.gas_estimate)
+    return snapshot
@@ -0,0 +1,301 @@
+import os
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from eth_abi import decode
+from eth_utils import keccak, to_checksum_address
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+import config
+import chain_registry
+import onchaingm
+import preflight
+import providers
+
+
+INDEX_PATH = getattr(config, 'GM_INDEX_PATH', None) or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '.gm_index.sqlite3')
+LOG_GM_TOPIC = '0x' + keccak(text='logGM(string,address)').hex()
+CONFIRMATIONS = 5           # свежие блоки не индексируем - могут откатиться
+INITIAL_CHUNK = 2000        # блоков в одном eth_getLogs
+MIN_CHUNK = 16
+MAX_CHUNK = 50000
+MANY_LOGS = 5000            # при таком числе логов в ответе диапазон больше не растим
+INITIAL_LOOKBACK = 500000   # откуда начинать, если блок развёртывания не найден
+MAX_CHAIN_WORKERS = 8
+TIMESTAMP_BATCH = 500       # блоков в одном батче eth_getBlockByNumber при дозаполнении
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS gm_logs (
+    chain TEXT NOT NULL,
+    block INTEGER NOT NULL,
+    log_index INTEGER NOT NULL,
+    tx_hash TEXT NOT NULL,
+    sender TEXT NOT NULL,
+    greeting TEXT NOT NULL,
+    PRIMARY KEY (chain, block, log_index)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS gm_logs_sender ON gm_logs (sender, chain, block);
+CREATE TABLE IF NOT EXISTS blocks (
+    chain TEXT NOT NULL,
+    number INTEGER NOT NULL,
+    timestamp INTEGER NOT NULL,
+    PRIMARY KEY (chain, number)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS checkpoints (
+    chain TEXT NOT NULL,
+    contract TEXT NOT NULL,
+    last_block INTEGER NOT NULL,
+    chunk INTEGER NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (chain, contract)
+);
+"""
+
+_local = threading.local()
+
+
+def _connect():
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        conn = sqlite3.connect(INDEX_PATH, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.executescript(SCHEMA)
+        _local.conn = conn
+    return conn
+
+def _request(provider, method, params):
+    response = provider.make_request(method, params)
+    if response.get('error') is not None:
+        raise ValueError(response['error'])
+    return response['result']
+
+def tracked_addresses():
+    """Аккаунты, для которых сохраняем время блоков (серии по дням)."""
+    import wallet_pool
+    addresses = [config.main_addr] + [account.address for account in wallet_pool.load_accounts()]
+    return {to_checksum_address(address) for address in addresses if address}
+
+def _checkpoint(chain_name, contract):
+    return _connect().execute('SELECT last_block, chunk FROM checkpoints WHERE chain = ? AND contract = ?',
+                              (chain_name, contract)).fetchone()
+
+def _deploy_block(provider, contract, latest):
+    """Блок развёртывания бинарным поиском по eth_getCode (нужна архивная нода)."""
+    try:
+        low, high = 0, latest
+        while low < high:
+            middle = (low + high) // 2
+            if _request(provider, 'eth_getCode', [contract, hex(middle)]) in ('0x', '', None):
+                low = middle + 1
+            else:
+                high = middle
+        return low
+    except Exception:
+        # Не архивная нода - начинаем с недавней истории
+        return max(latest - INITIAL_LOOKBACK, 0)
+
+def _decode_logs(chain_name, logs):
+    """Декодирует пачку логов; одинаковые data (обычно "GM") декодируются один раз."""
+    greetings = {}
+    rows = []
+    for log in logs:
+        if log.get('removed'):
+            continue
+        data = log['data']
+        greeting = greetings.get(data)
+        if greeting is None:
+            greeting = greetings[data] = decode(['string'], bytes.fromhex(data[2:]))[0]
+        sender = to_checksum_address('0x' + log['topics'][1][-40:])
+        rows.append((chain_name, preflight._to_int(log['blockNumber']), preflight._to_int(log['logIndex']),
+                     log['transactionHash'], sender, greeting))
+    return rows
+
+def _fetch_timestamps(provider, chain_name, blocks):
+    """Время блоков одним батчем - только тех, что ещё не сохранены."""
+    conn = _connect()
+    known = {row[0] for row in conn.execute(
+        f"SELECT number FROM blocks WHERE chain = ? AND number IN ({', '.join('?' * len(blocks))})",
+        [chain_name, *blocks])} if blocks else set()
+    missing = sorted(set(blocks) - known)
+    if not missing:
+        return []
+    responses = preflight._execute(provider, [('eth_getBlockByNumber', [hex(number), False]) for number in missing])
+    return [(chain_name, number, preflight._to_int(response['result']['timestamp']))
+            for number, response in zip(missing, responses) if response.get('result')]
+
+def index_chain(chain_name, senders=None, max_blocks=None):
+    """Догоняет logGM сети от контрольной точки до latest - CONFIRMATIONS.
+
+    Размер диапазона eth_getLogs подстраивается: при отказе RPC (лимит
+    диапазона или числа логов, таймаут) уменьшается вдвое, при успехе растёт.
+    Возвращает число новых логов.
+    """
+    contract = onchaingm.get_contract_address_onchaingm(chain_name)
+    rpc_url = chain_registry.rpc(chain_name)
+    if not contract or not rpc_url:
+        return 0
+    contract = to_checksum_address(contract)
+    senders = senders if senders is not None else tracked_addresses()
+    provider = providers.make_provider(rpc_url, chain_name=chain_name)
+    conn = _connect()
+
+    head = preflight._to_int(_request(provider, 'eth_blockNumber', [])) - CONFIRMATIONS
+    checkpoint = _checkpoint(chain_name, contract)
+    if checkpoint is None:
+        start = getattr(config, 'gm_start_block_dict', {}).get(chain_name)
+        next_block = start if start is not None else _deploy_block(provider, contract, head)
+        chunk = INITIAL_CHUNK
+    else:
+        next_block, chunk = checkpoint[0] + 1, checkpoint[1]
+    if max_blocks is not None:
+        head = min(head, next_block + max_blocks - 1)
+
+    added = 0
+    while next_block <= head:
+        to_block = min(next_block + chunk - 1, head)
+        try:
+            logs = _request(provider, 'eth_getLogs', [{
+                'address': contract,
+                'fromBlock': hex(next_block),
+                'toBlock': hex(to_block),
+                'topics': [LOG_GM_TOPIC],
+            }])
+        except Exception as e:
+            if chunk <= MIN_CHUNK:
+                raise
+            chunk = max(chunk // 2, MIN_CHUNK)
+            print(f'{chain_name}: eth_getLogs {next_block}-{to_block} отклонён ({e}), диапазон -> {chunk}')
+            continue
+        rows = _decode_logs(chain_name, logs)
+        times = _fetch_timestamps(provider, chain_name, sorted({row[1] for row in rows if row[4] in senders}))
+        # Логи, время блоков и контрольная точка - одной транзакцией
+        with conn:
+            conn.executemany('INSERT OR IGNORE INTO gm_logs VALUES (?, ?, ?, ?, ?, ?)', rows)
+            conn.executemany('INSERT OR IGNORE INTO blocks VALUES (?, ?, ?)', times)
+            if len(logs) < MANY_LOGS:
+                chunk = min(chunk * 2, MAX_CHUNK)
+            conn.execute('INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?)',
+                         (chain_name, contract, to_block, chunk, time.time()))
+        added += len(rows)
+        next_block = to_block + 1
+    return added
+
+def index_all(chain_list, max_workers=MAX_CHAIN_WORKERS, senders=None):
+    """Индексирует все сети параллельно: {chain_name: новых логов или текст ошибки}."""
+    senders = senders if senders is not None else tracked_addresses()
+
+    def run(name):
+        try:
+            return index_chain(name, senders)
+        except Exception as e:
+            return f'ошибка: {e}'
+    with ThreadPoolExecutor(max_workers=max(min(max_workers, len(chain_list)), 1),
+                            thread_name_prefix='gm-index') as pool:
+        return dict(zip(chain_list, pool.map(run, chain_list)))
+
+def backfill_timestamps(address):
+    """Дозаполняет время блоков с GM аккаунта, которого не было среди senders при индексации.
+
+    Так бывает с адресом из --address и с аккаунтами, добавленными в пул позже.
+    Возвращает {chain_name: сохранено блоков или текст ошибки}.
+    """
+    rows = _connect().execute(
+        'SELECT l.chain, l.block FROM gm_logs l LEFT JOIN blocks b ON b.chain = l.chain AND b.number = l.block '
+        'WHERE l.sender = ? AND b.number IS NULL ORDER BY l.chain, l.block',
+        [to_checksum_address(address)]).fetchall()
+    missing = {}
+    for chain_name, block in rows:
+        missing.setdefault(chain_name, []).append(block)
+    result = {}
+    for chain_name, blocks in missing.items():
+        try:
+            provider = providers.make_provider(chain_registry.rpc(chain_name), chain_name=chain_name)
+            saved = 0
+            for i in range(0, len(blocks), TIMESTAMP_BATCH):
+                times = _fetch_timestamps(provider, chain_name, blocks[i:i + TIMESTAMP_BATCH])
+                with _connect() as conn:
+                    conn.executemany('INSERT OR IGNORE INTO blocks VALUES (?, ?, ?)', times)
+                saved += len(times)
+            result[chain_name] = saved
+        except Exception as e:
+            result[chain_name] = f'ошибка: {e}'
+    return result
+
+def history(address, chain_name=None):
+    """GM аккаунта из локального индекса: [(chain, block, timestamp | None, tx_hash)]."""
+    query = ('SELECT l.chain, l.block, b.timestamp, l.tx_hash FROM gm_logs l '
+             'LEFT JOIN blocks b ON b.chain = l.chain AND b.number = l.block WHERE l.sender = ?')
+    args = [to_checksum_address(address)]
+    if chain_name is not None:
+        query += ' AND l.chain = ?'
+        args.append(chain_name)
+    return _connect().execute(query + ' ORDER BY l.chain, l.block', args).fetchall()
+
+def streak(days):
+    """Текущая серия подряд идущих дней (UTC) до сегодня или вчера включительно."""
+    if not days:
+        return 0
+    today = datetime.now(timezone.utc).date().toordinal()
+    ordinals = sorted({day.toordinal() for day in days}, reverse=True)
+    if ordinals[0] < today - 1:
+        return 0
+    count = 1
+    for previous, current in zip(ordinals, ordinals[1:]):
+        if previous - current != 1:
+            break
+        count += 1
+    return count
+
+def summary(address, backfill=True):
+    """{chain: {'count', 'last_block', 'last_time', 'streak'}} по локальному индексу.
+
+    backfill - сначала догрузить из сети время блоков, которых для адреса нет.
+    """
+    if backfill:
+        for name, value in backfill_timestamps(address).items():
+            if isinstance(value, str):
+                print(f'{name}: время блоков не получено - {value}')
+    result = {}
+    for chain_name, block, timestamp, _ in history(address):
+        entry = result.setdefault(chain_name, {'count': 0, 'last_block': None, 'last_time': None, 'days': set()})
+        entry['count'] += 1
+        entry['last_block'] = block
+        if timestamp is not None:
+            entry['last_time'] = timestamp
+            entry['days'].add(datetime.fromtimestamp(timestamp, timezone.utc).date())
+    for entry in result.values():
+        entry['streak'] = streak(entry.pop('days'))
+    return result
+
+def print_summary(address, stats):
+    print(f'{address}')
+    print(f"{'chain':<14} {'GM':>6} {'last block':>12} {'last GM (UTC)':<17} {'streak':>6}")
+    for name, entry in sorted(stats.items()):
+        last_time = (datetime.fromtimestamp(entry['last_time'], timezone.utc).strftime('%Y-%m-%d %H:%M')
+                     if entry['last_time'] else '-')
+        print(f"{name:<14} {entry['count']:>6} {entry['last_block']:>12} {last_time:<17} {entry['streak']:>6}")
+    print()
+
+def main(chain_list, address=None):
+    address = address or config.main_addr
+    # Запрошенный адрес может не входить в аккаунты config - время его блоков тоже нужно
+    senders = tracked_addresses() | {to_checksum_address(address)}
+    added = index_all(chain_registry.select(chain_list, 'index'), senders=senders)
+    for name, value in added.items():
+        if value:
+            print(f'{name}: {value if isinstance(value, str) else f"+{value} logGM"}')
+    stats = summary(address)
+    print_summary(address, stats)
+    return stats
+
+if __name__ == "__main__":
+    chain_list = chain_registry.names('index')
+    main(chain_list)
+    print(f'script done\n')
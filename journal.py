@@ -0,0 +1,258 @@
+import os
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+
+from hexbytes import HexBytes
+from web3 import Web3
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+import config
+import preflight
+
+
+# Журнал подписанных транзакций: пишется до отправки, переживает падение процесса
+JOURNAL_PATH = getattr(config, 'JOURNAL_PATH', None) or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '.journal.sqlite3')
+# Незавершённый запуск моложе этого продолжается, а не начинается заново
+RESUME_WINDOW = getattr(config, 'JOURNAL_RESUME_WINDOW', 12 * 3600)
+
+# signed - записана до отправки, sent - принята нодой,
+# confirmed/reverted - есть квитанция, dropped - nonce занят другой транзакцией,
+# replaced - вместо неё отправлена замена с тем же nonce (ещё может попасть в блок сама)
+PENDING = ('signed', 'sent')
+FINAL = ('confirmed', 'reverted', 'dropped')
+REPLACED = 'replaced'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id TEXT PRIMARY KEY,
+    flow TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    finished_at REAL,
+    detached INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS txs (
+    chain TEXT NOT NULL,
+    hash TEXT NOT NULL,
+    run TEXT,
+    flow TEXT NOT NULL,
+    account TEXT NOT NULL,
+    nonce INTEGER NOT NULL,
+    raw BLOB NOT NULL,
+    status TEXT NOT NULL,
+    block INTEGER,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (chain, hash)
+);
+CREATE INDEX IF NOT EXISTS txs_run ON txs (run, flow, chain, status);
+"""
+
+_local = threading.local()
+_lock = threading.Lock()
+# flow -> id текущего запуска
+_runs = {}
+
+
+def _connect():
+    # Соединение sqlite нельзя делить между потоками - по одному на поток
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        conn = sqlite3.connect(JOURNAL_PATH, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        # WAL: запись не блокирует чтение, NORMAL - fsync только на checkpoint
+        # (процесс может упасть без потерь, теряется только при сбое ОС)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.executescript(SCHEMA)
+        # Журнал, созданный до появления runs.detached
+        if 'detached' not in {row['name'] for row in conn.execute('PRAGMA table_info(runs)')}:
+            conn.execute('ALTER TABLE runs ADD COLUMN detached INTEGER NOT NULL DEFAULT 0')
+        _local.conn = conn
+    return conn
+
+def _hash(tx_hash, raw=None):
+    if tx_hash is None:
+        tx_hash = Web3.keccak(raw)
+    return Web3.to_hex(tx_hash) if not isinstance(tx_hash, str) else tx_hash.lower()
+
+def _open_run(conn, flow):
+    row = conn.execute(
+        'SELECT id FROM runs WHERE flow = ? AND finished_at IS NULL AND started_at > ? '
+        'ORDER BY started_at DESC LIMIT 1', (flow, time.time() - RESUME_WINDOW)).fetchone()
+    return row['id'] if row is not None else None
+
+def start_run(flow, detached=False):
+    """Продолжает незавершённый запуск flow или начинает новый, возвращает его id.
+
+    detached - запуск без ожидания квитанций (confirm=False): его закроет
+    reconciler, когда всё подтвердится. Обычный запуск закрывает сам сценарий,
+    а после частичной неудачи оставляет открытым, чтобы продолжить.
+    """
+    conn = _connect()
+    with _lock:
+        run = _open_run(conn, flow)
+        if run is None:
+            run = uuid.uuid4().hex
+            conn.execute('INSERT INTO runs (id, flow, started_at, detached) VALUES (?, ?, ?, ?)',
+                         (run, flow, time.time(), int(detached)))
+        else:
+            # Режим - последнего продолжившего запуск
+            conn.execute('UPDATE runs SET detached = ? WHERE id = ?', (int(detached), run))
+        _runs[flow] = run
+    return run
+
+def resume_run(flow):
+    """Подхватывает незавершённый запуск flow (из другого процесса), новый не создаёт."""
+    conn = _connect()
+    with _lock:
+        run = _open_run(conn, flow)
+        if run is not None:
+            _runs[flow] = run
+    return run
+
+def finish_run(flow):
+    """Закрывает запуск - следующий start_run начнёт работу заново."""
+    run = _runs.pop(flow, None)
+    if run is not None:
+        _connect().execute('UPDATE runs SET finished_at = ? WHERE id = ?', (time.time(), run))
+
+def current_run(flow):
+    return _runs.get(flow)
+
+def detached(flow):
+    """Открыт ли текущий запуск flow без ожидания квитанций."""
+    run = _runs.get(flow)
+    if run is None:
+        return False
+    row = _connect().execute('SELECT detached FROM runs WHERE id = ?', (run,)).fetchone()
+    return bool(row and row['detached'])
+
+def record(chain_name, flow, account, nonce, raw, tx_hash=None):
+    """Записывает подписанную транзакцию до отправки, возвращает её хэш."""
+    tx_hash = _hash(tx_hash, raw)
+    now = time.time()
+    _connect().execute(
+        'INSERT OR REPLACE INTO txs (chain, hash, run, flow, account, nonce, raw, status, created_at, updated_at) '
+        "VALUES (?, ?, ?, ?, ?, ?, ?, 'signed', ?, ?)",
+        (chain_name, tx_hash, _runs.get(flow), flow, account, nonce, bytes(raw), now, now))
+    return tx_hash
+
+def mark(chain_name, tx_hash, status, block=None):
+    _connect().execute('UPDATE txs SET status = ?, block = COALESCE(?, block), updated_at = ? '
+                       'WHERE chain = ? AND hash = ?', (status, block, time.time(), chain_name, _hash(tx_hash)))
+
+def mark_receipt(chain_name, receipt):
+    mark(chain_name, receipt['transactionHash'], 'confirmed' if receipt['status'] == 1 else 'reverted',
+         receipt['blockNumber'])
+    drop_versions(chain_name, receipt['transactionHash'])
+
+def drop_versions(chain_name, tx_hash):
+    """Остальные версии nonce включённой транзакции (замены или исходная) - dropped.
+
+    Иначе проигравшая версия так и числится отправленной: has_pending держит
+    сеть незавершённой, а сверка потом помечает её выпавшей.
+    """
+    tx_hash = _hash(tx_hash)
+    statuses = PENDING + (REPLACED,)
+    _connect().execute(
+        f"UPDATE txs SET status = 'dropped', updated_at = ? WHERE chain = ? AND hash != ? "
+        f"AND status IN ({', '.join('?' * len(statuses))}) "
+        'AND (account, nonce) = (SELECT account, nonce FROM txs WHERE chain = ? AND hash = ?)',
+        (time.time(), chain_name, tx_hash, *statuses, chain_name, tx_hash))
+
+def entries(flow, chain_name=None, statuses=None, run=None):
+    """Записи текущего (или заданного) запуска flow в порядке nonce."""
+    run = run or _runs.get(flow)
+    query = 'SELECT * FROM txs WHERE run IS ? AND flow = ?'
+    args = [run, flow]
+    if chain_name is not None:
+        query += ' AND chain = ?'
+        args.append(chain_name)
+    if statuses:
+        query += f" AND status IN ({', '.join('?' * len(statuses))})"
+        args.extend(statuses)
+    return [dict(row) for row in _connect().execute(query + ' ORDER BY chain, account, nonce', args)]
+
+def completed(flow, run=None):
+    """{chain_name: подтверждённых транзакций} запуска - без обращения к сети."""
+    counts = {}
+    for row in entries(flow, statuses=('confirmed',), run=run):
+        counts[row['chain']] = counts.get(row['chain'], 0) + 1
+    return counts
+
+def has_pending(flow, chain_name, run=None):
+    return bool(entries(flow, chain_name, PENDING, run))
+
+def replaced_count(chain_name, account, nonce):
+    """Сколько раз транзакцию с этим nonce уже заменяли."""
+    return _connect().execute("SELECT COUNT(*) FROM txs WHERE chain = ? AND account = ? AND nonce = ? "
+                              "AND status = 'replaced'", (chain_name, account, nonce)).fetchone()[0]
+
+def _receipts(web3, rows):
+    responses = preflight._execute(web3.provider, [('eth_getTransactionReceipt', [row['hash']]) for row in rows])
+    return [response.get('result') for response in responses]
+
+def reconcile(web3, chain_name, flow):
+    """Сверяет незавершённые записи запуска с сетью.
+
+    nonce аккаунтов и квитанции - батчами, выпавшие из мемпула
+    транзакции переотправляются ещё одним. Возвращает (подтверждённые, в пути):
+    списки записей; в пути - переотправленные, их надо ждать, а не подписывать заново.
+    """
+    if _runs.get(flow) is None:
+        # Вне запуска (start_run) продолжать нечего
+        return [], []
+    # Заменённые тоже проверяем - в блок могла попасть исходная транзакция
+    rows = entries(flow, chain_name, PENDING + (REPLACED,))
+    if not rows:
+        return [], []
+    # Сначала nonce, потом квитанции: транзакция, включённая между запросами,
+    # иначе выглядела бы как занявшая nonce без квитанции - то есть выпавшая
+    accounts = sorted({row['account'] for row in rows})
+    responses = preflight._execute(web3.provider, [('eth_getTransactionCount', [account, 'latest'])
+                                                   for account in accounts])
+    chain_nonces = {}
+    for account, response in zip(accounts, responses):
+        if response.get('result') is None:
+            raise ValueError(f"сверка журнала: нет nonce {account}: {response.get('error')}")
+        chain_nonces[account] = preflight._to_int(response['result'])
+    receipts = _receipts(web3, rows)
+    # nonce занят, а квитанции нет - переспрашиваем: публичный RPC за балансировщиком
+    # мог ответить квитанциями с отстающей ноды
+    recheck = [i for i, row in enumerate(rows)
+               if not receipts[i] and row['nonce'] < chain_nonces[row['account']]]
+    for i, receipt in zip(recheck, _receipts(web3, [rows[i] for i in recheck]) if recheck else []):
+        receipts[i] = receipt
+
+    confirmed, resend = [], []
+    for row, receipt in zip(rows, receipts):
+        if receipt:
+            row['status'] = 'confirmed' if preflight._to_int(receipt['status']) == 1 else 'reverted'
+            row['block'] = preflight._to_int(receipt['blockNumber'])
+            mark(chain_name, row['hash'], row['status'], row['block'])
+            drop_versions(chain_name, row['hash'])
+            confirmed.append(row)
+        elif row['nonce'] < chain_nonces[row['account']]:
+            # nonce уже использован другой транзакцией (замена) - эта не пройдёт
+            mark(chain_name, row['hash'], 'dropped')
+        elif row['status'] != REPLACED:
+            resend.append(row)
+
+    pending = []
+    responses = preflight._execute(web3.provider, [('eth_sendRawTransaction', [HexBytes(row['raw']).to_0x_hex()])
+                                                   for row in resend]) if resend else []
+    for row, response in zip(resend, responses):
+        error = str(response.get('error') or '').lower()
+        # Нода уже знает транзакцию - она в пути
+        if response.get('error') is None or 'already known' in error or 'known transaction' in error:
+            mark(chain_name, row['hash'], 'sent')
+            row['status'] = 'sent'
+            pending.append(row)
+        else:
+            print(f"сверка журнала: {chain_name} nonce {row['nonce']} не переотправлена: {response.get('error')}")
+    return confirmed, pending
@@ -0,0 +1,174 @@
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+import config
+
+
+# Куда писать: JSONL с событиями и (опционально) файл для Prometheus textfile collector.
+# Без путей в config метрики только копятся в памяти - это почти бесплатно.
+METRICS_LOG = getattr(config, 'METRICS_LOG', None)
+METRICS_PROM = getattr(config, 'METRICS_PROM', None)
+# Границы гистограмм задержки, секунд
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_lock = threading.Lock()
+_write_lock = threading.Lock()
+# (имя метрики, метки) -> [счётчики бакетов..., сумма, количество]
+_histograms = {}
+# (имя метрики, метки) -> число
+_counters = {}
+
+
+def _labels(**labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items() if value is not None))
+
+def observe(name, seconds, **labels):
+    """Добавляет замер длительности в гистограмму."""
+    key = (name, _labels(**labels))
+    with _lock:
+        row = _histograms.get(key)
+        if row is None:
+            row = _histograms[key] = [0] * len(BUCKETS) + [0.0, 0]
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                row[i] += 1
+        row[-2] += seconds
+        row[-1] += 1
+
+def inc(name, value=1, **labels):
+    key = (name, _labels(**labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+def event(kind, **fields):
+    """Пишет одну строку в JSONL-лог (если он задан)."""
+    if not METRICS_LOG:
+        return
+    line = json.dumps({'ts': round(time.time(), 3), 'event': kind, **fields}, default=str)
+    with _write_lock:
+        with open(METRICS_LOG, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+
+@contextmanager
+def rpc_timer(chain_name, method):
+    """Замер одного RPC-вызова; ошибка - исключение или поле error в ответе."""
+    start = time.perf_counter()
+    status = {'ok': True}
+    try:
+        yield status
+    except Exception:
+        status['ok'] = False
+        raise
+    finally:
+        observe('rpc_request_seconds', time.perf_counter() - start, chain=chain_name, method=method)
+        if not status['ok']:
+            inc('rpc_errors_total', chain=chain_name, method=method)
+
+@contextmanager
+def phase(chain_name, name, flow=None):
+    """Замер этапа отправки: connect, preflight, fee, sign, broadcast, confirm..."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe('phase_seconds', time.perf_counter() - start, chain=chain_name, phase=name, flow=flow)
+
+def record_retry(host):
+    inc('rpc_retries_total', host=host)
+
+def record_tx(chain_name, flow, tx_hash, receipt, gas_estimate=None, tx=None, fee_cap=None):
+    """Итог транзакции: газ оценённый/использованный и оплаченная комиссия против потолка."""
+    status = 'ok' if receipt is not None and receipt['status'] == 1 else ('reverted' if receipt is not None else 'lost')
+    inc('tx_total', chain=chain_name, flow=flow, status=status)
+    fields = {'chain': chain_name, 'flow': flow, 'tx_hash': _hex(tx_hash), 'status': status,
+              'gas_estimate': gas_estimate}
+    if tx is not None:
+        # tx - собранная транзакция: лимит газа и максимальная цена за газ
+        fields['gas_limit'] = tx.get('gas')
+        fields['max_price'] = tx.get('maxFeePerGas', tx.get('gasPrice'))
+    if fee_cap is not None:
+        fields['fee_cap'] = fee_cap
+    if receipt is not None:
+        gas_used = receipt['gasUsed']
+        price = receipt.get('effectiveGasPrice')
+        fields.update(block=receipt['blockNumber'], gas_used=gas_used, effective_gas_price=price)
+        inc('tx_gas_used_total', gas_used, chain=chain_name, flow=flow)
+        if gas_estimate:
+            fields['gas_used_ratio'] = round(gas_used / gas_estimate, 4)
+            inc('tx_gas_estimated_total', gas_estimate, chain=chain_name, flow=flow)
+        if price is not None:
+            fields['fee_paid'] = gas_used * price
+            inc('tx_fee_paid_wei_total', gas_used * price, chain=chain_name, flow=flow)
+            if fee_cap:
+                fields['price_to_cap'] = round(price / fee_cap, 4)
+    event('tx', **fields)
+
+def _hex(value):
+    if value is None or isinstance(value, str):
+        return value
+    value = bytes(value).hex()
+    return value if value.startswith('0x') else '0x' + value
+
+def snapshot():
+    """Текущие агрегаты: {'histograms': {...}, 'counters': {...}}."""
+    with _lock:
+        histograms = {key: list(row) for key, row in _histograms.items()}
+        counters = dict(_counters)
+    return {'histograms': histograms, 'counters': counters}
+
+def reset():
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+
+def _prom_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in pairs) + '}'
+
+def prometheus_text():
+    """Агрегаты в текстовом формате Prometheus."""
+    data = snapshot()
+    lines = []
+    seen = set()
+    for (name, labels), row in sorted(data['histograms'].items()):
+        metric = f'onchaingm_{name}'
+        if metric not in seen:
+            seen.add(metric)
+            lines.append(f'# TYPE {metric} histogram')
+        for bound, count in zip(BUCKETS, row):
+            lines.append(f'{metric}_bucket{_prom_labels(labels, [("le", bound)])} {count}')
+        lines.append(f'{metric}_bucket{_prom_labels(labels, [("le", "+Inf")])} {row[-1]}')
+        lines.append(f'{metric}_sum{_prom_labels(labels)} {row[-2]:.6f}')
+        lines.append(f'{metric}_count{_prom_labels(labels)} {row[-1]}')
+    for (name, labels), value in sorted(data['counters'].items()):
+        metric = f'onchaingm_{name}'
+        if metric not in seen:
+            seen.add(metric)
+            lines.append(f'# TYPE {metric} counter')
+        lines.append(f'{metric}{_prom_labels(labels)} {value}')
+    return '\n'.join(lines) + '\n'
+
+def flush():
+    """Сводка по RPC в JSONL и файл Prometheus; вызывается при выходе."""
+    if METRICS_LOG:
+        for (name, labels), row in sorted(snapshot()['histograms'].items()):
+            if row[-1]:
+                event('summary', metric=name, **dict(labels), count=row[-1],
+                      mean=round(row[-2] / row[-1], 6), total=round(row[-2], 6))
+    if METRICS_PROM:
+        tmp_path = f'{METRICS_PROM}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(prometheus_text())
+        # Коллектор не должен увидеть файл наполовину записанным
+        os.replace(tmp_path, METRICS_PROM)
+
+atexit.register(flush)
@@ -0,0 +1,155 @@
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+import config
+import chain_registry
+import deployments
+import fee_oracle
+import metrics
+
+
+# Канонический Multicall3: если он уже есть в сети, разворачивать свой не нужно
+CANONICAL_ADDRESS = '0xcA11bde05977b3631167028862bE2a173976CA11'
+BATCH_SIZE = 10           # вызовов в одной транзакции по умолчанию
+
+# Подмножество Multicall3: aggregate3 и aggregate3Value с теми же сигнатурами
+MULTICALL_SOURCE = """
+// SPDX-License-Identifier: MIT
+pragma solidity ^0.8.0;
+
+contract Multicall3 {
+    struct Call3 {
+        address target;
+        bool allowFailure;
+        bytes callData;
+    }
+
+    struct Call3Value {
+        address target;
+        bool allowFailure;
+        uint256 value;
+        bytes callData;
+    }
+
+    struct Result {
+        bool success;
+        bytes returnData;
+    }
+
+    function aggregate3(Call3[] calldata calls) public payable returns (Result[] memory returnData) {
+        uint256 length = calls.length;
+        returnData = new Result[](length);
+        for (uint256 i = 0; i < length; i++) {
+            Result memory result = returnData[i];
+            (result.success, result.returnData) = calls[i].target.call(calls[i].callData);
+            require(calls[i].allowFailure || result.success, "Multicall3: call failed");
+        }
+    }
+
+    function aggregate3Value(Call3Value[] calldata calls) public payable returns (Result[] memory returnData) {
+        uint256 valAccumulator;
+        uint256 length = calls.length;
+        returnData = new Result[](length);
+        for (uint256 i = 0; i < length; i++) {
+            Result memory result = returnData[i];
+            Call3Value calldata calli = calls[i];
+            uint256 val = calli.value;
+            unchecked { valAccumulator += val; }
+            (result.success, result.returnData) = calli.target.call{value: val}(calli.callData);
+            require(calli.allowFailure || result.success, "Multicall3: call failed");
+        }
+        require(msg.value == valAccumulator, "Multicall3: value mismatch");
+    }
+}
+"""
+
+_RESULT = {'components': [{'name': 'success', 'type': 'bool'},
+                          {'name': 'returnData', 'type': 'bytes'}],
+           'name': 'returnData', 'type': 'tuple[]'}
+MULTICALL_ABI = [
+    {
+        'name': 'aggregate3', 'type': 'function', 'stateMutability': 'payable',
+        'inputs': [{'components': [{'name': 'target', 'type': 'address'},
+                                   {'name': 'allowFailure', 'type': 'bool'},
+                                   {'name': 'callData', 'type': 'bytes'}],
+                    'name': 'calls', 'type': 'tuple[]'}],
+        'outputs': [_RESULT],
+    },
+    {
+        'name': 'aggregate3Value', 'type': 'function', 'stateMutability': 'payable',
+        'inputs': [{'components': [{'name': 'target', 'type': 'address'},
+                                   {'name': 'allowFailure', 'type': 'bool'},
+                                   {'name': 'value', 'type': 'uint256'},
+                                   {'name': 'callData', 'type': 'bytes'}],
+                    'name': 'calls', 'type': 'tuple[]'}],
+        'outputs': [_RESULT],
+    },
+]
+
+
+def get_address(web3, chain_name):
+    """Адрес агрегатора в сети: config.multicall_address_dict или реестр, свой развёрнутый или канонический."""
+    address = chain_registry.multicall(chain_name)
+    if address:
+        return address
+    address = deployments.get('multicall', chain_name)
+    if address:
+        return address
+    if web3.eth.get_code(CANONICAL_ADDRESS):
+        return CANONICAL_ADDRESS
+    return None
+
+def deploy(chain_name):
+    """Разворачивает агрегатор тем же путём, что и токен (create_token_class)."""
+    import create_token_class
+    try:
+        handler = create_token_class.NetworkHandler(chain_name)
+    except Exception as e:
+        print(f'{e}')
+        return None
+    try:
+        _, contract_data = create_token_class.compile_contract(MULTICALL_SOURCE)
+    except SystemExit:
+        # compile_contract завершает процесс при ошибке solc - здесь это не повод
+        return None
+    receipt = create_token_class.deploy_contract(handler, contract_data, flow='multicall_deploy')
+    if receipt is None or receipt.status != 1:
+        return None
+    deployments.save('multicall', chain_name, receipt.contractAddress)
+    return receipt.contractAddress
+
+def ensure(web3, chain_name):
+    """Адрес агрегатора, при отсутствии - разворачивает его."""
+    return get_address(web3, chain_name) or deploy(chain_name)
+
+def get_contract(web3, address):
+    return web3.eth.contract(address=address, abi=MULTICALL_ABI)
+
+def encode_batch(web3, address, calls):
+    """calls - [(target, value, data)]; возвращает поля транзакции агрегатора."""
+    aggregator = get_contract(web3, address)
+    payload = [(target, False, value, data) for target, value, data in calls]
+    return {
+        'to': aggregator.address,
+        'value': sum(value for _, value, _ in calls),
+        'data': aggregator.encode_abi('aggregate3Value', args=[payload]),
+    }
+
+def build_tx(web3, chain_name, batch, account_address, snapshot, urgency='normal', eip1559=None):
+    """Транзакция агрегатора по pre-flight снимку (газ оценён на весь батч)."""
+    if snapshot.gas_estimate is None:
+        raise ValueError(f"ошибка оценки газа: {snapshot.errors.get('gas_estimate')}")
+    gas_limit = snapshot.gas_limit or int(snapshot.gas_estimate * 1.1)  # 10% запас без gas_cache
+    with metrics.phase(chain_name, 'fee', 'multicall'):
+        fees = fee_oracle.quote(web3, chain_name, urgency, snapshot, eip1559=eip1559)
+    print(fees)
+    return {
+        'from': account_address,
+        'nonce': snapshot.nonce,
+        'gas': gas_limit,
+        'chainId': snapshot.chain_id,
+        **batch,
+        **fees.tx_fields(),
+    }
@@ -0,0 +1,167 @@
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+
+from web3.exceptions import TransactionNotFound
+
+import journal
+
+
+class NonceAllocator:
+    """Локальная раздача nonce для пачки транзакций одного аккаунта."""
+
+    def __init__(self, web3, account_address, start_nonce=None, chain_name=None, flow=None):
+        self.web3 = web3
+        self.account_address = account_address
+        # С flow каждая транзакция пишется в journal до отправки
+        self.chain_name = chain_name
+        self.flow = flow
+        self._lock = threading.Lock()
+        # start_nonce - уже известный pending nonce (например, из pre-flight)
+        self._next_nonce = start_nonce
+        # nonce -> {'raw': bytes, 'hash': HexBytes | None, 'sent_at': monotonic | None}
+        self.in_flight = {}
+
+    def sync(self):
+        """Подтягивает nonce из сети (учитывая pending), не откатываясь назад."""
+        chain_nonce = self.web3.eth.get_transaction_count(self.account_address, 'pending')
+        with self._lock:
+            if self._next_nonce is None or chain_nonce > self._next_nonce:
+                self._next_nonce = chain_nonce
+            return self._next_nonce
+
+    def peek(self):
+        if self._next_nonce is None:
+            return self.sync()
+        return self._next_nonce
+
+    def allocate(self):
+        """Выдаёт следующий nonce без запроса к сети."""
+        if self._next_nonce is None:
+            self.sync()
+        with self._lock:
+            nonce = self._next_nonce
+            self._next_nonce += 1
+            return nonce
+
+    def allocate_range(self, count):
+        """Резервирует count nonce подряд, возвращает первый."""
+        if self._next_nonce is None:
+            self.sync()
+        with self._lock:
+            nonce = self._next_nonce
+            self._next_nonce += count
+            return nonce
+
+    def track(self, nonce, raw_transaction, tx_hash=None):
+        if self.flow is not None:
+            journal.record(self.chain_name, self.flow, self.account_address, nonce, raw_transaction, tx_hash)
+        self.in_flight[nonce] = {'raw': raw_transaction, 'hash': tx_hash, 'sent_at': None}
+
+    def resume(self, entries):
+        """Берёт в ожидание транзакции прошлого запуска из journal.reconcile."""
+        for entry in entries:
+            self.in_flight[entry['nonce']] = {'raw': entry['raw'], 'hash': entry['hash'],
+                                              'sent_at': time.monotonic()}
+
+    def done(self, nonce):
+        self.in_flight.pop(nonce, None)
+
+    def broadcast(self, nonce):
+        """Отправляет подписанную транзакцию по nonce, возвращает хэш или None."""
+        entry = self.in_flight[nonce]
+        try:
+            entry['hash'] = self.web3.eth.send_raw_transaction(entry['raw'])
+        except Exception as e:
+            message = str(e).lower()
+            # Нода уже знает эту транзакцию - это не ошибка
+            if 'already known' in message or 'known transaction' in message:
+                entry['hash'] = self.web3.keccak(entry['raw'])
+            else:
+                print(f'ошибка отправки nonce {nonce}:\n{e}')
+                return None
+        if entry['sent_at'] is None:
+            entry['sent_at'] = time.monotonic()
+        if self.flow is not None:
+            journal.mark(self.chain_name, entry['hash'], 'sent')
+        return entry['hash']
+
+    def find_gaps(self):
+        """Возвращает nonce, которые не подтверждены и которых нет в мемпуле ноды."""
+        confirmed = self.web3.eth.get_transaction_count(self.account_address, 'latest')
+        gaps = []
+        for nonce in sorted(self.in_flight):
+            if nonce < confirmed:
+                continue
+            entry = self.in_flight[nonce]
+            if entry['hash'] is None:
+                gaps.append(nonce)
+                continue
+            try:
+                self.web3.eth.get_transaction(entry['hash'])
+            except TransactionNotFound:
+                gaps.append(nonce)
+        return gaps
+
+    def resubmit_gaps(self):
+        """Переотправляет выпавшие транзакции, чтобы следующие nonce не застряли."""
+        gaps = self.find_gaps()
+        for nonce in gaps:
+            print(f'nonce {nonce} выпал из мемпула, переотправляем')
+            self.broadcast(nonce)
+        return gaps
+
+    def replace_stuck(self, replacer):
+        """Заменяет транзакции, которые висят в мемпуле дольше срока сети (replacement.Replacer)."""
+        replaced = []
+        for nonce, entry in sorted(self.in_flight.items()):
+            if entry['hash'] is None or entry['sent_at'] is None or not replacer.stuck(nonce, entry['sent_at']):
+                continue
+            result = replacer.replace(nonce, entry['raw'], entry['hash'])
+            entry['sent_at'] = time.monotonic()
+            if result is not None:
+                entry['raw'], entry['hash'] = result
+                replaced.append(nonce)
+        return replaced
+
+    def wait_all(self, tracker, timeout=180, resubmit_after=10, from_block=None, replacer=None):
+        """Собирает квитанции всех отправленных транзакций через общий трекер блоков.
+
+        С replacer застрявшие транзакции заменяются с поднятыми комиссиями;
+        квитанция засчитывается по любой версии транзакции с этим nonce.
+        """
+        receipts = {}
+        # Future -> nonce; после замены у nonce несколько ожидающих хэшей
+        futures = {}
+        # хэш -> его Future в трекере
+        watched = {}
+        deadline = time.monotonic() + timeout
+        while self.in_flight and time.monotonic() < deadline:
+            for nonce, entry in self.in_flight.items():
+                if entry['hash'] is not None and entry['hash'] not in watched:
+                    watched[entry['hash']] = tracker.watch(entry['hash'], from_block)
+                    futures[watched[entry['hash']]] = nonce
+            waiting = {future: nonce for future, nonce in futures.items() if nonce in self.in_flight}
+            wait_for = max(min(resubmit_after, deadline - time.monotonic()), 0)
+            if replacer is not None:
+                wait_for = min(wait_for, replacer.deadline)
+            done, _ = wait(waiting, timeout=wait_for, return_when=FIRST_COMPLETED)
+            if replacer is not None:
+                self.replace_stuck(replacer)
+            if not done:
+                # Давно нет прогресса - ищем дыры в последовательности nonce
+                self.resubmit_gaps()
+                continue
+            for future in done:
+                nonce = waiting[future]
+                if nonce not in self.in_flight:
+                    continue
+                receipts[nonce] = future.result()
+                if self.flow is not None:
+                    journal.mark_receipt(self.chain_name, receipts[nonce])
+                self.done(nonce)
+        # Заменённые версии и не дождавшиеся к дедлайну хэши трекеру больше не нужны
+        for tx_hash, future in watched.items():
+            if not future.done():
+                tracker.unwatch(tx_hash)
+        return receipts
@@ -1,42 +1,48 @@
 from web3 import Web3
+from web3.middleware import ExtraDataToPOAMiddleware
+from concurrent.futures import ThreadPoolExecutor, wait
 import os, sys
+import time
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
 
 import config
+import chain_profile
+import chain_registry
+import providers
+import fee_oracle
+import receipt_tracker
+import metrics
+import multicall
+import journal
+import readiness
+import gas_cache
+import reconciler
+import replacement
 
 
 def get_contract_address_onchaingm(chain_name):
-    contract_addresses_dict = {
-        "eth_sepolia":  "0x905415eb04E331d9edA60c67fcAa36e019Ab3C96",
-        'base_sepolia': '0xd932af3476A503ff3B07FDFf1A9B9e3febd29f29',
-        "monad":        "0xe48DF32fe1D7d4b73d1Af33A2edd65495945fDcD",
-        "mega":         "0x28D63f2386fC39D0B89608Fd25F51B31055B7892",
-        'somnia':       '0x7B2865d1387b1a5ce2D2465cfF8c6C3058a66De4',
-        "rise":         "0x779F6E324f16604B0F31B2D12a0C2EEeBB7f83F8",
-        "moca":         "0x69ff78Ec3A743D040f6D1434737aeb1F67db3eA6",
-        "kite":         "0x8Ce0D61503a90CC6dd6ae8F1AAf7FA6e2B32d30f", #poa
-        'incentiv':     '0x139c68fC3ffA5685D43d72b5Da5755241b0D0137', #poa
-        'camp':         '0x13B01762426C4386D24C0e211fC67b0fc71dcfEE',
-        'pharos':       '0x55F8D7108867f71827bEF25B261822dd4df5d9C5',
-        '0g':           '0xcdfE091654eb9Bea9406052E9c1Ffe715c6030be',
-        'sahara':       '0x7345847282E87fa3Ae842CBdAD4D1b7fAc17B24C', #poa
-        'nexus':        '0x0492225322A80f531bd746110b8138d8361B9Fc5',
-        'seismic':      '0xe19F5585061452c29f5E187DF93e12eB0794686f',
-        'irys':         '',
-    }
-    return contract_addresses_dict.get(chain_name)
+    # Адреса контрактов - в реестре сетей (chains.toml)
+    return chain_registry.gm_contract(chain_name)
 
 def get_chain_rpc(chain_name):
-    return config.rpc_name_dict.get(chain_name)
+    return chain_registry.rpc(chain_name)
 
-def getWeb3(chain_name):
+def getWeb3(chain_name, timeout=None):
+    # timeout - потолок одного RPC-запроса (не больше config.RPC_TIMEOUT)
     rpc_url = get_chain_rpc(chain_name)
-    web3 = Web3(Web3.HTTPProvider(rpc_url))
-    # Проверяем подключение
-    if not web3.is_connected():
+    web3 = providers.make_web3(rpc_url, min(timeout or providers.RPC_TIMEOUT, providers.RPC_TIMEOUT),
+                               chain_name=chain_name)
+    # Статические свойства сети берём из кэша профилей,
+    # доступность RPC отдельно не проверяем - это сделает pre-flight батч
+    try:
+        with metrics.phase(chain_name, 'connect', 'gm'):
+            profile = chain_profile.get_profile(web3, chain_name)
+    except Exception:
         print(f'failed to connect to the {chain_name}\n')
         return
+    if profile['is_poa']:
+        web3.middleware_onion.inject(ExtraDataToPOAMiddleware, layer=0)
     return web3
 
 def get_balance(web3, account_address):
@@ -45,12 +51,8 @@ def get_balance(web3, account_address):
     # Конвертируем в ETH
     return web3.from_wei(balance_wei, 'ether')
 
-def get_tx(web3, chain_name, account_address, native_token, chain_id):
-    # Адрес контракта
-    contract_address = get_contract_address_onchaingm(chain_name)
-    
-    # ABI контракта
-    abi = [{
+# ABI контракта
+GM_ABI = [{
     "anonymous": False,
     "inputs": [
         {
@@ -81,96 +83,299 @@ def get_tx(web3, chain_name, account_address, native_token, chain_id):
     "stateMutability": "nonpayable",
     "type": "function"
     }]
-    contract = web3.eth.contract(address=contract_address, abi=abi)
-    greeting = f"GM"
+GREETING = "GM"
+
+def get_gm_contract(web3, chain_name):
+    # Адрес контракта
+    contract_address = get_contract_address_onchaingm(chain_name)
+    return web3.eth.contract(address=contract_address, abi=GM_ABI)
+
+def get_tx(web3, chain_name, contract, account_address, native_token, snapshot):
+    # Газ и комиссии уже получены одним батчем в pre-flight
+    if snapshot.gas_estimate is None:
+        print(f"Ошибка оценки газа: {snapshot.errors.get('gas_estimate')}")
+        return
+    gas_estimate = snapshot.gas_estimate
+    gas_limit = snapshot.gas_limit  # запас выучен по прошлым квитанциям (gas_cache), сначала 10%
+    print(f"Оценка газа: {gas_estimate}, Лимит газа: {gas_limit}")
+
+    # Комиссии по перцентилям eth_feeHistory (история уже пришла в pre-flight)
     try:
-        gas_estimate = contract.functions.sendGM(greeting).estimate_gas({'from': account_address})
-        gas_limit = gas_estimate + int(gas_estimate * 0.1)  # 10% запас
-        print(f"Оценка газа: {gas_estimate}, Лимит газа: {gas_limit}")
-    except Exception as e:
-        print(f"Ошибка оценки газа: {e}")
+        with metrics.phase(chain_name, 'fee', 'gm'):
+            fees = fee_oracle.quote(web3, chain_name, 'normal', snapshot)
+    except fee_oracle.FeeTooHigh as e:
+        print(f"Комиссия слишком высокая, транзакция не отправлена: {e}")
         return
+    print(fees)
+
+    # Рассчитываем стоимость
+    estimated_cost_wei = gas_limit * fees.max_price()
+    estimated_cost_eth = web3.from_wei(estimated_cost_wei, 'ether')
+    print(f"Оценочная стоимость транзакции: {estimated_cost_eth} {native_token}")
+
+    # Строим транзакцию
+    tx_param = {
+        'from': account_address,
+        'nonce': snapshot.nonce,
+        'gas': gas_limit,
+        'chainId': snapshot.chain_id,
+        **fees.tx_fields(),
+    }
+    return contract.functions.sendGM(GREETING).build_transaction(tx_param)
 
-    # Определяем параметры газа (EIP-1559)
+# Параметры параллельного запуска
+MAX_WORKERS = chain_registry.limit('max_workers', chain_registry.DEFAULT_MAX_WORKERS)  # сетей одновременно
+CHAIN_TIMEOUT = 180   # секунд на одну сеть (включая ожидание подтверждения)
+
+def resume(web3, chain_name, flow, result):
+    """Сверяет транзакцию прерванного запуска с сетью.
+
+    Возвращает запись журнала транзакции, которую надо дождаться, или None.
+    Если она уже подтверждена - заполняет result и ставит result['block'].
+    """
+    confirmed, resumed = journal.reconcile(web3, chain_name, flow)
+    if confirmed:
+        row = confirmed[-1]
+        result['tx_hash'], result['block'] = row['hash'], row['block']
+        if row['status'] != 'confirmed':
+            result['error'] = 'reverted'
+        print(f"{chain_name}: транзакция из журнала подтверждена в блоке {row['block']}\n")
+        return None
+    if resumed:
+        result['tx_hash'] = resumed[-1]['hash']
+        print(f"{chain_name}: ждём транзакцию из журнала {result['tx_hash']}")
+        return resumed[-1]
+    return None
+
+def sendGM(chain_name, timeout=CHAIN_TIMEOUT, confirm=True, flow='gm'):
+    # Результат для сводной таблицы
+    # confirm=False - вернуться сразу после отправки, квитанцию сверит reconciler
+    # flow - поток журнала (у планировщика свой, чтобы не делить запуск с CLI)
+    result = {'chain': chain_name, 'tx_hash': None, 'block': None, 'latency': None, 'error': None}
+    start = time.monotonic()
     try:
-        max_priority_fee = web3.eth.max_priority_fee  # Рекомендуемая приоритетная комиссия
-    except ValueError:
-        max_priority_fee = web3.to_wei('2', 'gwei')  # Запасное значение
+        web3 = getWeb3(chain_name, timeout)
+        if not web3:
+            result['error'] = 'failed to connect'
+            return result
+        private_key = config.PRIVATE_KEY_MAIN
+        if not private_key:
+            print("Приватный ключ не найден")
+            result['error'] = 'no private key'
+            return result
+        account_address = config.main_addr
+        # Преобразуем в checksum-формат
+        account_address = Web3.to_checksum_address(account_address)
+        profile = chain_profile.get_profile(web3, chain_name)
+        native_token = profile['native_token']
+        contract = get_gm_contract(web3, chain_name)
+        # Прерванный запуск: подтверждённое не повторяем, отправленное - ждём
+        snapshot, tx = None, None
+        resumed = resume(web3, chain_name, flow, result)
+        if result['block'] is not None:
+            return result
+        if resumed is not None:
+            tx_hash, raw, nonce = resumed['hash'], resumed['raw'], resumed['nonce']
+        else:
+            # chainId, баланс, nonce, комиссии - одним батч-запросом, оценка газа - из кэша
+            estimate_tx = {
+                'from': account_address,
+                'to': contract.address,
+                'data': contract.encode_abi('sendGM', args=[GREETING]),
+            }
+            with metrics.phase(chain_name, 'preflight', 'gm'):
+                snapshot = gas_cache.fetch(web3, chain_name, account_address, estimate_tx)
+            print(f"Подключено к {chain_name} ID: {snapshot.chain_id}")
+            print(f"Баланс: {web3.from_wei(snapshot.balance, 'ether')} {native_token}")
+            with metrics.phase(chain_name, 'build', 'gm'):
+                tx = get_tx(web3, chain_name, contract, account_address, native_token, snapshot)
+            if not tx:
+                result['error'] = 'tx not built'
+                return result
+            # Подписываем, пишем в журнал и только потом отправляем
+            with metrics.phase(chain_name, 'sign', 'gm'):
+                signed_tx = web3.eth.account.sign_transaction(tx, private_key)
+            journal.record(chain_name, flow, account_address, tx['nonce'], signed_tx.raw_transaction, signed_tx.hash)
+            with metrics.phase(chain_name, 'broadcast', 'gm'):
+                tx_hash = web3.eth.send_raw_transaction(signed_tx.raw_transaction)
+            journal.mark(chain_name, tx_hash, 'sent')
+            raw, nonce = signed_tx.raw_transaction, tx['nonce']
+            result['tx_hash'] = tx_hash.hex()
+            print(f"Транзакция отправлена: {tx_hash.hex()}")
+        if not confirm:
+            return result
+
+        # Ждём подтверждения, но не дольше таймаута сети
+        remaining = max(timeout - (time.monotonic() - start), 1)
+        tracker = receipt_tracker.get_tracker(web3, chain_name)
+        # Застрявшую дольше срока сети транзакцию заменяем с поднятыми комиссиями
+        replacer = replacement.Replacer(web3, chain_name, private_key, account_address, flow)
+        with metrics.phase(chain_name, 'confirm', 'gm'):
+            receipt = replacer.wait(tracker, tx_hash, raw, nonce, timeout=remaining,
+                                    from_block=snapshot.block_number if snapshot else None)
+        journal.mark_receipt(chain_name, receipt)
+        if tx:
+            gas_cache.learn(chain_name, estimate_tx, receipt, tx['gas'])
+        # После замены в блок попадает другой хэш
+        result['tx_hash'] = Web3.to_hex(receipt.transactionHash)
+        metrics.record_tx(chain_name, 'gm', receipt.transactionHash, receipt, snapshot.gas_estimate if snapshot else None, tx,
+                          fee_oracle.fee_cap(chain_name))
+        result['block'] = receipt.blockNumber
+        if receipt.status != 1:
+            result['error'] = 'reverted'
+        print(f"Транзакция подтверждена в блоке: {receipt.blockNumber}\n")
+    except Exception as e:
+        print(f'ошибка в {chain_name}:\n{e}')
+        result['error'] = str(e) or type(e).__name__
+    finally:
+        result['latency'] = round(time.monotonic() - start, 2)
+        metrics.observe('flow_seconds', result['latency'], chain=chain_name, flow='gm',
+                        status='ok' if not result['error'] else 'error')
+        metrics.event('flow', flow='gm', **result)
+    return result
+
+def sendGM_batch(chain_name, batch_size=multicall.BATCH_SIZE, timeout=CHAIN_TIMEOUT, confirm=True):
+    """batch_size вызовов sendGM одной транзакцией через Multicall3.
+
+    logGM при этом фиксирует sender = адрес агрегатора, а не аккаунта.
+    """
+    result = {'chain': chain_name, 'tx_hash': None, 'block': None, 'latency': None, 'error': None}
+    start = time.monotonic()
     try:
-        base_fee = web3.eth.get_block('latest')['baseFeePerGas']
-        max_fee_per_gas = base_fee + max_priority_fee
-        max_fee_limit = web3.to_wei('200', 'gwei')
-        print(f"Базовая комиссия: {web3.from_wei(base_fee, 'gwei')} gwei")
-        print(f"Приоритетная комиссия: {web3.from_wei(max_priority_fee, 'gwei')} gwei")
-        print(f"Максимальная комиссия: {web3.from_wei(max_fee_per_gas, 'gwei')} gwei")
-
-        if max_fee_per_gas > max_fee_limit:
-            print("Комиссия слишком высокая, транзакция не отправлена")
-            exit()
-
-        # Рассчитываем стоимость
-        estimated_cost_wei = gas_limit * max_fee_per_gas
-        estimated_cost_eth = web3.from_wei(estimated_cost_wei, 'ether')
-        print(f"Оценочная стоимость транзакции: {estimated_cost_eth} {native_token}")
-
-        # Строим транзакцию
-        tx_param = {
-            'from': account_address,
-            'nonce': web3.eth.get_transaction_count(account_address),
-            'gas': gas_limit,
-            'maxPriorityFeePerGas': max_priority_fee,
-            'maxFeePerGas': max_fee_per_gas,
-            'chainId': chain_id
-        }
+        web3 = getWeb3(chain_name, timeout)
+        if not web3:
+            result['error'] = 'failed to connect'
+            return result
+        private_key = config.PRIVATE_KEY_MAIN
+        if not private_key:
+            print("Приватный ключ не найден")
+            result['error'] = 'no private key'
+            return result
+        account_address = Web3.to_checksum_address(config.main_addr)
+        aggregator = multicall.ensure(web3, chain_name)
+        if not aggregator:
+            result['error'] = 'no multicall'
+            return result
+        contract = get_gm_contract(web3, chain_name)
+        snapshot, tx = None, None
+        resumed = resume(web3, chain_name, 'gm_batch', result)
+        if result['block'] is not None:
+            return result
+        if resumed is not None:
+            tx_hash, raw, nonce = resumed['hash'], resumed['raw'], resumed['nonce']
+        else:
+            data = contract.encode_abi('sendGM', args=[GREETING])
+            batch = multicall.encode_batch(web3, aggregator, [(contract.address, 0, data)] * batch_size)
+            # Газ оцениваем сразу на весь батч
+            estimate_tx = dict(batch, **{'from': account_address})
+            with metrics.phase(chain_name, 'preflight', 'gm_batch'):
+                snapshot = gas_cache.fetch(web3, chain_name, account_address, estimate_tx)
+            tx = multicall.build_tx(web3, chain_name, batch, account_address, snapshot)
+            with metrics.phase(chain_name, 'sign', 'gm_batch'):
+                signed_tx = web3.eth.account.sign_transaction(tx, private_key)
+            journal.record(chain_name, 'gm_batch', account_address, tx['nonce'], signed_tx.raw_transaction,
+                           signed_tx.hash)
+            with metrics.phase(chain_name, 'broadcast', 'gm_batch'):
+                tx_hash = web3.eth.send_raw_transaction(signed_tx.raw_transaction)
+            journal.mark(chain_name, tx_hash, 'sent')
+            raw, nonce = signed_tx.raw_transaction, tx['nonce']
+            result['tx_hash'] = tx_hash.hex()
+            print(f"Транзакция отправлена: {tx_hash.hex()} ({batch_size} x sendGM)")
+        if not confirm:
+            return result
+
+        remaining = max(timeout - (time.monotonic() - start), 1)
+        tracker = receipt_tracker.get_tracker(web3, chain_name)
+        # Застрявшую дольше срока сети транзакцию заменяем с поднятыми комиссиями
+        replacer = replacement.Replacer(web3, chain_name, private_key, account_address, 'gm_batch')
+        with metrics.phase(chain_name, 'confirm', 'gm_batch'):
+            receipt = replacer.wait(tracker, tx_hash, raw, nonce, timeout=remaining,
+                                    from_block=snapshot.block_number if snapshot else None)
+        journal.mark_receipt(chain_name, receipt)
+        if tx:
+            gas_cache.learn(chain_name, estimate_tx, receipt, tx['gas'])
+        # После замены в блок попадает другой хэш
+        result['tx_hash'] = Web3.to_hex(receipt.transactionHash)
+        metrics.record_tx(chain_name, 'gm_batch', receipt.transactionHash, receipt, snapshot.gas_estimate if snapshot else None, tx,
+                          fee_oracle.fee_cap(chain_name))
+        result['block'] = receipt.blockNumber
+        if receipt.status != 1:
+            result['error'] = 'reverted'
+        print(f"Транзакция подтверждена в блоке: {receipt.blockNumber}\n")
     except Exception as e:
-        print(f'обработанная ошибка:\n{e}')
-        gas_price = web3.eth.gas_price
-        print(f"Gas Price: {web3.from_wei(gas_price, 'gwei')} gwei")
-        tx_param = {
-            'from': account_address,
-            'nonce': web3.eth.get_transaction_count(account_address),
-            'gas': gas_limit,
-            'gasPrice': gas_price,
-            'chainId': chain_id
-        }
-    return contract.functions.sendGM(greeting).build_transaction(tx_param)
+        print(f'ошибка в {chain_name}:\n{e}')
+        result['error'] = str(e) or type(e).__name__
+    finally:
+        result['latency'] = round(time.monotonic() - start, 2)
+        metrics.event('flow', flow='gm_batch', batch_size=batch_size, **result)
+    return result
 
-def sendGM(chain_name):
-    web3 = getWeb3(chain_name)
-    if not web3:
-        return
-    private_key = config.PRIVATE_KEY_MAIN
-    if not private_key:
-        print("Приватный ключ не найден")
-        return
-    account_address = config.main_addr
-    # Преобразуем в checksum-формат
-    account_address = Web3.to_checksum_address(account_address)
-    # Получаем chainId
-    chain_id = web3.eth.chain_id
-    print(f"Подключено к {chain_name} ID: {chain_id}")
-    native_token = 'ETH' # добавить функцию получение имени токена
-
-    balance_eth = get_balance(web3, account_address)
-    print(f"Баланс: {balance_eth} ETH")
-    tx = get_tx(web3, chain_name, account_address, native_token, chain_id)
-    if not tx:
-        return
-    # Подписываем и отправляем
-    signed_tx = web3.eth.account.sign_transaction(tx, private_key)
-    tx_hash = web3.eth.send_raw_transaction(signed_tx.raw_transaction)
-    print(f"Транзакция отправлена: {tx_hash.hex()}")
+def print_results(results):
+    # Сводная таблица по всем сетям
+    print(f"{'chain':<14} {'block':>10} {'latency,s':>10}  {'tx hash':<66}  error")
+    for r in results:
+        block = r['block'] if r['block'] is not None else '-'
+        latency = r['latency'] if r['latency'] is not None else '-'
+        print(f"{r['chain']:<14} {block:>10} {latency:>10}  {r['tx_hash'] or '-':<66}  {r['error'] or ''}")
+    print()
+
+def _worker(batch_size, confirm=True):
+    if batch_size:
+        return lambda name, timeout: sendGM_batch(name, batch_size, timeout, confirm)
+    return lambda name, timeout: sendGM(name, timeout, confirm)
 
-    # Ждём подтверждения
-    receipt = web3.eth.wait_for_transaction_receipt(tx_hash)
-    print(f"Транзакция подтверждена в блоке: {receipt.blockNumber}\n")
+def run_concurrent(chain_list, max_workers=MAX_WORKERS, timeout=CHAIN_TIMEOUT, batch_size=None, confirm=True):
+    # Запускаем sendGM во всех сетях параллельно, медленная сеть не держит остальные
+    results = {}
+    worker = _worker(batch_size, confirm)
+    pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='gm')
+    futures = {pool.submit(worker, name, timeout): name for name in chain_list}
+    # Общий лимит: все сети пройдут не больше чем в ceil(n / workers) волн
+    waves = -(-len(chain_list) // max(max_workers, 1))
+    done, not_done = wait(futures, timeout=timeout * waves + 10)
+    for future in done:
+        results[futures[future]] = future.result()
+    for future in not_done:
+        future.cancel()
+        results[futures[future]] = {'chain': futures[future], 'tx_hash': None, 'block': None,
+                                    'latency': None, 'error': 'timeout'}
+    # Возвращаемся, не дожидаясь зависших потоков. Это не daemon-потоки - при выходе
+    # интерпретатор их всё равно дождётся, поэтому каждый RPC-запрос сети ограничен
+    # её timeout (см. getWeb3), и поток не висит дольше последнего запроса
+    pool.shutdown(wait=False, cancel_futures=True)
+    return [results[name] for name in chain_list]
 
-def main(chain_list):
-    for name in chain_list:
-        sendGM(name)
+def main(chain_list, max_workers=1, timeout=CHAIN_TIMEOUT, batch_size=None, confirm=True):
+    # batch_size - режим пачек через Multicall3 (один tx на batch_size вызовов)
+    # confirm=False - только отправка, подтверждения собирает reconciler
+    flow = 'gm_batch' if batch_size else 'gm'
+    if batch_size:
+        print('ВНИМАНИЕ: в режиме пачек logGM записывает отправителем Multicall3, а не кошелёк - '
+              'эти GM не попадут в историю и серии аккаунта\n')
+    # Выключенные и недонастроенные сети (нет RPC или контракта) - до любых подключений
+    chain_list = chain_registry.select(chain_list, 'gm')
+    # Прерванный запуск продолжается: сети, где GM уже подтверждён, пропускаем без RPC
+    journal.start_run(flow, detached=not confirm)
+    done = journal.completed(flow)
+    skipped = [name for name in chain_list if done.get(name) and not journal.has_pending(flow, name)]
+    if skipped:
+        print(f"уже выполнено в этом запуске: {', '.join(skipped)}")
+    todo = [name for name in chain_list if name not in skipped]
+    # Сети без средств на GM отсеиваем одним параллельным опросом, до оценок газа
+    todo = readiness.filter_ready(todo, 'gm')
+    if max_workers > 1:
+        results = run_concurrent(todo, max_workers, timeout, batch_size, confirm)
+    else:
+        worker = _worker(batch_size, confirm)
+        results = [worker(name, timeout) for name in todo]
+    print_results(results)
+    if not confirm:
+        print(f'подтверждения не ждали - статусы соберёт reconciler ({reconciler.RESULTS_PATH})')
+    elif all(not r['error'] for r in results):
+        journal.finish_run(flow)
+    return results
 
 if __name__ == "__main__":
-    chain_list = ['irys', 'eth_sepolia', 'monad', 'mega', 'somnia', 'rise', 'base_sepolia', 'moca', 'kite', 'incentiv', 'camp', 'pharos', '0g', 'sahara', 'nexus']
-    #chain_list = ['seismic', ] 
-    main(chain_list)
+    chain_list = chain_registry.names('gm')
+    main(chain_list, max_workers=MAX_WORKERS)
     print(f'script done\n')
\ No newline at end of file
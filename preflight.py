@@ -0,0 +1,92 @@
+from dataclasses import dataclass, field
+
+from fee_oracle import FEE_HISTORY_BLOCKS, REWARD_PERCENTILES
+
+
+@dataclass
+class Preflight:
+    """Снимок состояния сети и аккаунта перед отправкой транзакции."""
+    chain_id: int
+    balance: int
+    nonce: int
+    block_number: int
+    base_fee: int | None = None          # None - сеть без EIP-1559
+    max_priority_fee: int | None = None  # None - RPC не поддерживает eth_maxPriorityFeePerGas
+    gas_price: int | None = None
+    gas_estimate: int | None = None      # None - оценка не запрашивалась или упала
+    gas_limit: int | None = None         # оценка с запасом (gas_cache.fetch)
+    fee_history: dict | None = None      # сырой ответ eth_feeHistory для fee_oracle
+    errors: dict = field(default_factory=dict)
+
+
+def _to_hex(value):
+    return hex(value) if isinstance(value, int) else value
+
+def _rpc_tx(tx):
+    # eth_estimateGas принимает числа только в hex
+    return {key: _to_hex(value) for key, value in tx.items() if value is not None}
+
+def _to_int(value):
+    if value is None:
+        return None
+    return int(value, 16) if isinstance(value, str) else int(value)
+
+def _execute(provider, requests):
+    """Отправляет запросы одним JSON-RPC батчем, при отказе RPC - по одному."""
+    responses = None
+    if hasattr(provider, 'make_batch_request'):
+        try:
+            responses = provider.make_batch_request(requests)
+        except Exception:
+            responses = None
+    # Часть RPC не умеет батчи и возвращает одну ошибку вместо списка
+    if not isinstance(responses, list) or len(responses) != len(requests):
+        responses = []
+        for method, params in requests:
+            try:
+                responses.append(provider.make_request(method, params))
+            except Exception as e:
+                responses.append({'error': str(e)})
+    return responses
+
+def fetch(web3, account_address, estimate_tx=None):
+    """Все чтения перед отправкой одним батчем: chainId, баланс, nonce, блок, комиссии, газ."""
+    names = ['chain_id', 'balance', 'nonce', 'block', 'max_priority_fee', 'gas_price', 'fee_history']
+    requests = [
+        ('eth_chainId', []),
+        ('eth_getBalance', [account_address, 'latest']),
+        ('eth_getTransactionCount', [account_address, 'pending']),
+        ('eth_getBlockByNumber', ['latest', False]),
+        ('eth_maxPriorityFeePerGas', []),
+        ('eth_gasPrice', []),
+        ('eth_feeHistory', [hex(FEE_HISTORY_BLOCKS), 'latest', REWARD_PERCENTILES]),
+    ]
+    if estimate_tx is not None:
+        names.append('gas_estimate')
+        requests.append(('eth_estimateGas', [_rpc_tx(estimate_tx)]))
+
+    results, errors = {}, {}
+    for name, response in zip(names, _execute(web3.provider, requests)):
+        if response.get('error') is not None or 'result' not in response:
+            errors[name] = response.get('error')
+        else:
+            results[name] = response['result']
+
+    # Без этих значений транзакцию не собрать
+    for name in ('chain_id', 'balance', 'nonce', 'block'):
+        if name not in results:
+            raise ValueError(f'pre-flight: не удалось получить {name}: {errors.get(name)}')
+
+    block = results['block']
+    return Preflight(
+        chain_id=_to_int(results['chain_id']),
+        balance=_to_int(results['balance']),
+        nonce=_to_int(results['nonce']),
+        block_number=_to_int(block['number']),
+        base_fee=_to_int(block.get('baseFeePerGas')),
+        max_priority_fee=_to_int(results.get('max_priority_fee')),
+        gas_price=_to_int(results.get('gas_price')),
+        gas_estimate=_to_int(results.get('gas_estimate')),
+        fee_history=results.get('fee_history'),
+        errors=errors,
+    )
@@ -0,0 +1,139 @@
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from eth_account import Account
+from eth_keys import keys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+import chain_profile
+import fee_oracle
+
+
+# Очередь больше этого подписываем в пуле процессов (ECDSA держит GIL)
+PROCESS_POOL_MIN = 256
+CHUNK_SIZE = 64
+# Переподписываем, если цена газа ушла больше чем на 12.5% (рост base fee за блок)
+RESIGN_THRESHOLD = 0.125
+FEE_FIELDS = ('gasPrice', 'maxFeePerGas', 'maxPriorityFeePerGas')
+
+
+def _sign_chunk(private_key, txs):
+    # Верхний уровень модуля - чтобы функция пиклилась в дочерний процесс.
+    # Ключ разбираем один раз: LocalAccount.sign_transaction заново выводит
+    # из него публичный ключ на каждой подписи (~треть времени)
+    key = keys.PrivateKey(Account.from_key(private_key).key)
+    signed = []
+    for tx in txs:
+        signed_tx = Account.sign_transaction(tx, key)
+        signed.append((bytes(signed_tx.raw_transaction), '0x' + bytes(signed_tx.hash).hex()))
+    return signed
+
+def sign_many(private_key, txs, process_pool_min=PROCESS_POOL_MIN):
+    """Подписывает список транзакций, большие списки - в пуле процессов."""
+    if len(txs) < process_pool_min:
+        return _sign_chunk(private_key, txs)
+    chunks = [txs[i:i + CHUNK_SIZE] for i in range(0, len(txs), CHUNK_SIZE)]
+    with ProcessPoolExecutor(max_workers=min(os.cpu_count() or 1, len(chunks))) as pool:
+        results = pool.map(_sign_chunk, [private_key] * len(chunks), chunks)
+    return [item for chunk in results for item in chunk]
+
+def fees_moved(old, new, threshold=RESIGN_THRESHOLD):
+    """Изменились ли комиссии настолько, что подписанное пора переподписать."""
+    if old.eip1559 != new.eip1559:
+        return True
+    pairs = [(old.max_price(), new.max_price())]
+    if new.eip1559:
+        pairs.append((old.max_priority_fee, new.max_priority_fee))
+    return any(abs(b - a) > a * threshold for a, b in pairs if a)
+
+
+class PresignedQueue:
+    """Заранее подписанные транзакции на диапазон nonce, готовые к отправке.
+
+    template - поля транзакции (nonce и комиссии из него отбрасываются),
+    fees - FeeQuote, по которому подписана очередь. Если передан web3 и
+    chain_name, перед выдачей очередь раз в блок сверяет комиссии с
+    fee_oracle и переподписывает оставшееся только при сдвиге за порог.
+    """
+
+    def __init__(self, private_key, template, fees, start_nonce, count,
+                 process_pool_min=PROCESS_POOL_MIN, web3=None, chain_name=None, urgency='normal'):
+        self.private_key = private_key
+        self.template = {key: value for key, value in template.items()
+                         if key != 'nonce' and key not in FEE_FIELDS}
+        self.fees = fees
+        self.process_pool_min = process_pool_min
+        self.web3 = web3
+        self.chain_name = chain_name
+        self.urgency = urgency
+        self.checked_at = time.monotonic()
+        self.resigned = 0
+        self._lock = threading.Lock()
+        # nonce -> {'raw': bytes, 'hash': str}, в порядке nonce
+        self.entries = {}
+        self._sign(range(start_nonce, start_nonce + count))
+
+    def _build(self, nonce):
+        return dict(self.template, nonce=nonce, **self.fees.tx_fields())
+
+    def _sign(self, nonces):
+        nonces = list(nonces)
+        signed = sign_many(self.private_key, [self._build(nonce) for nonce in nonces], self.process_pool_min)
+        with self._lock:
+            for nonce, (raw, tx_hash) in zip(nonces, signed):
+                self.entries[nonce] = {'raw': raw, 'hash': tx_hash}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def pop(self):
+        """Следующая по nonce подписанная транзакция: (nonce, raw, hash) или None."""
+        self._auto_refresh()
+        with self._lock:
+            if not self.entries:
+                return None
+            nonce = min(self.entries)
+            entry = self.entries.pop(nonce)
+        return nonce, entry['raw'], entry['hash']
+
+    def refresh(self, fees, threshold=RESIGN_THRESHOLD):
+        """Переподписывает оставшееся, только если комиссии ушли дальше порога."""
+        if not fees_moved(self.fees, fees, threshold):
+            return False
+        self.fees = fees
+        with self._lock:
+            nonces = sorted(self.entries)
+        self._sign(nonces)
+        self.resigned += 1
+        return True
+
+    def _auto_refresh(self):
+        if self.web3 is None or not self.entries:
+            return
+        # Чаще раза в блок комиссии не меняются - и кэш fee_oracle живёт блок
+        block_time = (chain_profile.cached(self.chain_name) or {}).get('block_time') or 2
+        if time.monotonic() - self.checked_at < block_time:
+            return
+        self.checked_at = time.monotonic()
+        try:
+            fees = fee_oracle.quote(self.web3, self.chain_name, self.urgency, eip1559=self.fees.eip1559)
+        except fee_oracle.FeeTooHigh:
+            # Не переподписываем дороже потолка - отправится по старой цене
+            return
+        self.refresh(fees)
+
+    def feed(self, allocator):
+        """Передаёт очередь в NonceAllocator по одной транзакции - по мере отправки.
+
+        Генератор: nonce отдаётся, как только транзакция передана и её можно
+        отправлять. Перед каждой выдачей pop() сверяет комиссии, так что
+        долгая отправка переподписывает ещё не ушедший остаток.
+        """
+        while (item := self.pop()) is not None:
+            nonce, raw, _ = item
+            allocator.track(nonce, raw, None)
+            yield nonce
@@ -0,0 +1,172 @@
+import os
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from web3 import Web3
+from web3.providers import HTTPProvider
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+import config
+import chain_registry
+import metrics
+from rpc_selector import FailoverProvider
+
+
+# Значения по умолчанию, переопределяются в config
+RPC_TIMEOUT = getattr(config, 'RPC_TIMEOUT', 20)              # секунд на запрос
+RPC_POOL_SIZE = getattr(config, 'RPC_POOL_SIZE', 10)          # соединений на хост
+RPC_RETRIES = getattr(config, 'RPC_RETRIES', 3)
+RPC_BACKOFF = getattr(config, 'RPC_BACKOFF', 0.5)             # 0.5, 1, 2 ... секунд
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+RPC_RATE_LIMIT = getattr(config, 'RPC_RATE_LIMIT', None)      # запросов в секунду на процесс, None - без ограничения
+RPC_HEDGED_METHODS = getattr(config, 'RPC_HEDGED_METHODS', None)  # None - rpc_selector.HEDGED_METHODS
+
+_lock = threading.Lock()
+# Одна сессия (пул keep-alive соединений) на хост
+_sessions = {}
+
+
+class CountingRetry(Retry):
+    """Retry, который считает повторы по хостам для метрик."""
+
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+        metrics.record_retry(f'{_pool.scheme}://{_pool.host}:{_pool.port}' if _pool is not None else None)
+        return super().increment(method, url, response, error, _pool, _stacktrace)
+
+
+class RateLimiter:
+    """Общий бюджет RPC-запросов процесса (token bucket)."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(rate, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        """Ждёт, пока в бюджете не появится tokens запросов."""
+        # Батч больше всего ведра иначе не дождался бы никогда
+        tokens = min(tokens, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                delay = (tokens - self.tokens) / self.rate
+            time.sleep(delay)
+
+
+# Общий для всех провайдеров бюджет, см. set_rate_limit
+_limiter = RateLimiter(RPC_RATE_LIMIT) if RPC_RATE_LIMIT else None
+# Бюджеты отдельных сетей (rpc_rate в реестре): chain_name -> RateLimiter | None
+_chain_limiters = {}
+_chain_limiters_lock = threading.Lock()
+
+
+def _chain_limiter(chain_name):
+    if chain_name is None:
+        return None
+    with _chain_limiters_lock:
+        if chain_name not in _chain_limiters:
+            rate = chain_registry.rpc_rate(chain_name)
+            _chain_limiters[chain_name] = RateLimiter(rate) if rate else None
+        return _chain_limiters[chain_name]
+
+
+class InstrumentedHTTPProvider(HTTPProvider):
+    """HTTPProvider с замером каждого RPC-вызова по сети и методу."""
+
+    def __init__(self, *args, chain_name=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.chain_name = chain_name
+        self.limiter = _chain_limiter(chain_name)
+
+    def make_request(self, method, params):
+        if _limiter is not None:
+            _limiter.acquire()
+        if self.limiter is not None:
+            self.limiter.acquire()
+        with metrics.rpc_timer(self.chain_name, method) as status:
+            response = super().make_request(method, params)
+            status['ok'] = response.get('error') is None
+            return response
+
+    def make_batch_request(self, requests):
+        if _limiter is not None:
+            _limiter.acquire(len(requests))
+        if self.limiter is not None:
+            self.limiter.acquire(len(requests))
+        with metrics.rpc_timer(self.chain_name, 'batch'):
+            return super().make_batch_request(requests)
+
+
+def _host(rpc_url):
+    parts = urlsplit(rpc_url)
+    return f'{parts.scheme}://{parts.netloc}'
+
+def get_session(rpc_url):
+    """Общая сессия с пулом соединений и повторами для хоста RPC."""
+    host = _host(rpc_url)
+    with _lock:
+        session = _sessions.get(host)
+        if session is None:
+            retry = CountingRetry(
+                total=RPC_RETRIES,
+                backoff_factor=RPC_BACKOFF,
+                status_forcelist=RETRY_STATUSES,
+                # JSON-RPC ходит только POST-ом, повтор отправки raw-транзакции безопасен
+                allowed_methods=frozenset(['POST']),
+                respect_retry_after_header=True,
+                raise_on_status=False,
+            )
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=RPC_POOL_SIZE, max_retries=retry)
+            session = requests.Session()
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _sessions[host] = session
+        return session
+
+def make_provider(rpc_url, timeout=None, chain_name=None, hedged_methods=None):
+    """HTTPProvider поверх общей сессии хоста.
+
+    Если для сети задан список RPC - провайдер с переключением на самый быстрый живой.
+    chain_name - метка сети для метрик задержки RPC.
+    hedged_methods - вызовы, которые отправляются сразу в два RPC (None -
+    config.RPC_HEDGED_METHODS или rpc_selector.HEDGED_METHODS, пустой список - без гонок).
+    """
+    if isinstance(rpc_url, (list, tuple)):
+        if len(rpc_url) > 1:
+            if hedged_methods is None:
+                hedged_methods = RPC_HEDGED_METHODS
+            return FailoverProvider([make_provider(url, timeout, chain_name) for url in rpc_url], hedged_methods)
+        rpc_url = rpc_url[0]
+    return InstrumentedHTTPProvider(
+        rpc_url,
+        request_kwargs={'timeout': timeout or RPC_TIMEOUT},
+        session=get_session(rpc_url),
+        chain_name=chain_name,
+    )
+
+def make_web3(rpc_url, timeout=None, chain_name=None, hedged_methods=None):
+    return Web3(make_provider(rpc_url, timeout, chain_name, hedged_methods))
+
+def set_rate_limit(rate, burst=None):
+    """Задаёт общий бюджет RPC в запросах/сек (None - снять ограничение)."""
+    global _limiter
+    _limiter = RateLimiter(rate, burst) if rate else None
+
+def close_all():
+    with _lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
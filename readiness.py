@@ -0,0 +1,183 @@
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+import config
+import chain_profile
+import chain_registry
+import fee_oracle
+import preflight
+import providers
+
+
+MAX_CHAIN_WORKERS = 16    # сетей опрашиваем одновременно - по одному батчу на сеть
+# Газ на одну транзакцию действия (с запасом) и сколько транзакций в действии
+ACTION_GAS = {'gm': 60_000, 'send': 21_000, 'deploy': 1_500_000, 'clone': 250_000}
+ACTION_GAS.update(getattr(config, 'READINESS_GAS', {}))
+ACTION_COUNT = {'gm': 1, 'send': 5, 'deploy': 1, 'clone': 1}
+TRANSFER_AMOUNT = 10**13  # 0.00001 токена на перевод, как в send_token
+
+
+@dataclass
+class WalletState:
+    address: str
+    balance: int
+    nonce: int                 # подтверждённый
+    pending_nonce: int
+
+    @property
+    def queued(self):
+        """Сколько транзакций аккаунта ещё в мемпуле."""
+        return self.pending_nonce - self.nonce
+
+
+@dataclass
+class ChainReadiness:
+    """Балансы аккаунтов и текущая цена газа в одной сети."""
+    chain: str
+    wallets: list = field(default_factory=list)
+    max_price: int | None = None    # wei за газ по fee_oracle (maxFeePerGas или gasPrice)
+    native_token: str = 'ETH'
+    error: str | None = None
+    fee_too_high: bool = False      # цена газа выше потолка сети - действие точно не выполнить
+
+    def cost(self, action):
+        """Максимальная стоимость действия при текущих комиссиях, wei."""
+        cost = ACTION_GAS[action] * ACTION_COUNT[action] * self.max_price
+        if action == 'send':
+            # Переводы идут самому себе, но в момент отправки value должен быть на балансе
+            cost += TRANSFER_AMOUNT
+        return cost
+
+    def ready(self, action, address=None):
+        """Хватит ли средств на действие (у address или у любого аккаунта)."""
+        if self.error is not None or self.max_price is None:
+            return False
+        cost = self.cost(action)
+        return any(wallet.balance >= cost for wallet in self.wallets
+                   if address is None or wallet.address.lower() == address.lower())
+
+
+def default_addresses():
+    """Основной адрес и аккаунты пула (config.PRIVATE_KEYS)."""
+    import wallet_pool
+    addresses = [config.main_addr] + [account.address for account in wallet_pool.load_accounts()]
+    return list(dict.fromkeys(address for address in addresses if address))
+
+def scan_chain(chain_name, addresses, urgency='normal'):
+    """Одним батчем: блок, комиссии и по каждому аккаунту баланс, nonce и pending nonce."""
+    result = ChainReadiness(chain_name)
+    rpc_url = chain_registry.rpc(chain_name)
+    if not rpc_url:
+        result.error = 'нет RPC'
+        return result
+    requests = [
+        ('eth_getBlockByNumber', ['latest', False]),
+        ('eth_gasPrice', []),
+        ('eth_maxPriorityFeePerGas', []),
+    ]
+    for address in addresses:
+        requests += [
+            ('eth_getBalance', [address, 'latest']),
+            ('eth_getTransactionCount', [address, 'latest']),
+            ('eth_getTransactionCount', [address, 'pending']),
+        ]
+    try:
+        responses = preflight._execute(providers.make_provider(rpc_url, chain_name=chain_name), requests)
+        values = [response.get('result') for response in responses]
+        block, gas_price, priority_fee = values[:3]
+        if block is None:
+            raise ValueError(f"нет блока: {responses[0].get('error')}")
+        for i, address in enumerate(addresses):
+            balance, nonce, pending_nonce = values[3 + 3 * i:6 + 3 * i]
+            if balance is None or nonce is None:
+                raise ValueError(f'нет баланса или nonce {address}')
+            nonce = preflight._to_int(nonce)
+            result.wallets.append(WalletState(address, preflight._to_int(balance), nonce,
+                                              preflight._to_int(pending_nonce) if pending_nonce is not None else nonce))
+    except Exception as e:
+        result.error = str(e) or type(e).__name__
+        return result
+
+    profile = chain_profile.cached(chain_name)
+    if profile:
+        result.native_token = profile['native_token']
+    snapshot = preflight.Preflight(
+        chain_id=profile['chain_id'] if profile else 0,
+        balance=result.wallets[0].balance if result.wallets else 0,
+        nonce=result.wallets[0].nonce if result.wallets else 0,
+        block_number=preflight._to_int(block['number']),
+        base_fee=preflight._to_int(block.get('baseFeePerGas')),
+        max_priority_fee=preflight._to_int(priority_fee),
+        gas_price=preflight._to_int(gas_price),
+    )
+    try:
+        # Всё нужное уже в снимке - fee_oracle в сеть не ходит
+        fees = fee_oracle.quote(None, chain_name, urgency, snapshot,
+                                eip1559=False if profile and (profile['is_poa'] or not profile['eip1559']) else None)
+        result.max_price = fees.max_price()
+    except fee_oracle.FeeTooHigh as e:
+        result.error = f'комиссия выше потолка: {e}'
+        result.fee_too_high = True
+    except Exception as e:
+        # Снимок без нужных полей (например, нет eth_maxPriorityFeePerGas) - цена неизвестна,
+        # но это не повод пропускать сеть
+        result.error = str(e) or type(e).__name__
+    return result
+
+def scan(chain_list, addresses=None, max_workers=MAX_CHAIN_WORKERS):
+    """Опрашивает все сети параллельно: {chain_name: ChainReadiness}."""
+    addresses = addresses or default_addresses()
+    with ThreadPoolExecutor(max_workers=max(min(max_workers, len(chain_list)), 1),
+                            thread_name_prefix='readiness') as pool:
+        results = list(pool.map(lambda name: scan_chain(name, addresses), chain_list))
+    return dict(zip(chain_list, results))
+
+def filter_ready(chain_list, action, address=None):
+    """Сети, где основному аккаунту хватает средств на действие.
+
+    Сети, которые не удалось опросить или для которых не вышло посчитать
+    цену газа, остаются - пусть сценарий сам сообщит об ошибке; пропускаются
+    только те, где денег точно нет или комиссия выше потолка. chain_list -
+    уже отобранный chain_registry.select (здесь не отбирается повторно).
+    """
+    address = address or config.main_addr
+    report = scan(chain_list, [address])
+    ready = []
+    for name in chain_list:
+        state = report[name]
+        if state.ready(action, address) or (state.max_price is None and not state.fee_too_high):
+            ready.append(name)
+        elif state.fee_too_high:
+            print(f'{name}: пропускаем - {state.error}')
+        else:
+            print(f'{name}: пропускаем - на {action} нужно {state.cost(action) / 10**18:.6f} {state.native_token}, '
+                  f'на балансе {state.wallets[0].balance / 10**18:.6f}')
+    return ready
+
+def print_report(report, actions=tuple(ACTION_GAS)):
+    flags = ' '.join(f'{action:>6}' for action in actions)
+    print(f"{'chain':<14} {'wallet':<12} {'balance':>14} {'nonce':>7} {'queued':>6} {'gwei':>9}  {flags}  error")
+    for name, state in report.items():
+        if state.error is not None and not state.wallets:
+            print(f"{name:<14} {'-':<12} {'-':>14} {'-':>7} {'-':>6} {'-':>9}  {' ' * len(flags)}  {state.error}")
+            continue
+        gwei = f'{state.max_price / 10**9:.3f}' if state.max_price is not None else '-'
+        for wallet in state.wallets:
+            marks = ' '.join(f"{'да' if state.ready(action, wallet.address) else '-':>6}" for action in actions)
+            print(f"{name:<14} {wallet.address[:10] + '..':<12} {wallet.balance / 10**18:>14.6f} {wallet.nonce:>7} "
+                  f"{wallet.queued:>6} {gwei:>9}  {marks}  {state.error or ''}")
+    print()
+
+def main(chain_list, addresses=None):
+    report = scan(chain_list, addresses)
+    print_report(report)
+    return report
+
+if __name__ == "__main__":
+    chain_list = chain_registry.select(chain_registry.names())
+    main(chain_list)
+    print(f'script done\n')
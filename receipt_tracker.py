@@ -0,0 +1,240 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+from web3.exceptions import MethodUnavailable, TransactionNotFound, Web3RPCError
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+import config
+import chain_profile
+import chain_registry
+
+
+DEFAULT_POLL_INTERVAL = 2   # секунд, если время блока неизвестно
+STALE_AFTER = 30            # через сколько секунд проверить хэш напрямую
+IDLE_TIMEOUT = 60           # поток останавливается, если так долго нечего ждать
+METHOD_NOT_FOUND = -32601
+UNSUPPORTED_MESSAGES = ('method not found', 'not supported', 'does not exist', 'not available', 'unsupported')
+
+_lock = threading.Lock()
+_trackers = {}
+
+
+class ReceiptTracker:
+    """Следит за новыми блоками сети и разрешает все ожидающие хэши по одному блоку.
+
+    Вместо опроса eth_getTransactionReceipt для каждой транзакции читает
+    квитанции целого блока (eth_getBlockReceipts, либо блок + квитанции только
+    найденных в нём транзакций). Новые блоки приходят по подписке newHeads,
+    если задан websocket RPC, иначе опрашивается eth_blockNumber.
+    """
+
+    def __init__(self, web3, poll_interval=DEFAULT_POLL_INTERVAL, ws_url=None):
+        self.web3 = web3
+        self.poll_interval = poll_interval
+        self.ws_url = ws_url
+        self._lock = threading.Lock()
+        # хэш (hex, lower) -> {'future': Future, 'since': monotonic, 'watchers': сколько ждут}
+        self._pending = {}
+        self._last_block = None
+        self._block_receipts_supported = True
+        self._idle_since = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def watch(self, tx_hash, from_block=None):
+        """Возвращает Future, который получит квитанцию транзакции.
+
+        from_block - блок, начиная с которого транзакция могла быть включена
+        (например, номер блока из pre-flight); уже пройденные блоки будут перечитаны.
+        """
+        key = _hash_key(tx_hash)
+        with self._lock:
+            entry = self._pending.get(key)
+            if entry is None:
+                entry = {'future': Future(), 'since': time.monotonic(), 'from_block': from_block, 'watchers': 0}
+                self._pending[key] = entry
+            entry['watchers'] += 1
+            if self._thread is None:
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name='receipt-tracker', daemon=True)
+                self._thread.start()
+        return entry['future']
+
+    def unwatch(self, tx_hash):
+        """Снимает ожидание хэша (таймаут, замена, выпавшая транзакция).
+
+        Хэш перестаёт искаться в блоках и опрашиваться напрямую, когда его
+        сняли все, кто вызывал watch; их Future отменяется.
+        """
+        key = _hash_key(tx_hash)
+        with self._lock:
+            entry = self._pending.get(key)
+            if entry is None:
+                return
+            entry['watchers'] -= 1
+            if entry['watchers'] > 0:
+                return
+            del self._pending[key]
+        entry['future'].cancel()
+
+    def wait(self, tx_hash, timeout=120, from_block=None):
+        """Блокирующее ожидание квитанции, как web3.eth.wait_for_transaction_receipt."""
+        try:
+            return self.watch(tx_hash, from_block).result(timeout=timeout)
+        except FutureTimeoutError:
+            self.unwatch(tx_hash)
+            raise TimeoutError(f'транзакция {_hash_key(tx_hash)} не подтверждена за {timeout} сек')
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        if self.ws_url:
+            try:
+                asyncio.run(self._follow_ws())
+                return
+            except Exception as e:
+                logging.warning(f"Подписка newHeads недоступна, опрашиваем блоки: {e}")
+        self._follow_polling()
+
+    def _should_exit(self):
+        """Останавливает поток, если давно нечего ждать; следующий watch запустит новый."""
+        if self._stop.is_set():
+            return True
+        with self._lock:
+            if self._pending:
+                self._idle_since = None
+                return False
+            if self._idle_since is None:
+                self._idle_since = time.monotonic()
+            if time.monotonic() - self._idle_since <= IDLE_TIMEOUT:
+                return False
+            self._idle_since = None
+            self._thread = None
+            return True
+
+    def _follow_polling(self):
+        while not self._should_exit():
+            try:
+                self._process_up_to(self.web3.eth.block_number)
+            except Exception as e:
+                logging.warning(f"Ошибка чтения блоков: {e}")
+            self._stop.wait(self.poll_interval)
+
+    async def _follow_ws(self):
+        from web3 import AsyncWeb3, WebSocketProvider
+        async with AsyncWeb3(WebSocketProvider(self.ws_url)) as w3:
+            await w3.eth.subscribe('newHeads')
+            # Блоки, вышедшие до подписки
+            self._process_up_to(self.web3.eth.block_number)
+            async for message in w3.socket.process_subscriptions():
+                head = message['result']
+                self._process_up_to(int(head['number']) if not isinstance(head['number'], str)
+                                    else int(head['number'], 16))
+                if self._should_exit():
+                    break
+
+    def _process_up_to(self, head):
+        with self._lock:
+            # Хэши, отправленные раньше уже пройденных блоков, требуют перечитать их
+            rescan = [entry['from_block'] for entry in self._pending.values()
+                      if entry['from_block'] is not None]
+            for entry in self._pending.values():
+                entry['from_block'] = None
+        if self._last_block is None:
+            # Начинаем с текущего блока: транзакция могла уже попасть в него
+            self._last_block = head - 1
+        start = min([self._last_block + 1] + rescan)
+        for number in range(start, head + 1):
+            with self._lock:
+                has_pending = bool(self._pending)
+            if has_pending:
+                self._process_block(number)
+            self._last_block = max(self._last_block, number)
+        self._check_stale()
+
+    def _process_block(self, number):
+        with self._lock:
+            wanted = set(self._pending)
+        if self._block_receipts_supported:
+            try:
+                receipts = self.web3.eth.get_block_receipts(number)
+                for receipt in receipts:
+                    key = _hash_key(receipt['transactionHash'])
+                    if key in wanted:
+                        self._resolve(key, receipt)
+                return
+            except Exception as e:
+                if not _method_unsupported(e):
+                    # Сбой транспорта или ноды - в следующем проходе блок перечитается
+                    raise
+                # RPC без eth_getBlockReceipts - дальше блок + точечные квитанции
+                self._block_receipts_supported = False
+        block = self.web3.eth.get_block(number)
+        for tx_hash in block['transactions']:
+            key = _hash_key(tx_hash)
+            if key in wanted:
+                self._resolve(key, self.web3.eth.get_transaction_receipt(tx_hash))
+
+    def _check_stale(self):
+        # Хэш мог попасть в блок до регистрации - проверяем такие напрямую
+        now = time.monotonic()
+        with self._lock:
+            stale = [key for key, entry in self._pending.items() if now - entry['since'] > STALE_AFTER]
+        for key in stale:
+            try:
+                self._resolve(key, self.web3.eth.get_transaction_receipt(key))
+            except TransactionNotFound:
+                with self._lock:
+                    if key in self._pending:
+                        self._pending[key]['since'] = now
+            except Exception as e:
+                logging.warning(f"Ошибка проверки квитанции {key}: {e}")
+
+    def _resolve(self, key, receipt):
+        with self._lock:
+            entry = self._pending.pop(key, None)
+        if entry and not entry['future'].done():
+            entry['future'].set_result(receipt)
+
+
+def _method_unsupported(error):
+    """RPC не знает метода (в отличие от временного сбоя)."""
+    if isinstance(error, MethodUnavailable):
+        return True
+    if not isinstance(error, Web3RPCError):
+        return False
+    rpc_error = (error.rpc_response or {}).get('error') or {}
+    if isinstance(rpc_error, dict) and rpc_error.get('code') == METHOD_NOT_FOUND:
+        return True
+    message = str(rpc_error.get('message', '') if isinstance(rpc_error, dict) else rpc_error or error).lower()
+    return any(marker in message for marker in UNSUPPORTED_MESSAGES)
+
+def _hash_key(tx_hash):
+    if isinstance(tx_hash, str):
+        value = tx_hash.lower()
+    else:
+        value = bytes(tx_hash).hex()
+    return value if value.startswith('0x') else '0x' + value
+
+def get_tracker(web3, chain_name):
+    """Общий трекер квитанций для сети."""
+    with _lock:
+        tracker = _trackers.get(chain_name)
+    if tracker is not None:
+        return tracker
+    # Интервал опроса - время блока сети из профиля
+    try:
+        block_time = chain_profile.get_profile(web3, chain_name).get('block_time')
+    except Exception:
+        block_time = None
+    poll_interval = min(max(block_time or DEFAULT_POLL_INTERVAL, 0.5), 5)
+    ws_url = chain_registry.ws_rpc(chain_name)
+    with _lock:
+        return _trackers.setdefault(chain_name, ReceiptTracker(web3, poll_interval, ws_url))
@@ -0,0 +1,172 @@
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+import config
+import chain_registry
+import journal
+import metrics
+import providers
+import replacement
+
+
+# Сверка отправленных без ожидания (confirm=False) транзакций: квитанции
+# проверяются пачкой по журналу, выпавшие из мемпула - переотправляются
+RESULTS_PATH = getattr(config, 'RESULTS_PATH', None) or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '.tx_results.json')
+FLOWS = ('gm', 'gm_batch', 'send', 'send_batch', 'deploy', 'deploy_token')
+RECONCILE_INTERVAL = getattr(config, 'RECONCILE_INTERVAL', 10)   # секунд между проходами
+RECONCILE_TIMEOUT = getattr(config, 'RECONCILE_TIMEOUT', 600)    # дольше не ждём - остаток в следующий раз
+MAX_CHAIN_WORKERS = 8
+
+_lock = threading.Lock()
+
+
+def _keys():
+    """{адрес (lower): приватный ключ} основного аккаунта и аккаунтов пула."""
+    import wallet_pool
+    keys = {account.address.lower(): account.key for account in wallet_pool.load_accounts()}
+    if config.main_addr and config.PRIVATE_KEY_MAIN:
+        keys[config.main_addr.lower()] = config.PRIVATE_KEY_MAIN
+    return keys
+
+def pending_chains(flow):
+    """Сети, где у текущего запуска flow есть неподтверждённые транзакции."""
+    return sorted({row['chain'] for row in journal.entries(flow, statuses=journal.PENDING)})
+
+def replace_stuck(web3, chain_name, flow, rows):
+    """Заменяет транзакции в пути старше срока сети, возвращает число замен."""
+    keys = _keys()
+    replacers = {}
+    replaced = 0
+    for row in rows:
+        key = keys.get(row['account'].lower())
+        if key is None:
+            continue
+        replacer = replacers.get(row['account'])
+        if replacer is None:
+            replacer = replacers[row['account']] = replacement.Replacer(web3, chain_name, key, row['account'], flow)
+        if time.time() - row['created_at'] >= replacer.deadline and replacer.can_bump(row['nonce']):
+            if replacer.replace(row['nonce'], row['raw'], row['hash']) is not None:
+                replaced += 1
+    return replaced
+
+def reconcile_chain(chain_name, flow):
+    """Один проход по сети: (подтверждено, в пути) или текст ошибки вместо них.
+
+    Транзакции в пути дольше срока сети заменяются с поднятыми комиссиями.
+    """
+    rpc_url = chain_registry.rpc(chain_name)
+    if not rpc_url:
+        return 'нет RPC'
+    try:
+        web3 = providers.make_web3(rpc_url, chain_name=chain_name)
+        confirmed, pending = journal.reconcile(web3, chain_name, flow)
+        replace_stuck(web3, chain_name, flow, pending)
+    except Exception as e:
+        return str(e) or type(e).__name__
+    for row in confirmed:
+        metrics.event('reconcile', flow=flow, chain=chain_name, tx_hash=row['hash'],
+                      status=row['status'], block=row['block'])
+    return len(confirmed), len(pending)
+
+def results(flow, run=None):
+    """Записи текущего (или заданного) запуска flow для файла результатов."""
+    return [{key: row[key] for key in ('chain', 'hash', 'nonce', 'status', 'block')}
+            for row in journal.entries(flow, run=run)]
+
+def write_results(flows):
+    """Дописывает статусы запусков flows в RESULTS_PATH (атомарно)."""
+    with _lock:
+        try:
+            with open(RESULTS_PATH, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        for flow in flows:
+            run = journal.current_run(flow)
+            if run is not None:
+                data[flow] = {'run': run, 'updated_at': time.time(), 'txs': results(flow)}
+        tmp_path = f'{RESULTS_PATH}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, RESULTS_PATH)
+
+def reconcile_pass(flows, max_workers=MAX_CHAIN_WORKERS):
+    """Проход по всем сетям с незавершёнными транзакциями, сети - параллельно.
+
+    Возвращает {(flow, chain_name): результат reconcile_chain}.
+    """
+    jobs = [(flow, name) for flow in flows for name in pending_chains(flow)]
+    if not jobs:
+        return {}
+    with ThreadPoolExecutor(max_workers=max(min(max_workers, len(jobs)), 1),
+                            thread_name_prefix='reconcile') as pool:
+        outcomes = list(pool.map(lambda job: reconcile_chain(job[1], job[0]), jobs))
+    return dict(zip(jobs, outcomes))
+
+def run(flows=FLOWS, timeout=RECONCILE_TIMEOUT, interval=RECONCILE_INTERVAL):
+    """Сверяет журнал, пока есть транзакции в пути, но не дольше timeout.
+
+    Работает и в отдельном процессе: незавершённые запуски подхватываются
+    из журнала. Возвращает число транзакций, оставшихся в пути.
+    """
+    flows = [flow for flow in flows if journal.current_run(flow) or journal.resume_run(flow)]
+    deadline = time.monotonic() + timeout
+    while True:
+        outcomes = reconcile_pass(flows)
+        write_results(flows)
+        for (flow, name), outcome in outcomes.items():
+            if isinstance(outcome, str):
+                print(f'{name} ({flow}): ошибка сверки: {outcome}')
+            elif outcome[0]:
+                print(f'{name} ({flow}): подтверждено {outcome[0]}, в пути {outcome[1]}')
+        left = sum(len(journal.entries(flow, statuses=journal.PENDING)) for flow in flows)
+        if not left or time.monotonic() + interval > deadline:
+            finish_settled(flows)
+            return left
+        time.sleep(interval)
+
+def finish_settled(flows):
+    """Закрывает запуски без ожидания (confirm=False), где не осталось транзакций в пути.
+
+    Такой запуск сам не закрывается - его закрывает сверка. Обычный запуск,
+    оставленный открытым после неудачи, не трогаем: по нему сценарий
+    продолжит работу и не повторит уже выполненное.
+    """
+    for flow in flows:
+        if journal.detached(flow) and not journal.entries(flow, statuses=journal.PENDING):
+            journal.finish_run(flow)
+
+def start(flows=FLOWS, timeout=RECONCILE_TIMEOUT, interval=RECONCILE_INTERVAL):
+    """run() в фоновом потоке - сценарий возвращается сразу после отправки."""
+    thread = threading.Thread(target=run, args=(flows, timeout, interval), name='reconciler', daemon=True)
+    thread.start()
+    return thread
+
+def print_results(runs):
+    """runs - {flow: id запуска}: сверка могла их уже закрыть."""
+    print(f"{'flow':<12} {'chain':<14} {'nonce':>6} {'status':<10} {'block':>10}  tx hash")
+    for flow, run in runs.items():
+        for row in results(flow, run):
+            block = row['block'] if row['block'] is not None else '-'
+            print(f"{flow:<12} {row['chain']:<14} {row['nonce']:>6} {row['status']:<10} {block:>10}  {row['hash']}")
+    print()
+
+def main(flows=FLOWS, timeout=RECONCILE_TIMEOUT):
+    runs = {flow: journal.current_run(flow) or journal.resume_run(flow) for flow in flows}
+    runs = {flow: run for flow, run in runs.items() if run}
+    left = run(list(runs), timeout)
+    print_results(runs)
+    if left:
+        print(f'в пути осталось {left} транзакций - запустите сверку ещё раз')
+    return left
+
+if __name__ == "__main__":
+    main()
+    print(f'script done\n')
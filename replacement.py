@@ -0,0 +1,184 @@
+import math
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+
+from eth_account import Account
+from eth_account._utils.legacy_transactions import Transaction
+from eth_account.typed_transactions import TypedTransaction
+from hexbytes import HexBytes
+from web3 import Web3
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+import config
+import chain_profile
+import fee_oracle
+import journal
+import metrics
+
+
+# Замена застрявшей транзакции: тот же nonce, комиссии выше. Мемпул geth
+# принимает замену, только если обе комиссии выросли хотя бы на 10%
+BUMP = 1.125              # с запасом к порогу 10% (и к округлению у других клиентов)
+MAX_BUMPS = 3             # дальше ждём как есть - потолок сети всё равно близко
+STUCK_BLOCKS = 10         # сколько блоков без включения считаем застреванием
+MIN_STUCK_AFTER = 15      # секунд, не меньше - иначе заменяем то, что просто не успело
+MAX_STUCK_AFTER = 120
+DEFAULT_STUCK_AFTER = 60  # время блока неизвестно
+
+
+def stuck_after(chain_name):
+    """Срок, после которого транзакцию сети заменяем (config.stuck_after_dict или по времени блока)."""
+    value = getattr(config, 'stuck_after_dict', {}).get(chain_name)
+    if value is not None:
+        return value
+    block_time = (chain_profile.cached(chain_name) or {}).get('block_time')
+    if not block_time:
+        return DEFAULT_STUCK_AFTER
+    return min(max(block_time * STUCK_BLOCKS, MIN_STUCK_AFTER), MAX_STUCK_AFTER)
+
+def decode(raw):
+    """Поля неподписанной транзакции из подписанной (типизированной или legacy)."""
+    raw = HexBytes(raw)
+    if raw[0] <= 0x7f:
+        tx = TypedTransaction.from_bytes(raw).as_dict()
+        tx.pop('type', None)
+    else:
+        tx = Transaction.from_bytes(raw).as_dict()
+        # EIP-155: v = chainId * 2 + 35/36
+        tx['chainId'] = (tx['v'] - 35) // 2
+    for key in ('v', 'r', 's'):
+        tx.pop(key, None)
+    if not tx.get('accessList'):
+        tx.pop('accessList', None)
+    if tx.get('to'):
+        tx['to'] = Web3.to_checksum_address(tx['to'])
+    else:
+        # Развёртывание контракта
+        tx.pop('to', None)
+    return tx
+
+def _bumped(value):
+    return math.ceil(value * BUMP)
+
+def bump(tx, fresh=None):
+    """Комиссии замены: старые +12.5% или текущая котировка, если она выше."""
+    tx = {key: value for key, value in tx.items()}
+    if 'maxFeePerGas' in tx:
+        priority_fee = _bumped(tx['maxPriorityFeePerGas'])
+        max_fee = _bumped(tx['maxFeePerGas'])
+        if fresh is not None and fresh.eip1559:
+            priority_fee = max(priority_fee, fresh.max_priority_fee)
+            max_fee = max(max_fee, fresh.max_fee_per_gas)
+        tx.update(maxPriorityFeePerGas=priority_fee, maxFeePerGas=max(max_fee, priority_fee))
+    else:
+        gas_price = _bumped(tx['gasPrice'])
+        if fresh is not None and not fresh.eip1559:
+            gas_price = max(gas_price, fresh.gas_price)
+        tx['gasPrice'] = gas_price
+    return tx
+
+
+class Replacer:
+    """Переподписывает застрявшие транзакции аккаунта с поднятыми комиссиями.
+
+    С flow замена пишется в journal до отправки, а заменённая запись
+    получает статус replaced - сверка журнала найдёт ту, что включена в блок.
+    """
+
+    def __init__(self, web3, chain_name, private_key, account_address, flow=None, deadline=None):
+        self.web3 = web3
+        self.chain_name = chain_name
+        self.private_key = private_key
+        self.account_address = account_address
+        self.flow = flow
+        self.deadline = deadline if deadline is not None else stuck_after(chain_name)
+        # nonce -> сколько раз заменяли (при flow - считается по журналу)
+        self.bumps = {}
+
+    def _bumps(self, nonce):
+        if nonce not in self.bumps:
+            self.bumps[nonce] = (journal.replaced_count(self.chain_name, self.account_address, nonce)
+                                 if self.flow is not None else 0)
+        return self.bumps[nonce]
+
+    def can_bump(self, nonce):
+        return self._bumps(nonce) < MAX_BUMPS
+
+    def stuck(self, nonce, sent_at):
+        """Пора ли заменять: срок вышел и попытки не исчерпаны."""
+        return time.monotonic() - sent_at >= self.deadline and self.can_bump(nonce)
+
+    def replace(self, nonce, raw, old_hash=None):
+        """Отправляет замену транзакции raw, возвращает (raw, hash) замены или None."""
+        tx = decode(raw)
+        try:
+            fresh = fee_oracle.quote(self.web3, self.chain_name, 'high', eip1559='maxFeePerGas' in tx)
+        except fee_oracle.FeeTooHigh:
+            fresh = None
+        new_tx = bump(tx, fresh)
+        self.bumps[nonce] = self._bumps(nonce) + 1
+        cap = fee_oracle.fee_cap(self.chain_name)
+        price = new_tx.get('maxFeePerGas', new_tx.get('gasPrice'))
+        if price > cap:
+            print(f'{self.chain_name}: nonce {nonce} не заменяем - комиссия замены выше потолка {cap / 10**9:.2f} gwei')
+            self.bumps[nonce] = MAX_BUMPS
+            return None
+        signed = Account.sign_transaction(new_tx, self.private_key)
+        if self.flow is not None:
+            journal.record(self.chain_name, self.flow, self.account_address, nonce, signed.raw_transaction, signed.hash)
+        try:
+            tx_hash = self.web3.eth.send_raw_transaction(signed.raw_transaction)
+        except Exception as e:
+            message = str(e).lower()
+            if 'already known' in message or 'known transaction' in message:
+                tx_hash = signed.hash
+            else:
+                # nonce too low - исходная уже включена; underpriced - поднимем ещё в следующий раз
+                print(f'{self.chain_name}: замена nonce {nonce} не принята: {e}')
+                if self.flow is not None:
+                    journal.mark(self.chain_name, signed.hash, 'dropped')
+                return None
+        if self.flow is not None:
+            journal.mark(self.chain_name, tx_hash, 'sent')
+            if old_hash is not None:
+                journal.mark(self.chain_name, old_hash, 'replaced')
+        metrics.inc('tx_replaced', chain=self.chain_name)
+        print(f'{self.chain_name}: nonce {nonce} застрял, замена {Web3.to_hex(tx_hash)} ({price / 10**9:.4f} gwei)')
+        return signed.raw_transaction, tx_hash
+
+    def wait(self, tracker, tx_hash, raw, nonce, timeout=120, from_block=None):
+        """Как ReceiptTracker.wait, но с заменой по сроку; ждёт квитанцию любой из версий."""
+        deadline = time.monotonic() + timeout
+        sent_at = time.monotonic()
+        # Future -> хэш версии: проигравшие версии снимаем с трекера при выходе
+        futures = {tracker.watch(tx_hash, from_block): tx_hash}
+        winner = None
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f'транзакция nonce {nonce} не подтверждена за {timeout} сек')
+                step = remaining
+                if raw is not None and self.can_bump(nonce):
+                    step = max(min(sent_at + self.deadline - time.monotonic(), remaining), 0.1)
+                done, _ = wait(futures, timeout=step, return_when=FIRST_COMPLETED)
+                if done:
+                    winner = done.pop()
+                    receipt = winner.result()
+                    if self.flow is not None:
+                        # Проигравшие версии nonce в журнале больше не в пути
+                        journal.drop_versions(self.chain_name, receipt['transactionHash'])
+                    return receipt
+                if raw is not None and self.stuck(nonce, sent_at):
+                    replaced = self.replace(nonce, raw, tx_hash)
+                    if replaced is not None:
+                        raw, tx_hash = replaced
+                        futures[tracker.watch(tx_hash, from_block)] = tx_hash
+                    sent_at = time.monotonic()
+        finally:
+            for future, version in futures.items():
+                if future is not winner:
+                    tracker.unwatch(version)
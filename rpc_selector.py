@@ -0,0 +1,215 @@
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from web3.providers import JSONBaseProvider
+
+
+# Вызовы, которые отправляем сразу в два RPC и берём первый ответ
+HEDGED_METHODS = frozenset(['eth_sendRawTransaction'])
+EWMA_ALPHA = 0.3          # вес нового замера задержки
+MAX_CONSECUTIVE_ERRORS = 3
+COOLDOWN = 30             # секунд отдыха для упавшего RPC, растёт с числом ошибок
+MAX_COOLDOWN = 300
+REPROBE_INTERVAL = 60     # секунд между фоновыми замерами задержки всех RPC
+
+# Ответы с ошибкой, которые говорят о состоянии ноды, а не о самом запросе:
+# такой ответ - сбой RPC, запрос повторяем на следующем. "nonce too low",
+# "execution reverted" и т.п. детерминированы и отдаются как есть
+TRANSIENT_CODES = frozenset([429, -32005, -32603])
+TRANSIENT_MESSAGES = ('header not found', 'rate limit', 'too many requests', 'limit exceeded',
+                      'timeout', 'timed out', 'busy', 'unavailable', 'try again', 'internal error')
+
+# Общий пул для хеджированных запросов
+_hedge_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix='rpc-hedge')
+
+
+def transient_error(response):
+    """Ошибка ответа (или любого ответа батча) - сбой ноды, а не запроса."""
+    if isinstance(response, list):
+        return any(transient_error(item) for item in response)
+    error = response.get('error') if isinstance(response, dict) else None
+    if not isinstance(error, dict):
+        return False
+    code = error.get('code')
+    if code in TRANSIENT_CODES:
+        return True
+    message = str(error.get('message', '')).lower()
+    return isinstance(code, int) and -32099 <= code <= -32000 and any(m in message for m in TRANSIENT_MESSAGES)
+
+
+class TransientRPCError(Exception):
+    """RPC ответил ошибкой сервера; исходный ответ - в response."""
+
+    def __init__(self, response):
+        super().__init__(response.get('error') if isinstance(response, dict) else response)
+        self.response = response
+
+
+class Endpoint:
+    """Один RPC сети со статистикой задержки и ошибок."""
+
+    def __init__(self, provider):
+        self.provider = provider
+        self.url = provider.endpoint_uri
+        self.latency = None        # EWMA, секунд
+        self.requests = 0
+        self.errors = 0
+        self.consecutive_errors = 0
+        self.down_until = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def error_rate(self):
+        return self.errors / self.requests if self.requests else 0.0
+
+    def healthy(self, now=None):
+        return (now or time.monotonic()) >= self.down_until
+
+    def score(self):
+        # Неизмеренный RPC пробуем первым, чтобы узнать его задержку
+        if self.latency is None:
+            return 0.0
+        return self.latency * (1 + 4 * self.error_rate)
+
+    def record(self, elapsed, ok):
+        with self._lock:
+            self.requests += 1
+            if ok:
+                self.consecutive_errors = 0
+                if self.latency is None:
+                    self.latency = elapsed
+                else:
+                    self.latency = EWMA_ALPHA * elapsed + (1 - EWMA_ALPHA) * self.latency
+                return
+            self.errors += 1
+            self.consecutive_errors += 1
+            if self.consecutive_errors >= MAX_CONSECUTIVE_ERRORS:
+                cooldown = min(COOLDOWN * self.consecutive_errors, MAX_COOLDOWN)
+                self.down_until = time.monotonic() + cooldown
+
+    def call(self, fn, *args):
+        start = time.monotonic()
+        try:
+            response = getattr(self.provider, fn)(*args)
+        except Exception:
+            self.record(time.monotonic() - start, False)
+            raise
+        if transient_error(response):
+            self.record(time.monotonic() - start, False)
+            raise TransientRPCError(response)
+        self.record(time.monotonic() - start, True)
+        return response
+
+    def stats(self):
+        return {
+            'url': self.url,
+            'latency': self.latency,
+            'requests': self.requests,
+            'error_rate': round(self.error_rate, 3),
+            'healthy': self.healthy(),
+        }
+
+
+class EndpointSelector:
+    """Выбирает самый быстрый живой RPC и переключается при ошибках."""
+
+    def __init__(self, providers):
+        if not providers:
+            raise ValueError('нужен хотя бы один RPC')
+        self.endpoints = [Endpoint(provider) for provider in providers]
+        self.probed_at = None
+        self._probe_lock = threading.Lock()
+
+    def _maybe_probe(self, now):
+        # Задержки меняются со временем: раз в REPROBE_INTERVAL перемеряем все RPC в фоне,
+        # иначе ранжирование опиралось бы только на RPC, которые уже выбраны
+        with self._probe_lock:
+            if self.probed_at is not None and now - self.probed_at < REPROBE_INTERVAL:
+                return
+            self.probed_at = now
+        threading.Thread(target=self.probe, name='rpc-probe', daemon=True).start()
+
+    def ranked(self):
+        now = time.monotonic()
+        if len(self.endpoints) > 1:
+            self._maybe_probe(now)
+        healthy = [e for e in self.endpoints if e.healthy(now)]
+        down = [e for e in self.endpoints if not e.healthy(now)]
+        # Упавшие оставляем в конце как последний шанс
+        return sorted(healthy, key=Endpoint.score) + sorted(down, key=lambda e: e.down_until)
+
+    def call(self, fn, *args):
+        """Вызывает fn у лучшего RPC, при исключении или ошибке сервера - у следующего."""
+        last_error = None
+        for endpoint in self.ranked():
+            try:
+                return endpoint.call(fn, *args)
+            except Exception as e:
+                last_error = e
+        # Все RPC ответили ошибкой сервера - отдаём последний ответ, web3 сам поднимет исключение
+        if isinstance(last_error, TransientRPCError):
+            return last_error.response
+        raise last_error
+
+    def hedged_call(self, fn, *args):
+        """Гонка двух лучших RPC: возвращает первый успешный ответ."""
+        candidates = self.ranked()[:2]
+        if len(candidates) < 2:
+            return self.call(fn, *args)
+        pending = {_hedge_pool.submit(endpoint.call, fn, *args) for endpoint in candidates}
+        first_error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    response = future.result()
+                except Exception as e:
+                    first_error = first_error or e
+                    continue
+                if 'error' not in response or not pending:
+                    return response
+                first_error = first_error or response
+        if isinstance(first_error, TransientRPCError):
+            return first_error.response
+        if isinstance(first_error, Exception):
+            raise first_error
+        return first_error
+
+    def probe(self, method='eth_blockNumber'):
+        """Параллельно замеряет задержку всех RPC, чтобы сразу выбрать быстрый."""
+        def ping(endpoint):
+            try:
+                endpoint.call('make_request', method, [])
+            except Exception:
+                pass
+        # Отдельные потоки, а не _hedge_pool: probe и сам запускается из фона
+        threads = [threading.Thread(target=ping, args=(endpoint,), daemon=True) for endpoint in self.endpoints]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return [endpoint.stats() for endpoint in self.endpoints]
+
+
+class FailoverProvider(JSONBaseProvider):
+    """Провайдер web3 поверх нескольких RPC одной сети."""
+
+    def __init__(self, providers, hedged_methods=None):
+        # hedged_methods - вызовы для гонки двух RPC (None - HEDGED_METHODS, пусто - без гонок)
+        super().__init__()
+        self.selector = EndpointSelector(providers)
+        self.hedged_methods = frozenset(HEDGED_METHODS if hedged_methods is None else hedged_methods)
+
+    @property
+    def endpoint_uri(self):
+        # Стабильный идентификатор набора RPC (для кэша профилей сетей)
+        return ','.join(endpoint.url for endpoint in self.selector.endpoints)
+
+    def make_request(self, method, params):
+        if method in self.hedged_methods:
+            return self.selector.hedged_call('make_request', method, params)
+        return self.selector.call('make_request', method, params)
+
+    def make_batch_request(self, requests):
+        return self.selector.call('make_batch_request', requests)
@@ -0,0 +1,160 @@
+import json
+import os
+import random
+import signal
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+import config
+import chain_registry
+import journal
+import metrics
+import onchaingm
+import providers
+
+
+# Значения по умолчанию, переопределяются в config
+GM_INTERVAL = getattr(config, 'GM_INTERVAL', 24 * 3600)          # раз в сутки на сеть
+GM_JITTER = getattr(config, 'GM_JITTER', 1800)                   # ± секунд к каждому сроку
+STARTUP_SPREAD = getattr(config, 'GM_STARTUP_SPREAD', 600)       # первые GM размазываем на 10 минут
+RETRY_DELAY = getattr(config, 'GM_RETRY_DELAY', 900)             # после ошибки, удваивается
+SCHEDULER_RPC_RATE = getattr(config, 'SCHEDULER_RPC_RATE', 20)   # запросов в секунду на все сети
+SCHEDULER_WORKERS = onchaingm.MAX_WORKERS
+TICK = 60                 # дольше этого не спим - подхватываем правки состояния
+JOURNAL_FLOW = 'gm_scheduled'  # свой поток журнала: запуски onchaingm из CLI его не трогают
+STATE_PATH = getattr(config, 'SCHEDULER_STATE_PATH', None) or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '.scheduler_state.json')
+
+
+class Scheduler:
+    """Ежедневный GM по сетям в одном долгоживущем процессе.
+
+    Для каждой сети хранит последний успешный GM (время, блок, хэш) и срок
+    следующего; срок сдвигается на случайный джиттер, чтобы сети не
+    срабатывали одной пачкой. Провайдеры, профили сетей и трекеры квитанций
+    живут между циклами - каждый день не начинается с холодного старта.
+
+    Каждый цикл - отдельный запуск журнала JOURNAL_FLOW: открывается с первым
+    наступившим GM и закрывается, когда отправленное подтверждено. После
+    падения процесса незакрытый запуск продолжается и сверяется с сетью.
+    """
+
+    def __init__(self, chain_list, interval=GM_INTERVAL, jitter=GM_JITTER,
+                 max_workers=SCHEDULER_WORKERS, state_path=STATE_PATH):
+        self.chain_list = chain_list
+        self.interval = interval
+        self.jitter = jitter
+        self.state_path = state_path
+        self.state = self._load()
+        self.running = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='gm-scheduler')
+        self._plan()
+
+    def _load(self):
+        try:
+            with open(self.state_path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self):
+        tmp_path = f'{self.state_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.state_path)
+
+    def _next(self, since):
+        return since + self.interval + random.uniform(-self.jitter, self.jitter)
+
+    def _plan(self):
+        """Сроки сетей без расписания: от последнего GM или вразброс от текущего момента."""
+        now = time.time()
+        with self._lock:
+            for name in self.chain_list:
+                entry = self.state.setdefault(name, {})
+                if entry.get('next_at') is None:
+                    last = entry.get('last_time')
+                    entry['next_at'] = self._next(last) if last else now + random.uniform(0, STARTUP_SPREAD)
+            self._save()
+
+    def due(self, now=None):
+        now = now or time.time()
+        with self._lock:
+            return [name for name in self.chain_list
+                    if name not in self.running and self.state[name]['next_at'] <= now]
+
+    def _dispatch(self, name):
+        try:
+            result = onchaingm.sendGM(name, flow=JOURNAL_FLOW)
+        except Exception as e:
+            result = {'chain': name, 'error': str(e) or type(e).__name__}
+        now = time.time()
+        with self._lock:
+            entry = self.state[name]
+            if not result.get('error'):
+                entry.update(last_time=now, last_block=result.get('block'), tx_hash=result.get('tx_hash'),
+                             failures=0, last_error=None, next_at=self._next(now))
+            else:
+                # Повторяем раньше суток, но с растущей паузой
+                failures = entry.get('failures', 0) + 1
+                entry.update(failures=failures, last_error=result['error'],
+                             next_at=now + min(RETRY_DELAY * 2 ** (failures - 1), self.interval))
+            self.running.discard(name)
+            self._save()
+            # Цикл окончен: закрываем запуск, если в нём не осталось неподтверждённых
+            if not self.running and not journal.entries(JOURNAL_FLOW, statuses=journal.PENDING):
+                journal.finish_run(JOURNAL_FLOW)
+        metrics.event('schedule', chain=name, error=result.get('error'), next_at=entry['next_at'])
+        print(f"{name}: {'GM в блоке ' + str(result.get('block')) if not result.get('error') else result['error']}, "
+              f"следующий через {(entry['next_at'] - now) / 3600:.1f} ч")
+
+    def run_once(self):
+        """Отправляет все наступившие GM, возвращает сколько запущено."""
+        names = self.due()
+        with self._lock:
+            if names and journal.current_run(JOURNAL_FLOW) is None:
+                journal.start_run(JOURNAL_FLOW)
+            self.running.update(names)
+        for name in names:
+            self._pool.submit(self._dispatch, name)
+        return len(names)
+
+    def sleep_time(self):
+        with self._lock:
+            pending = [self.state[name]['next_at'] for name in self.chain_list if name not in self.running]
+        if not pending:
+            return TICK
+        return min(max(min(pending) - time.time(), 0), TICK)
+
+    def run_forever(self):
+        while not self._stop.is_set():
+            self.run_once()
+            self._stop.wait(self.sleep_time() or 1)
+        self._pool.shutdown(wait=True, cancel_futures=True)
+
+    def stop(self, *args):
+        self._stop.set()
+
+
+def main(chain_list, rpc_rate=SCHEDULER_RPC_RATE):
+    # Общий бюджет RPC на все сети - подтверждения не забивают лимиты провайдеров
+    providers.set_rate_limit(rpc_rate)
+    chain_list = chain_registry.select(chain_list, 'gm')
+    scheduler = Scheduler(chain_list)
+    signal.signal(signal.SIGINT, scheduler.stop)
+    signal.signal(signal.SIGTERM, scheduler.stop)
+    for name in chain_list:
+        print(f"{name}: следующий GM через {(scheduler.state[name]['next_at'] - time.time()) / 60:.0f} мин")
+    scheduler.run_forever()
+    metrics.flush()
+
+if __name__ == "__main__":
+    chain_list = chain_registry.names('gm')
+    main(chain_list)
+    print(f'script done\n')
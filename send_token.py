@@ -1,11 +1,25 @@
 from web3 import Web3
-from web3.gas_strategies.time_based import fast_gas_price_strategy, medium_gas_price_strategy, slow_gas_price_strategy
+from web3.middleware import ExtraDataToPOAMiddleware
 import os, sys
 
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
 
 import config
+import chain_profile
+import chain_registry
+import providers
+import fee_oracle
+import receipt_tracker
+import metrics
+import journal
+import readiness
+import gas_cache
+import multicall
+import presign
+import reconciler
+import replacement
+from nonce_manager import NonceAllocator
 
 
 def is_poa_network(web3):
@@ -16,15 +30,21 @@ def is_poa_network(web3):
         return True  # По умолчанию считаем PoA
 
 def get_chain_rpc(chain_name):
-    return config.rpc_name_dict.get(chain_name)
+    return chain_registry.rpc(chain_name)
 
 def getWeb3(chain_name):
     rpc_url = get_chain_rpc(chain_name)
-    web3 = Web3(Web3.HTTPProvider(rpc_url, request_kwargs={'timeout': 20}))
-    # Проверяем подключение
-    if not web3.is_connected():
+    web3 = providers.make_web3(rpc_url, chain_name=chain_name)
+    # Статические свойства сети берём из кэша профилей,
+    # доступность RPC отдельно не проверяем - это сделает pre-flight батч
+    try:
+        with metrics.phase(chain_name, 'connect', 'send'):
+            profile = chain_profile.get_profile(web3, chain_name)
+    except Exception:
         print(f'failed to connect to the {chain_name}\n')
         return
+    if profile['is_poa']:
+        web3.middleware_onion.inject(ExtraDataToPOAMiddleware, layer=0)
     return web3
 
 def get_balance(web3, account_address):
@@ -33,73 +53,33 @@ def get_balance(web3, account_address):
     # Конвертируем в ETH
     return web3.from_wei(balance_wei, 'ether')
 
-def get_tx_param(web3, account_address, chain_id, amount_wei, nonce, fee_level='low'):
-    # Определяем параметры газа (EIP-1559)
-    gas_estimate = web3.eth.estimate_gas({
-    'from': account_address,
-    'to': account_address,
-    'value': amount_wei
-    })
-    # Выбор стратегии газа
-    gas_strategies = {
-        'low': slow_gas_price_strategy,      # 1 час
-        'normal': medium_gas_price_strategy, # 5 минут
-        'high': fast_gas_price_strategy      # 60 секунд
+def get_tx_param(web3, chain_name, account_address, amount_wei, snapshot, fee_level='low', is_poa=None):
+    # chainId, nonce, комиссии и оценка газа уже получены одним батчем в pre-flight
+    if snapshot.gas_estimate is None:
+        raise ValueError(f"ошибка оценки газа: {snapshot.errors.get('gas_estimate')}")
+    gas_limit = snapshot.gas_limit  # запас выучен по прошлым квитанциям (gas_cache), сначала 10%
+
+    if is_poa is None:
+        is_poa = is_poa_network(web3)
+    # Комиссии по перцентилям eth_feeHistory, на PoA - gasPrice; при превышении
+    # потолка fee_oracle.FeeTooHigh пробрасывается вызывающему
+    with metrics.phase(chain_name, 'fee', 'send'):
+        fees = fee_oracle.quote(web3, chain_name, fee_level, snapshot, eip1559=False if is_poa else None)
+    print(fees)
+
+    # Строим транзакцию
+    return {
+        'from': account_address,
+        'to': account_address,
+        'value': amount_wei,
+        'nonce': snapshot.nonce,
+        'gas': gas_limit,
+        'chainId': snapshot.chain_id,
+        **fees.tx_fields(),
     }
-    strategy = gas_strategies.get(fee_level.lower(), medium_gas_price_strategy)
-    web3.eth.set_gas_price_strategy(strategy)
-    gas_limit = int(gas_estimate * 1.1)  # 10% запас
-    try:
-        max_priority_fee = web3.eth.max_priority_fee  # Рекомендуемая приоритетная комиссия
-    except ValueError:
-        max_priority_fee = web3.to_wei('2', 'gwei')  # Запасное значение
-    
-    if is_poa_network(web3):
-        try:
-            gas_price = web3.eth.gas_price
-            print(f"Gas Price: {web3.from_wei(gas_price, 'gwei')} gwei")
-            tx_param = {
-                'from': account_address,
-                'to': account_address,
-                'value': amount_wei,
-                'nonce': nonce,
-                'gas': gas_limit,
-                'gasPrice': gas_price,
-                'chainId': chain_id
-            }
-        except Exception as e:
-            print(f'ошибка при создании транзакции для POA:\n{e}')
-            exit()
-    else:
-        try:
-            base_fee = web3.eth.get_block('latest')['baseFeePerGas']
-            max_fee_per_gas = base_fee + max_priority_fee
-            max_fee_limit = web3.to_wei('200', 'gwei')
-            print(f"Базовая комиссия: {web3.from_wei(base_fee, 'gwei')} gwei")
-            print(f"Приоритетная комиссия: {web3.from_wei(max_priority_fee, 'gwei')} gwei")
-            print(f"Максимальная комиссия: {web3.from_wei(max_fee_per_gas, 'gwei')} gwei")
-
-            if max_fee_per_gas > max_fee_limit:
-                print("Комиссия слишком высокая, транзакция не отправлена")
-                exit()
-            
-            # Строим транзакцию
-            tx_param = {
-                'maxPriorityFeePerGas': max_priority_fee,
-                'maxFeePerGas': max_fee_per_gas,
-                'from': account_address,
-                'to': account_address,
-                'value': amount_wei,
-                'nonce': nonce,
-                'gas': gas_limit,
-                'chainId': chain_id
-            }
-        except Exception as e:
-            print(f'ошибка при создании транзакции для POS:\n{e}')
-            exit()
-    return tx_param
 
-def send_token(chain_name, _count=5):
+def send_token(chain_name, _count=5, receipt_timeout=180, confirm=True):
+    # confirm=False - вернуться сразу после отправки, квитанции сверит reconciler
     web3 = getWeb3(chain_name)
     if not web3:
         return
@@ -110,42 +90,203 @@ def send_token(chain_name, _count=5):
     account_address = config.main_addr
     # Преобразуем в checksum-формат
     account_address = Web3.to_checksum_address(account_address)
-    # Получаем chainId
-    chain_id = web3.eth.chain_id
-    print(f"\nПодключено к {chain_name} ID: {chain_id}")
-    native_token = 'ETH' # добавить функцию получение имени токена
+    profile = chain_profile.get_profile(web3, chain_name)
+    native_token = profile['native_token']
 
-    balance_eth = get_balance(web3, account_address)
-    print(f"Баланс: {balance_eth} ETH")
+    # Транзакции прерванного запуска: подтверждённые не повторяем, отправленные - ждём
+    try:
+        confirmed, resumed = journal.reconcile(web3, chain_name, 'send')
+    except Exception as e:
+        print(f'обработанная ошибка сверки журнала в {chain_name}:\n{e}')
+        return
+    _count -= len(confirmed) + len(resumed)
+    if confirmed or resumed:
+        print(f"{chain_name}: из журнала подтверждено {len(confirmed)}, в пути {len(resumed)}")
 
     # Конвертируем 0.00001 токена в wei
     amount_wei = web3.to_wei(0.00001, 'ether')
-    nonce = web3.eth.get_transaction_count(account_address)
-    for i in range(_count):
+    snapshot, base_params = None, None
+    estimate_tx = {'from': account_address, 'to': account_address, 'value': amount_wei}
+    if _count > 0:
+        # Параметры газа считаем один раз на всю пачку
         try:
-            tx_params = get_tx_param(web3, account_address, chain_id, amount_wei, nonce)
-            # Подписываем транзакцию
-            signed_tx = web3.eth.account.sign_transaction(tx_params, private_key)
-            # Отправляем транзакцию
-            tx_hash = web3.eth.send_raw_transaction(signed_tx.raw_transaction)
-            print(f"Транзакция отправлена: {tx_hash.hex()}")
-
-            # Ждём подтверждения
-            receipt = web3.eth.wait_for_transaction_receipt(tx_hash)
-            if receipt.status == 1:
-                nonce += 1
-                print(f"Транзакция подтверждена в блоке: {receipt.blockNumber}\n")
-            else:
-                print("Транзакция провалилась\n")
+            # chainId, баланс, nonce, комиссии - одним батч-запросом, оценка газа - из кэша
+            with metrics.phase(chain_name, 'preflight', 'send'):
+                snapshot = gas_cache.fetch(web3, chain_name, account_address, estimate_tx)
+            print(f"\nПодключено к {chain_name} ID: {snapshot.chain_id}")
+            print(f"Баланс: {web3.from_wei(snapshot.balance, 'ether')} {native_token}")
+            base_params = get_tx_param(web3, chain_name, account_address, amount_wei, snapshot,
+                                       is_poa=profile['is_poa'] or not profile['eip1559'])
         except Exception as e:
-            print(f'обработанная ошибка в цикле функции send_token:\n{e}')
+            print(f'обработанная ошибка в функции send_token:\n{e}')
+            return
+
+    # Новые nonce - строго после переотправленных, даже если нода ещё не видит их в pending
+    start_nonce = max([snapshot.nonce if snapshot else 0] + [row['nonce'] + 1 for row in resumed])
+    allocator = NonceAllocator(web3, account_address, start_nonce=start_nonce,
+                               chain_name=chain_name, flow='send')
+    allocator.resume(resumed)
+
+    if _count > 0:
+        # Подписываем всю пачку заранее на диапазоне nonce одним снимком комиссий;
+        # каждая подписанная транзакция попадает в журнал до отправки
+        with metrics.phase(chain_name, 'sign', 'send'):
+            queue = presign.PresignedQueue(private_key, base_params, fee_oracle.FeeQuote.from_tx(base_params),
+                                           allocator.allocate_range(_count), _count,
+                                           web3=web3, chain_name=chain_name, urgency='low')
+
+        # Отправляем подряд, не дожидаясь подтверждений. Очередь отдаёт транзакции по одной:
+        # если отправка затянулась и комиссии ушли за порог, остаток переподписывается
+        with metrics.phase(chain_name, 'broadcast', 'send'):
+            for nonce in queue.feed(allocator):
+                tx_hash = allocator.broadcast(nonce)
+                if tx_hash:
+                    print(f"Транзакция отправлена: {tx_hash.hex()} (nonce {nonce})")
+            if queue.resigned:
+                print(f"{chain_name}: комиссии сдвинулись, очередь переподписана {queue.resigned} раз")
+    if not confirm:
+        print()
+        return {}
+
+    # Собираем квитанции вместе
+    tracker = receipt_tracker.get_tracker(web3, chain_name)
+    gas_estimate = snapshot.gas_estimate if snapshot else None
+    # Транзакция, застрявшая дольше срока сети, заменяется с поднятыми комиссиями -
+    # следующие nonce за ней не стоят до таймаута
+    replacer = replacement.Replacer(web3, chain_name, private_key, account_address, flow='send')
+    with metrics.phase(chain_name, 'confirm', 'send'):
+        receipts = allocator.wait_all(tracker, timeout=receipt_timeout,
+                                      from_block=snapshot.block_number if snapshot else None, replacer=replacer)
+    fee_cap = fee_oracle.fee_cap(chain_name)
+    for nonce in sorted(receipts):
+        receipt = receipts[nonce]
+        if base_params:
+            gas_cache.learn(chain_name, estimate_tx, receipt, base_params['gas'])
+        metrics.record_tx(chain_name, 'send', receipt['transactionHash'], receipt,
+                          gas_estimate, base_params, fee_cap)
+        if receipt.status == 1:
+            print(f"Транзакция nonce {nonce} подтверждена в блоке: {receipt.blockNumber}")
+        else:
+            print(f"Транзакция nonce {nonce} провалилась")
+    for nonce in sorted(allocator.in_flight):
+        metrics.record_tx(chain_name, 'send', allocator.in_flight[nonce]['hash'], None,
+                          gas_estimate, base_params, fee_cap)
+        print(f"Транзакция nonce {nonce} не подтверждена за {receipt_timeout} сек")
+    print()
+    return receipts
+
+def send_token_batch(chain_name, _count=5, receipt_timeout=180):
+    """_count переводов одной транзакцией через Multicall3 вместо пачки по nonce."""
+    web3 = getWeb3(chain_name)
+    if not web3:
+        return
+    private_key = config.PRIVATE_KEY_MAIN
+    if not private_key:
+        print("Приватный ключ не найден")
+        return
+    account_address = Web3.to_checksum_address(config.main_addr)
+    profile = chain_profile.get_profile(web3, chain_name)
+    amount_wei = web3.to_wei(0.00001, 'ether')
+    # Прерванный запуск: подтверждённую пачку не повторяем, отправленную - ждём
+    try:
+        confirmed, resumed = journal.reconcile(web3, chain_name, 'send_batch')
+    except Exception as e:
+        print(f'обработанная ошибка сверки журнала в {chain_name}:\n{e}')
+        return
+    if confirmed:
+        print(f"{chain_name}: пачка из журнала подтверждена в блоке {confirmed[-1]['block']}\n")
+        return
+    if resumed:
+        row = resumed[-1]
+        print(f"{chain_name}: ждём пачку из журнала {row['hash']}")
+        return _wait_batch(web3, chain_name, private_key, account_address, row['hash'], row['raw'], row['nonce'],
+                           receipt_timeout)
+    try:
+        aggregator = multicall.ensure(web3, chain_name)
+        if not aggregator:
+            print(f'нет Multicall3 в {chain_name}')
+            return
+        # Агрегатор пересылает value каждого вызова на наш же адрес
+        batch = multicall.encode_batch(web3, aggregator, [(account_address, amount_wei, b'')] * _count)
+        estimate_tx = dict(batch, **{'from': account_address})
+        with metrics.phase(chain_name, 'preflight', 'send_batch'):
+            snapshot = gas_cache.fetch(web3, chain_name, account_address, estimate_tx)
+        print(f"\nПодключено к {chain_name} ID: {snapshot.chain_id}")
+        print(f"Баланс: {web3.from_wei(snapshot.balance, 'ether')} {profile['native_token']}")
+        tx = multicall.build_tx(web3, chain_name, batch, account_address, snapshot, urgency='low',
+                                eip1559=False if profile['is_poa'] or not profile['eip1559'] else None)
+    except Exception as e:
+        print(f'обработанная ошибка в функции send_token_batch:\n{e}')
+        return
+
+    # Подписываем, пишем в журнал и только потом отправляем
+    signed_tx = web3.eth.account.sign_transaction(tx, private_key)
+    journal.record(chain_name, 'send_batch', account_address, tx['nonce'], signed_tx.raw_transaction, signed_tx.hash)
+    tx_hash = web3.eth.send_raw_transaction(signed_tx.raw_transaction)
+    journal.mark(chain_name, tx_hash, 'sent')
+    print(f"Транзакция отправлена: {tx_hash.hex()} ({_count} переводов)")
+    return _wait_batch(web3, chain_name, private_key, account_address, tx_hash, signed_tx.raw_transaction,
+                       tx['nonce'], receipt_timeout, snapshot, tx, estimate_tx)
 
-def main(chain_list):
+def _wait_batch(web3, chain_name, private_key, account_address, tx_hash, raw, nonce, receipt_timeout,
+                snapshot=None, tx=None, estimate_tx=None):
+    gas_estimate = snapshot.gas_estimate if snapshot else None
+    try:
+        replacer = replacement.Replacer(web3, chain_name, private_key, account_address, flow='send_batch')
+        receipt = replacer.wait(receipt_tracker.get_tracker(web3, chain_name), tx_hash, raw, nonce,
+                                timeout=receipt_timeout, from_block=snapshot.block_number if snapshot else None)
+    except TimeoutError as e:
+        # Запись остаётся в журнале - следующий запуск дождётся её, а не отправит пачку заново
+        metrics.record_tx(chain_name, 'send_batch', tx_hash, None, gas_estimate, tx,
+                          fee_oracle.fee_cap(chain_name))
+        print(f'{e}\n')
+        return
+    journal.mark_receipt(chain_name, receipt)
+    if tx:
+        gas_cache.learn(chain_name, estimate_tx, receipt, tx['gas'])
+    metrics.record_tx(chain_name, 'send_batch', receipt.transactionHash, receipt, gas_estimate, tx,
+                      fee_oracle.fee_cap(chain_name))
+    if receipt.status == 1:
+        print(f"Транзакция подтверждена в блоке: {receipt.blockNumber}\n")
+    else:
+        print("Транзакция провалилась\n")
+    return receipt
+
+def main(chain_list, batched=False, _count=5, confirm=True):
+    # batched - все переводы сети одной транзакцией через Multicall3 (всегда с ожиданием)
+    # confirm=False - только отправка, подтверждения собирает reconciler
+    # Сети без средств на пачку переводов отсеиваем одним параллельным опросом
+    chain_list = readiness.filter_ready(chain_registry.select(chain_list, 'send'), 'send')
+    if batched:
+        # Пачки - свой поток журнала: одна подтверждённая транзакция на сеть
+        journal.start_run('send_batch')
+        done = journal.completed('send_batch')
+        for name in chain_list:
+            if done.get(name) and not journal.has_pending('send_batch', name):
+                print(f'{name}: уже выполнено в этом запуске, пропускаем')
+                continue
+            send_token_batch(name, _count)
+        done = journal.completed('send_batch')
+        if all(done.get(name) for name in chain_list):
+            journal.finish_run('send_batch')
+        return
+    # Прерванный запуск продолжается: сети, где всё уже подтверждено, пропускаем без RPC
+    journal.start_run('send', detached=not confirm)
+    done = journal.completed('send')
     for name in chain_list:
-        send_token(name)
+        count = _count - done.get(name, 0)
+        if count <= 0 and not journal.has_pending('send', name):
+            print(f'{name}: уже выполнено в этом запуске, пропускаем')
+            continue
+        send_token(name, count, confirm=confirm)
+    if not confirm:
+        print(f'подтверждения не ждали - статусы соберёт reconciler ({reconciler.RESULTS_PATH})')
+        return
+    done = journal.completed('send')
+    if all(done.get(name, 0) >= _count for name in chain_list):
+        journal.finish_run('send')
 
 if __name__ == "__main__":
-    #chain_list = ['irys', 'eth_sepolia', 'monad', 'mega', 'somnia', 'rise', 'base_sepolia', 'moca', 'kite', 'incentiv', 'camp', 'pharos', '0g', 'sahara', 'nexus']
-    chain_list = ['somnia', ] 
+    chain_list = chain_registry.defaults('send_token', 'send')
     main(chain_list)
     print(f'script done\n\n')
\ No newline at end of file
@@ -0,0 +1,286 @@
+# Локальная замена RPC сети для бенчмарков и проверок без тестнетов:
+# JSON-RPC сервер поверх eth-tester (или прокси к anvil) с настраиваемым
+# временем блока, задержкой ответа и долей отказов.
+import json
+import random
+import re
+import shutil
+import socket
+import subprocess
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.request import Request, urlopen
+
+
+# Номер аргумента с блоком для методов eth-tester (ему нужен int, а не hex)
+BLOCK_ARG = {
+    'eth_getBalance': 1,
+    'eth_getTransactionCount': 1,
+    'eth_getCode': 1,
+    'eth_getBlockByNumber': 0,
+    'eth_getBlockReceipts': 0,
+    'eth_call': 1,
+    'eth_estimateGas': 1,
+    'eth_feeHistory': 1,
+}
+TX_INT_FIELDS = ('value', 'gas', 'gasPrice', 'nonce', 'maxFeePerGas', 'maxPriorityFeePerGas', 'chainId',
+                 'fromBlock', 'toBlock')
+
+
+def _camel(key):
+    return re.sub(r'_([a-z0-9])', lambda m: m.group(1).upper(), key)
+
+def _snake(key):
+    return re.sub(r'([A-Z])', lambda m: '_' + m.group(1).lower(), key)
+
+def _to_json(value):
+    # eth-tester отдаёт python-типы и snake_case, RPC - hex и camelCase
+    if isinstance(value, bool) or value is None or isinstance(value, str):
+        return value
+    if isinstance(value, int):
+        return hex(value)
+    if isinstance(value, (bytes, bytearray)):
+        return '0x' + bytes(value).hex()
+    if isinstance(value, dict):
+        return {_camel(key): _to_json(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_json(item) for item in value]
+    return value
+
+def _decode(raw):
+    from eth_account._utils.legacy_transactions import Transaction
+    from eth_account.typed_transactions import TypedTransaction
+    from hexbytes import HexBytes
+    raw = HexBytes(raw)
+    return (TypedTransaction if raw[0] <= 0x7f else Transaction).from_bytes(raw).as_dict()
+
+def _fees(raw):
+    tx = _decode(raw)
+    if 'maxFeePerGas' in tx:
+        return tx['maxFeePerGas'], tx['maxPriorityFeePerGas']
+    return (tx['gasPrice'],)
+
+def _price(raw):
+    return _fees(raw)[0]
+
+def _sender_nonce(raw):
+    from eth_account import Account
+    return Account.recover_transaction(raw), _decode(raw)['nonce']
+
+def _from_json(method, params):
+    params = list(params)
+    index = BLOCK_ARG.get(method)
+    if index is not None and index < len(params):
+        block = params[index]
+        if isinstance(block, str) and block.startswith('0x'):
+            params[index] = int(block, 16)
+    if method == 'eth_feeHistory' and isinstance(params[0], str):
+        params[0] = int(params[0], 16)
+    for i, param in enumerate(params):
+        if isinstance(param, dict):
+            params[i] = {
+                _snake(key): int(item, 16) if key in TX_INT_FIELDS and isinstance(item, str) else item
+                for key, item in param.items()
+            }
+    return params
+
+
+class EthTesterBackend:
+    """Цепочка в памяти процесса на eth-tester/py-evm."""
+
+    def __init__(self, block_time=0):
+        from web3.providers.eth_tester import EthereumTesterProvider
+        self.provider = EthereumTesterProvider()
+        self.tester = self.provider.ethereum_tester
+        self.block_time = block_time
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        # Мемпул: хэш -> сырая транзакция, в порядке поступления
+        self._mempool = {}
+        # Транзакции дешевле этой цены газа в блок не включаются (застревают)
+        self.min_price = 0
+        if block_time:
+            threading.Thread(target=self._mine_loop, daemon=True).start()
+
+    def _mine_loop(self):
+        # eth-tester принимает только следующий nonce относительно последнего блока,
+        # поэтому очередь держим сами и раз в block_time включаем всё, что готово
+        while not self._stop.wait(self.block_time):
+            with self._lock:
+                # Пустой блок, если включать нечего (автомайнинг даёт блок на транзакцию)
+                if not self._mempool:
+                    self.tester.mine_blocks(1)
+                progress = True
+                while self._mempool and progress:
+                    progress = False
+                    for tx_hash, raw in list(self._mempool.items()):
+                        if _price(raw) < self.min_price:
+                            continue
+                        try:
+                            self.provider.make_request('eth_sendRawTransaction', [raw])
+                        except Exception as e:
+                            if 'nonce' in str(e).lower() and 'expected' in str(e).lower():
+                                continue
+                        # Включена или заведомо невалидна - из мемпула убираем
+                        del self._mempool[tx_hash]
+                        progress = True
+
+    def _queue(self, method, params):
+        # Ответы для транзакций, ещё не попавших в блок, как у geth
+        from eth_utils import keccak
+        if method == 'eth_sendRawTransaction':
+            tx_hash = '0x' + keccak(hexstr=params[0]).hex()
+            if tx_hash in self._mempool:
+                return {'error': {'code': -32000, 'message': 'already known'}}
+            # Замена по тому же отправителю и nonce - только с комиссиями хотя бы +10%
+            key = _sender_nonce(params[0])
+            for old_hash, old_raw in list(self._mempool.items()):
+                if _sender_nonce(old_raw) != key:
+                    continue
+                if any(new < old * 1.1 for old, new in zip(_fees(old_raw), _fees(params[0]))):
+                    return {'error': {'code': -32000, 'message': 'replacement transaction underpriced'}}
+                del self._mempool[old_hash]
+            self._mempool[tx_hash] = params[0]
+            return {'result': tx_hash}
+        if method == 'eth_getTransactionByHash' and params[0].lower() in self._mempool:
+            return {'result': {'hash': params[0], 'blockNumber': None, 'blockHash': None}}
+        return None
+
+    def fund(self, address, amount_wei):
+        with self._lock:
+            sender = self.tester.get_accounts()[0]
+            self.tester.send_transaction({'from': sender, 'to': address, 'value': amount_wei, 'gas': 21000})
+
+    def handle(self, request):
+        method, params = request['method'], request.get('params') or []
+        with self._lock:
+            if self.block_time:
+                queued = self._queue(method, params)
+                if queued is not None:
+                    return queued
+            try:
+                response = self.provider.make_request(method, _from_json(method, params))
+            except Exception as e:
+                return {'error': {'code': -32000, 'message': str(e)}}
+        if 'error' in response:
+            error = response['error']
+            return {'error': error if isinstance(error, dict) else {'code': -32000, 'message': str(error)}}
+        return {'result': _to_json(response.get('result'))}
+
+    def close(self):
+        self._stop.set()
+
+
+class AnvilBackend:
+    """anvil в отдельном процессе, запросы проксируются как есть."""
+
+    def __init__(self, block_time=0, chain_id=31337):
+        port = _free_port()
+        command = ['anvil', '--port', str(port), '--chain-id', str(chain_id), '--silent']
+        if block_time:
+            command += ['--block-time', str(block_time)]
+        self.process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        self.url = f'http://127.0.0.1:{port}'
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline:
+            try:
+                self.handle({'method': 'eth_chainId', 'params': []})
+                break
+            except OSError:
+                time.sleep(0.1)
+
+    def fund(self, address, amount_wei):
+        self.handle({'method': 'anvil_setBalance', 'params': [address, hex(amount_wei)]})
+
+    def handle(self, request):
+        body = json.dumps({'jsonrpc': '2.0', 'id': 1, **request}).encode()
+        with urlopen(Request(self.url, body, {'Content-Type': 'application/json'}), timeout=30) as response:
+            payload = json.loads(response.read())
+        payload.pop('jsonrpc', None)
+        payload.pop('id', None)
+        return payload
+
+    def close(self):
+        self.process.terminate()
+        self.process.wait(timeout=10)
+
+
+class StandinChain:
+    """JSON-RPC сервер одной сети с инъекцией задержек и отказов."""
+
+    def __init__(self, backend='eth-tester', block_time=0, latency=0.0, fail_rate=0.0, seed=None):
+        if backend == 'anvil':
+            self.backend = AnvilBackend(block_time)
+        else:
+            self.backend = EthTesterBackend(block_time)
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self._random = random.Random(seed)
+        self._calls_lock = threading.Lock()
+        self.calls = {}
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler_class())
+        self.server.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def _count(self, method):
+        with self._calls_lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+
+    def _answer(self, request):
+        self._count(request.get('method'))
+        response = self.backend.handle(request)
+        return {'jsonrpc': '2.0', 'id': request.get('id'), **response}
+
+    def _handler_class(self):
+        chain = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                if chain.latency:
+                    time.sleep(chain.latency)
+                if chain.fail_rate and chain._random.random() < chain.fail_rate:
+                    self.send_response(503)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                if isinstance(body, list):
+                    payload = [chain._answer(request) for request in body]
+                else:
+                    payload = chain._answer(body)
+                data = json.dumps(payload).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+    def fund(self, address, amount_wei=10**21):
+        self.backend.fund(address, amount_wei)
+
+    def reset_calls(self):
+        with self._calls_lock:
+            self.calls = {}
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.backend.close()
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def anvil_available():
+    return shutil.which('anvil') is not None
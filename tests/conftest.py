@@ -0,0 +1,82 @@
+import os
+import sys
+import tempfile
+import time
+import types
+
+from eth_account import Account
+
+PACKAGE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, PACKAGE_DIR)
+
+# config.py пользователя лежит уровнем выше пакета и содержит ключи - в тестах
+# подставляем свой, а все файлы состояния уводим во временный каталог
+_state_dir = tempfile.mkdtemp(prefix='onchaingm-tests-')
+config = types.ModuleType('config')
+config.PRIVATE_KEY_MAIN = '0x' + '42' * 32
+config.main_addr = Account.from_key(config.PRIVATE_KEY_MAIN).address
+config.rpc_name_dict = {}
+config.JOURNAL_PATH = os.path.join(_state_dir, 'journal.sqlite3')
+config.GM_INDEX_PATH = os.path.join(_state_dir, 'gm_index.sqlite3')
+config.RESULTS_PATH = os.path.join(_state_dir, 'tx_results.json')
+config.GAS_CACHE_PATH = os.path.join(_state_dir, 'gas_cache.json')
+config.CHAIN_PROFILES_PATH = os.path.join(_state_dir, 'chain_profiles.json')
+config.DEPLOYMENTS_PATH = os.path.join(_state_dir, 'deployments.json')
+config.SCHEDULER_STATE_PATH = os.path.join(_state_dir, 'scheduler_state.json')
+sys.modules['config'] = config
+
+import pytest
+from web3 import HTTPProvider, Web3
+
+from standin_rpc import StandinChain
+
+# Стенд-сеть выступает под именем сети из реестра
+CHAIN = 'monad'
+PRICE = 2 * 10**9         # цена газа тестовых переводов, выше base fee стенда
+
+
+@pytest.fixture
+def journal_db(monkeypatch, tmp_path):
+    """Пустой журнал на тест: свой файл, без соединений и запусков прошлых тестов."""
+    import journal
+    monkeypatch.setattr(journal, 'JOURNAL_PATH', str(tmp_path / 'journal.sqlite3'))
+    monkeypatch.setattr(journal, '_runs', {})
+    journal._local.__dict__.clear()
+    yield journal
+    journal._local.__dict__.clear()
+
+@pytest.fixture
+def chain(monkeypatch):
+    """Стенд-сеть с мемпулом (блок раз в 0.2 сек); min_price держит транзакции в мемпуле."""
+    standin = StandinChain(block_time=0.2)
+    standin.fund(config.main_addr, 10**21)
+    monkeypatch.setattr(config, 'rpc_name_dict', {CHAIN: standin.url})
+    yield standin
+    standin.close()
+
+@pytest.fixture
+def web3(chain):
+    return Web3(HTTPProvider(chain.url))
+
+@pytest.fixture
+def sign(web3):
+    """sign(nonce, price, to) - подписанный перевод основного аккаунта."""
+    chain_id = web3.eth.chain_id
+
+    def sign(nonce, price=PRICE, to=None):
+        tx = {'to': to or config.main_addr, 'value': 1, 'gas': 21000, 'nonce': nonce, 'chainId': chain_id,
+              'maxFeePerGas': price, 'maxPriorityFeePerGas': price}
+        return Account.sign_transaction(tx, config.PRIVATE_KEY_MAIN)
+    return sign
+
+def wait_nonce(web3, nonce, timeout=10):
+    """Ждёт, пока подтверждённый nonce основного аккаунта дойдёт до nonce."""
+    deadline = time.monotonic() + timeout
+    while web3.eth.get_transaction_count(config.main_addr) < nonce:
+        assert time.monotonic() < deadline, f'nonce {nonce} не подтверждён за {timeout} сек'
+        time.sleep(0.05)
+
+def restart(journal):
+    """Как новый процесс после падения: ни соединений, ни текущих запусков в памяти."""
+    journal._runs.clear()
+    journal._local.__dict__.clear()
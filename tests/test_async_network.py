@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+
+import async_network
+import chain_profile
+import config
+from async_network import AsyncNetworkHandler, NetworkHandlerError
+from standin_rpc import StandinChain
+
+BALANCE = 10**21
+
+
+@pytest.fixture
+def chains(monkeypatch, tmp_path):
+    """Две локальные сети под именами из реестра и пустой кэш профилей."""
+    standins = {'monad': StandinChain(), 'mega': StandinChain()}
+    for chain in standins.values():
+        chain.fund(config.main_addr, BALANCE)
+    monkeypatch.setattr(config, 'rpc_name_dict', {name: chain.url for name, chain in standins.items()})
+    monkeypatch.setattr(chain_profile, 'PROFILE_PATH', str(tmp_path / 'profiles.json'))
+    monkeypatch.setattr(chain_profile, '_profiles', None)
+    yield standins
+    for chain in standins.values():
+        chain.close()
+
+def _run(coro):
+    async def main():
+        try:
+            return await coro
+        finally:
+            await async_network.close_sessions()
+    return asyncio.run(main())
+
+def test_create_profiles_chain(chains):
+    handler = _run(AsyncNetworkHandler.create('monad'))
+    assert handler.chain_id == chain_profile.cached('monad')['chain_id']
+    assert handler.is_pos
+    assert handler.web3 is not None
+
+def test_balance_and_snapshot(chains):
+    async def scenario():
+        handler = await AsyncNetworkHandler.create('monad')
+        return await handler.get_balance(), await handler.fetch_snapshot()
+    balance, snapshot = _run(scenario())
+    assert balance == BALANCE
+    assert snapshot.balance == BALANCE
+    assert snapshot.nonce == 0
+    assert snapshot.base_fee is not None
+
+def test_tx_params(chains):
+    async def scenario():
+        handler = await AsyncNetworkHandler.create('mega')
+        return handler, await handler.get_tx_params(21000)
+    handler, params = _run(scenario())
+    assert params['chainId'] == handler.chain_id
+    assert params['nonce'] == 0 and params['gas'] == 21000
+    assert params['maxFeePerGas'] >= params['maxPriorityFeePerGas']
+
+def test_connect_all_skips_unreachable(chains, monkeypatch):
+    monkeypatch.setitem(config.rpc_name_dict, 'rise', 'http://127.0.0.1:1')
+    handlers = _run(async_network.connect_all(['monad', 'rise', 'mega']))
+    assert sorted(handlers) == ['mega', 'monad']
+
+def test_missing_rpc(chains):
+    with pytest.raises(NetworkHandlerError):
+        _run(AsyncNetworkHandler.create('no_such_chain'))
+
+def test_sync_wrapper(chains):
+    import create_token_class
+    handler = create_token_class.NetworkHandler('monad')
+    assert handler.get_balance() == BALANCE
+    assert handler.web3.eth.chain_id == handler.chain_id
@@ -0,0 +1,88 @@
+import types
+
+from web3 import Web3
+
+from conftest import CHAIN, config, restart, wait_nonce
+
+FLOW = 'gm'
+OTHER = '0x' + '11' * 20  # получатель чужой транзакции с тем же nonce
+
+
+class LaggingReceipts:
+    """Провайдер, первые lag батчей квитанций которого отвечает отстающая нода (null)."""
+
+    def __init__(self, provider, lag=1):
+        self.provider = provider
+        self.lag = lag
+        self.receipt_batches = 0
+
+    def make_request(self, method, params):
+        return self.provider.make_request(method, params)
+
+    def make_batch_request(self, requests):
+        responses = self.provider.make_batch_request(requests)
+        if all(method == 'eth_getTransactionReceipt' for method, _ in requests):
+            self.receipt_batches += 1
+            if self.receipt_batches <= self.lag:
+                return [dict(response, result=None) for response in responses]
+        return responses
+
+
+def _statuses(journal):
+    return {row['hash']: row['status'] for row in journal.entries(FLOW)}
+
+def test_resume_after_crash_resends_instead_of_signing_again(journal_db, web3, sign):
+    journal = journal_db
+    run = journal.start_run(FLOW)
+    signed = sign(0)
+    journal.record(CHAIN, FLOW, config.main_addr, 0, signed.raw_transaction, signed.hash)
+    # Процесс упал между записью в журнал и отправкой
+    restart(journal)
+    assert journal.start_run(FLOW) == run
+
+    confirmed, pending = journal.reconcile(web3, CHAIN, FLOW)
+    assert confirmed == []
+    assert [row['hash'] for row in pending] == [Web3.to_hex(signed.hash)]
+    wait_nonce(web3, 1)
+
+    # Второе падение - уже после включения в блок
+    restart(journal)
+    assert journal.start_run(FLOW) == run
+    confirmed, pending = journal.reconcile(web3, CHAIN, FLOW)
+    assert [row['status'] for row in confirmed] == ['confirmed']
+    assert pending == []
+    assert journal.completed(FLOW) == {CHAIN: 1}
+    assert not journal.has_pending(FLOW, CHAIN)
+    assert web3.eth.get_transaction_count(config.main_addr) == 1
+
+def test_nonce_taken_by_another_tx_is_dropped(journal_db, web3, sign):
+    journal = journal_db
+    journal.start_run(FLOW)
+    ours = sign(0)
+    journal.record(CHAIN, FLOW, config.main_addr, 0, ours.raw_transaction, ours.hash)
+    journal.mark(CHAIN, ours.hash, 'sent')
+    # nonce занят транзакцией, которой нет в журнале (например, отправленной из кошелька)
+    web3.eth.send_raw_transaction(sign(0, to=OTHER).raw_transaction)
+    wait_nonce(web3, 1)
+
+    assert journal.reconcile(web3, CHAIN, FLOW) == ([], [])
+    assert _statuses(journal) == {Web3.to_hex(ours.hash): 'dropped'}
+    assert not journal.has_pending(FLOW, CHAIN)
+
+def test_tx_mined_between_queries_is_not_dropped(journal_db, web3, sign):
+    journal = journal_db
+    journal.start_run(FLOW)
+    signed = sign(0)
+    journal.record(CHAIN, FLOW, config.main_addr, 0, signed.raw_transaction, signed.hash)
+    web3.eth.send_raw_transaction(signed.raw_transaction)
+    journal.mark(CHAIN, signed.hash, 'sent')
+    wait_nonce(web3, 1)
+
+    # nonce уже занят, а первый батч квитанций пустой - как будто транзакцию
+    # включили между запросами или ответила отстающая нода
+    lagging = types.SimpleNamespace(provider=LaggingReceipts(web3.provider))
+    confirmed, pending = journal.reconcile(lagging, CHAIN, FLOW)
+    assert lagging.provider.receipt_batches == 2
+    assert [row['hash'] for row in confirmed] == [Web3.to_hex(signed.hash)]
+    assert pending == []
+    assert _statuses(journal) == {Web3.to_hex(signed.hash): 'confirmed'}
@@ -0,0 +1,39 @@
+import pytest
+
+import reconciler
+from conftest import CHAIN, config, restart
+
+FLOW = 'send'
+
+
+@pytest.fixture(autouse=True)
+def results_path(monkeypatch, tmp_path):
+    monkeypatch.setattr(reconciler, 'RESULTS_PATH', str(tmp_path / 'tx_results.json'))
+
+def _send(journal, web3, sign, detached):
+    run = journal.start_run(FLOW, detached=detached)
+    signed = sign(0)
+    journal.record(CHAIN, FLOW, config.main_addr, 0, signed.raw_transaction, signed.hash)
+    web3.eth.send_raw_transaction(signed.raw_transaction)
+    journal.mark(CHAIN, signed.hash, 'sent')
+    return run
+
+def test_reconciler_closes_confirm_false_run(journal_db, web3, sign):
+    journal = journal_db
+    run = _send(journal, web3, sign, detached=True)
+    # Сверка в отдельном процессе: запуск подхватывается из журнала
+    restart(journal)
+
+    assert reconciler.run([FLOW], timeout=10, interval=0.2) == 0
+    assert journal.current_run(FLOW) is None
+    assert [row['status'] for row in reconciler.results(FLOW, run)] == ['confirmed']
+
+def test_reconciler_keeps_confirm_true_run_open(journal_db, web3, sign):
+    journal = journal_db
+    run = _send(journal, web3, sign, detached=False)
+    restart(journal)
+
+    assert reconciler.run([FLOW], timeout=10, interval=0.2) == 0
+    # Закрывает его сам сценарий - после повторного запуска он не повторит выполненное
+    assert journal.current_run(FLOW) == run
+    assert journal.completed(FLOW) == {CHAIN: 1}
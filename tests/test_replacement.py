@@ -0,0 +1,81 @@
+import threading
+import time
+
+import pytest
+from web3 import Web3
+
+import replacement
+from conftest import CHAIN, config
+from nonce_manager import NonceAllocator
+from receipt_tracker import ReceiptTracker
+
+FLOW = 'gm'
+HOLD = 10**18  # min_price стенда, при которой в блок не попадает ни одна версия
+
+
+@pytest.fixture
+def tracker(web3):
+    tracker = ReceiptTracker(web3, poll_interval=0.1)
+    yield tracker
+    tracker.stop()
+
+def _original_lands(journal, chain, replacer, original):
+    """Когда замена отправлена, в блок попадает исходная транзакция.
+
+    Так бывает, если исходная дошла до валидатора раньше замены: стенд
+    сразу включает исходную в блок, а замену выкидывает из мемпула.
+    """
+    def land():
+        while sorted(row['status'] for row in journal.entries(FLOW)) != ['replaced', 'sent']:
+            time.sleep(0.02)
+        replacer.bumps[0] = replacement.MAX_BUMPS
+        with chain.backend._lock:
+            chain.backend._mempool.clear()
+            chain.backend.provider.make_request('eth_sendRawTransaction', [original.raw_transaction.to_0x_hex()])
+    thread = threading.Thread(target=land, daemon=True)
+    thread.start()
+    return thread
+
+def _check_original_won(journal, receipt, original):
+    statuses = {row['hash']: row['status'] for row in journal.entries(FLOW)}
+    original_hash = Web3.to_hex(original.hash)
+    assert Web3.to_hex(receipt['transactionHash']) == original_hash
+    assert statuses.pop(original_hash) == 'confirmed'
+    # Проигравшая замена больше не считается в пути
+    assert list(statuses.values()) == ['dropped']
+    assert not journal.has_pending(FLOW, CHAIN)
+
+def test_replacer_wait_original_wins(journal_db, chain, web3, sign, tracker):
+    journal = journal_db
+    chain.backend.min_price = HOLD
+    journal.start_run(FLOW)
+    original = sign(0)
+    journal.record(CHAIN, FLOW, config.main_addr, 0, original.raw_transaction, original.hash)
+    tx_hash = web3.eth.send_raw_transaction(original.raw_transaction)
+    journal.mark(CHAIN, tx_hash, 'sent')
+    replacer = replacement.Replacer(web3, CHAIN, config.PRIVATE_KEY_MAIN, config.main_addr, FLOW, deadline=0.3)
+    thread = _original_lands(journal, chain, replacer, original)
+
+    receipt = replacer.wait(tracker, tx_hash, original.raw_transaction, 0, timeout=15)
+    thread.join()
+    journal.mark_receipt(CHAIN, receipt)
+    _check_original_won(journal, receipt, original)
+    assert not tracker._pending
+
+def test_wait_all_original_wins(journal_db, chain, web3, sign, tracker):
+    journal = journal_db
+    chain.backend.min_price = HOLD
+    journal.start_run(FLOW)
+    allocator = NonceAllocator(web3, config.main_addr, chain_name=CHAIN, flow=FLOW)
+    nonce = allocator.allocate()
+    original = sign(nonce)
+    allocator.track(nonce, original.raw_transaction, original.hash)
+    allocator.broadcast(nonce)
+    replacer = replacement.Replacer(web3, CHAIN, config.PRIVATE_KEY_MAIN, config.main_addr, FLOW, deadline=0.3)
+    thread = _original_lands(journal, chain, replacer, original)
+
+    receipts = allocator.wait_all(tracker, timeout=15, replacer=replacer)
+    thread.join()
+    assert list(receipts) == [nonce]
+    _check_original_won(journal, receipts[nonce], original)
+    assert not tracker._pending
@@ -0,0 +1,150 @@
+import time
+
+import pytest
+
+import providers
+import rpc_selector
+from rpc_selector import EndpointSelector, FailoverProvider
+from standin_rpc import StandinChain
+
+
+class FakeProvider:
+    """Провайдер с заданной задержкой и ответом (или исключением)."""
+
+    def __init__(self, url, latency=0.0, response=None, error=None):
+        self.endpoint_uri = url
+        self.latency = latency
+        self.response = response if response is not None else {'jsonrpc': '2.0', 'id': 1, 'result': url}
+        self.error = error
+        self.calls = []
+
+    def make_request(self, method, params):
+        self.calls.append(method)
+        time.sleep(self.latency)
+        if self.error is not None:
+            raise self.error
+        return self.response
+
+
+def _quiet(selector):
+    # Без фонового замера задержек - порядок в тестах задаём сами
+    selector.probed_at = time.monotonic()
+    return selector
+
+def _provider(providers_, hedged_methods=None):
+    provider = FailoverProvider(providers_, hedged_methods)
+    _quiet(provider.selector)
+    return provider
+
+def test_ranked_by_latency():
+    fast, slow, unmeasured = FakeProvider('fast'), FakeProvider('slow'), FakeProvider('new')
+    selector = _quiet(EndpointSelector([slow, fast, unmeasured]))
+    selector.endpoints[0].record(0.5, True)
+    selector.endpoints[1].record(0.1, True)
+    # Неизмеренный - первым, дальше по задержке
+    assert [e.url for e in selector.ranked()] == ['new', 'fast', 'slow']
+
+def test_failover_on_exception():
+    down = FakeProvider('down', error=ConnectionError('refused'))
+    up = FakeProvider('up')
+    provider = _provider([down, up])
+    assert provider.make_request('eth_chainId', [])['result'] == 'up'
+    assert provider.selector.endpoints[0].consecutive_errors == 1
+
+def test_demoted_after_consecutive_errors():
+    down = FakeProvider('down', error=ConnectionError('refused'))
+    up = FakeProvider('up')
+    provider = _provider([down, up])
+    for _ in range(rpc_selector.MAX_CONSECUTIVE_ERRORS):
+        with pytest.raises(ConnectionError):
+            provider.selector.endpoints[0].call('make_request', 'eth_chainId', [])
+    assert [e.url for e in provider.selector.ranked()] == ['up', 'down']
+    calls = len(down.calls)
+    provider.make_request('eth_chainId', [])
+    assert len(down.calls) == calls
+
+def test_server_error_response_fails_over():
+    lagging = FakeProvider('lagging', response={'jsonrpc': '2.0', 'id': 1,
+                                                 'error': {'code': -32000, 'message': 'header not found'}})
+    limited = FakeProvider('limited', response={'jsonrpc': '2.0', 'id': 1,
+                                                 'error': {'code': 429, 'message': 'Too Many Requests'}})
+    up = FakeProvider('up')
+    provider = _provider([lagging, limited, up])
+    assert provider.make_request('eth_getBlockByNumber', ['latest', False])['result'] == 'up'
+    assert [e.errors for e in provider.selector.endpoints] == [1, 1, 0]
+
+def test_deterministic_error_returned_as_is():
+    response = {'jsonrpc': '2.0', 'id': 1, 'error': {'code': -32000, 'message': 'nonce too low'}}
+    first, second = FakeProvider('first', response=response), FakeProvider('second')
+    provider = _provider([first, second], hedged_methods=())
+    assert provider.make_request('eth_sendRawTransaction', ['0x00']) == response
+    assert second.calls == []
+    assert provider.selector.endpoints[0].errors == 0
+
+def test_all_server_errors_return_last_response():
+    response = {'jsonrpc': '2.0', 'id': 1, 'error': {'code': -32603, 'message': 'internal error'}}
+    provider = _provider([FakeProvider('a', response=response), FakeProvider('b', response=response)])
+    assert provider.make_request('eth_blockNumber', []) == response
+
+def test_hedged_returns_first_answer():
+    slow, fast = FakeProvider('slow', latency=0.5), FakeProvider('fast', latency=0.01)
+    provider = _provider([slow, fast])
+    start = time.monotonic()
+    assert provider.make_request('eth_sendRawTransaction', ['0x00'])['result'] == 'fast'
+    assert time.monotonic() - start < 0.4
+    # Оба RPC получили транзакцию
+    assert slow.calls == fast.calls == ['eth_sendRawTransaction']
+
+def test_hedged_prefers_success_over_error():
+    failing = FakeProvider('failing', response={'jsonrpc': '2.0', 'id': 1,
+                                                 'error': {'code': -32000, 'message': 'already known'}})
+    slow = FakeProvider('slow', latency=0.1)
+    provider = _provider([failing, slow])
+    assert provider.make_request('eth_sendRawTransaction', ['0x00'])['result'] == 'slow'
+
+def test_hedging_can_be_disabled():
+    first, second = FakeProvider('first'), FakeProvider('second')
+    provider = _provider([first, second], hedged_methods=())
+    assert provider.make_request('eth_sendRawTransaction', ['0x00'])['result'] == 'first'
+    assert second.calls == []
+
+def test_hedged_methods_through_make_provider():
+    provider = providers.make_provider(['http://127.0.0.1:1', 'http://127.0.0.1:2'], hedged_methods=['eth_call'])
+    assert provider.hedged_methods == frozenset(['eth_call'])
+    provider = providers.make_provider(['http://127.0.0.1:1', 'http://127.0.0.1:2'])
+    assert provider.hedged_methods == rpc_selector.HEDGED_METHODS
+
+def test_periodic_reprobe():
+    first, second = FakeProvider('first'), FakeProvider('second')
+    selector = EndpointSelector([first, second])
+    selector.probed_at = time.monotonic() - rpc_selector.REPROBE_INTERVAL - 1
+    selector.ranked()
+    deadline = time.monotonic() + 5
+    while any(e.latency is None for e in selector.endpoints) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert first.calls == second.calls == ['eth_blockNumber']
+    # Следующий замер - не раньше REPROBE_INTERVAL
+    selector.ranked()
+    time.sleep(0.05)
+    assert first.calls == ['eth_blockNumber']
+
+@pytest.fixture
+def no_http_retries(monkeypatch):
+    monkeypatch.setattr(providers, 'RPC_RETRIES', 0)
+    providers.close_all()
+    yield
+    providers.close_all()
+
+def test_failover_against_standin(no_http_retries):
+    down = StandinChain(fail_rate=1.0)
+    up = StandinChain()
+    try:
+        provider = providers.make_provider([down.url, up.url])
+        _quiet(provider.selector)
+        for _ in range(rpc_selector.MAX_CONSECUTIVE_ERRORS):
+            assert provider.make_request('eth_chainId', [])['result']
+        assert [e.url for e in provider.selector.ranked()] == [up.url, down.url]
+        assert up.calls['eth_chainId'] == rpc_selector.MAX_CONSECUTIVE_ERRORS
+    finally:
+        down.close()
+        up.close()
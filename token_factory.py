@@ -0,0 +1,203 @@
+import logging
+import os
+import secrets
+import sys
+
+from eth_abi import encode
+from eth_utils import keccak, to_checksum_address
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+import deployments
+import fee_oracle
+import gas_cache
+import metrics
+import presign
+import receipt_tracker
+import replacement
+from compile_cache import compile_cached
+from nonce_manager import NonceAllocator
+
+
+# Фабрика один раз разворачивает реализацию токена, дальше каждый токен -
+# минимальный прокси EIP-1167 (55 байт) по CREATE2 с инициализацией в том же вызове
+FACTORY_SOURCE = """
+// SPDX-License-Identifier: MIT
+pragma solidity ^0.8.0;
+
+import "@openzeppelin/contracts/token/ERC20/ERC20.sol";
+import "@openzeppelin/contracts/proxy/Clones.sol";
+
+contract CloneableToken is ERC20 {
+    string private _tokenName;
+    string private _tokenSymbol;
+    bool private _initialized;
+
+    constructor() ERC20("", "") {
+        // Реализацию саму по себе инициализировать нельзя
+        _initialized = true;
+    }
+
+    function initialize(string calldata name_, string calldata symbol_, uint256 supply, address owner) external {
+        require(!_initialized, "already initialized");
+        _initialized = true;
+        _tokenName = name_;
+        _tokenSymbol = symbol_;
+        _mint(owner, supply);
+    }
+
+    function name() public view override returns (string memory) {
+        return _tokenName;
+    }
+
+    function symbol() public view override returns (string memory) {
+        return _tokenSymbol;
+    }
+}
+
+contract TokenFactory {
+    address public immutable implementation;
+
+    event TokenCreated(address indexed token, address indexed owner, string name, string symbol);
+
+    constructor() {
+        implementation = address(new CloneableToken());
+    }
+
+    function createToken(string calldata name_, string calldata symbol_, uint256 supply, bytes32 salt)
+        external returns (address token)
+    {
+        // Соль привязана к отправителю - чужой не займёт предсказанный адрес
+        token = Clones.cloneDeterministic(implementation, keccak256(abi.encode(msg.sender, salt)));
+        CloneableToken(token).initialize(name_, symbol_, supply, msg.sender);
+        emit TokenCreated(token, msg.sender, name_, symbol_);
+    }
+}
+"""
+FACTORY_NAME = 'TokenFactory'
+# Нужная скриптам часть ABI фабрики - создавать токены можно и без solc
+FACTORY_ABI = [
+    {'name': 'implementation', 'type': 'function', 'stateMutability': 'view',
+     'inputs': [], 'outputs': [{'name': '', 'type': 'address'}]},
+    {'name': 'createToken', 'type': 'function', 'stateMutability': 'nonpayable',
+     'inputs': [{'name': 'name_', 'type': 'string'}, {'name': 'symbol_', 'type': 'string'},
+                {'name': 'supply', 'type': 'uint256'}, {'name': 'salt', 'type': 'bytes32'}],
+     'outputs': [{'name': 'token', 'type': 'address'}]},
+]
+# Код создания минимального прокси EIP-1167 вокруг адреса реализации
+CLONE_PREFIX = bytes.fromhex('3d602d80600a3d3981f3363d3d373d3d3d363d73')
+CLONE_SUFFIX = bytes.fromhex('5af43d82803e903d91602b57fd5bf3')
+
+
+def compile_factory():
+    compiled = compile_cached(FACTORY_SOURCE)
+    for contract_id, contract_data in compiled.items():
+        if contract_id.endswith(f':{FACTORY_NAME}'):
+            return contract_data
+    raise ValueError(f'{FACTORY_NAME} не найден в результате компиляции')
+
+def create2_address(deployer, salt, init_code):
+    """Адрес CREATE2 (EIP-1014)."""
+    digest = keccak(b'\xff' + bytes.fromhex(deployer[2:]) + salt + keccak(init_code))
+    return to_checksum_address(digest[12:])
+
+def clone_address(factory, implementation, sender, salt):
+    """Адрес токена, который создаст createToken - считается локально, без RPC."""
+    init_code = CLONE_PREFIX + bytes.fromhex(implementation[2:]) + CLONE_SUFFIX
+    return create2_address(factory, keccak(encode(['address', 'bytes32'], [sender, salt])), init_code)
+
+def get_factory(chain_name):
+    """(адрес фабрики, адрес реализации) из реестра развёртываний или (None, None)."""
+    return deployments.get('token_factory', chain_name), deployments.get('token_implementation', chain_name)
+
+def deploy_factory(handler):
+    """Разворачивает фабрику тем же путём, что и токен."""
+    import create_token_class
+    try:
+        contract_data = compile_factory()
+    except Exception as e:
+        logging.error(f"Ошибка компиляции фабрики: {e}")
+        return None, None
+    receipt = create_token_class.deploy_contract(handler, contract_data, flow='factory_deploy')
+    if receipt is None or receipt.status != 1:
+        return None, None
+    factory = handler.web3.eth.contract(address=receipt.contractAddress, abi=FACTORY_ABI)
+    implementation = factory.functions.implementation().call()
+    deployments.save('token_factory', handler.chain_name, receipt.contractAddress)
+    deployments.save('token_implementation', handler.chain_name, implementation)
+    return receipt.contractAddress, implementation
+
+def ensure_factory(handler):
+    factory_address, implementation = get_factory(handler.chain_name)
+    if factory_address and implementation:
+        return factory_address, implementation
+    return deploy_factory(handler)
+
+def create_tokens(chain_name, count=1, initial_supply=None, receipt_timeout=180):
+    """Создаёт count токенов через фабрику: подписываются заранее и отправляются пачкой.
+
+    Возвращает [(адрес токена, квитанция | None)].
+    """
+    import create_token_class
+    try:
+        handler = create_token_class.NetworkHandler(chain_name)
+    except Exception as e:
+        logging.error(f"{e}")
+        return []
+    factory_address, implementation = ensure_factory(handler)
+    if not factory_address:
+        return []
+    web3 = handler.web3
+    factory = web3.eth.contract(address=factory_address, abi=FACTORY_ABI)
+    if initial_supply is None:
+        initial_supply = web3.to_wei(1000000, 'ether')
+
+    tokens = []
+    for _ in range(count):
+        token_name, token_symbol = create_token_class.generate_unique_token_name()
+        salt = secrets.token_bytes(32)
+        address = clone_address(factory_address, implementation, handler.account_address, salt)
+        tokens.append((address, factory.encode_abi('createToken', args=[token_name, token_symbol, initial_supply, salt])))
+
+    # Все вызовы фабрики одной формы (имена одной длины) - оценка из gas_cache
+    call = {'from': handler.account_address, 'to': factory_address, 'data': tokens[0][1]}
+    try:
+        with metrics.phase(chain_name, 'estimate', 'factory'):
+            gas_estimate = gas_cache.estimate(web3, chain_name, call)
+    except Exception as e:
+        logging.error(f"Ошибка оценки газа: {e}")
+        return []
+    gas_limit = gas_cache.gas_limit(chain_name, call, gas_estimate)
+
+    allocator = NonceAllocator(web3, handler.account_address, chain_name=chain_name, flow='factory')
+    start_nonce = allocator.allocate_range(count)
+    tx_params = handler.get_tx_params(gas_limit, start_nonce)
+    if not tx_params:
+        return []
+    txs = [dict(tx_params, to=factory_address, data=data, nonce=start_nonce + i)
+           for i, (_, data) in enumerate(tokens)]
+    with metrics.phase(chain_name, 'sign', 'factory'):
+        signed = presign.sign_many(handler.private_key, txs)
+    for i, (raw, _) in enumerate(signed):
+        allocator.track(start_nonce + i, raw)
+    with metrics.phase(chain_name, 'broadcast', 'factory'):
+        for nonce in sorted(allocator.in_flight):
+            allocator.broadcast(nonce)
+
+    tracker = receipt_tracker.get_tracker(web3, chain_name)
+    with metrics.phase(chain_name, 'confirm', 'factory'):
+        receipts = allocator.wait_all(tracker, timeout=receipt_timeout,
+                                      replacer=replacement.Replacer(web3, chain_name, handler.private_key,
+                                                                    handler.account_address, flow='factory'))
+    results = []
+    for i, (address, _) in enumerate(tokens):
+        receipt = receipts.get(start_nonce + i)
+        gas_cache.learn(chain_name, call, receipt, gas_limit)
+        metrics.record_tx(chain_name, 'factory', receipt['transactionHash'] if receipt else None, receipt,
+                          gas_estimate, txs[i], fee_oracle.fee_cap(chain_name))
+        if receipt is not None and receipt.status == 1:
+            logging.info(f"Токен создан: {address}, блок: {receipt.blockNumber}")
+        else:
+            logging.warning(f"Токен {address} не создан")
+        results.append((address, receipt))
+    return results
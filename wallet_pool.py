@@ -0,0 +1,242 @@
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from eth_account import Account
+from web3.middleware import ExtraDataToPOAMiddleware
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+import config
+import chain_profile
+import chain_registry
+import providers
+import fee_oracle
+import preflight
+import receipt_tracker
+import metrics
+import gas_cache
+import replacement
+from nonce_manager import NonceAllocator
+
+
+MAX_CHAIN_WORKERS = 5     # сколько сетей обрабатываем одновременно
+TX_PER_CHAIN = 10         # транзакций на сеть за запуск по умолчанию
+RECEIPT_TIMEOUT = 180
+TRANSFER_AMOUNT = 10**13  # 0.00001 токена, как в send_token
+
+
+def load_accounts(private_keys=None):
+    """Аккаунты пула: config.PRIVATE_KEYS, иначе один PRIVATE_KEY_MAIN."""
+    if private_keys is None:
+        private_keys = getattr(config, 'PRIVATE_KEYS', None) or [config.PRIVATE_KEY_MAIN]
+    return [Account.from_key(key) for key in private_keys if key]
+
+
+class WalletLane:
+    """Аккаунт пула в одной сети: своя очередь nonce и учёт баланса."""
+
+    def __init__(self, web3, account, snapshot, chain_name=None, flow=None):
+        self.account = account
+        self.address = account.address
+        self.allocator = NonceAllocator(web3, self.address, start_nonce=snapshot.nonce,
+                                        chain_name=chain_name, flow=flow)
+        # Застрявшие транзакции аккаунта заменяются своим же ключом
+        self.replacer = replacement.Replacer(web3, chain_name, account.key, self.address, flow)
+        self.balance = snapshot.balance
+        self.reserved = 0      # максимальная стоимость ещё не подтверждённых транзакций
+        self.pending = 0
+        self.sent = 0
+        self.confirmed = 0
+
+    def available(self):
+        return self.balance - self.reserved
+
+
+class LaneScheduler:
+    """Раздаёт транзакции аккаунтам: меньше ожидающих, затем больше свободный баланс.
+
+    Все транзакции запуска раздаются до первой квитанции, поэтому на деле это
+    раздача по кругу с пропуском аккаунтов, которым не хватает баланса.
+    """
+
+    def __init__(self, lanes):
+        self.lanes = lanes
+        self._lock = threading.Lock()
+
+    def assign(self, cost_wei):
+        """Возвращает (аккаунт, nonce) или (None, None), если никому не хватает средств."""
+        with self._lock:
+            candidates = [lane for lane in self.lanes if lane.available() >= cost_wei]
+            if not candidates:
+                return None, None
+            lane = min(candidates, key=lambda lane: (lane.pending, -lane.available()))
+            lane.reserved += cost_wei
+            lane.pending += 1
+            return lane, lane.allocator.allocate()
+
+    def settle(self, lane, receipt, cost_wei):
+        """Снимает резерв после подтверждения, списывая фактическую комиссию."""
+        with self._lock:
+            lane.reserved -= cost_wei
+            lane.pending -= 1
+            if receipt is not None:
+                lane.confirmed += receipt['status'] == 1
+                price = receipt.get('effectiveGasPrice')
+                if price is not None:
+                    lane.balance -= receipt['gasUsed'] * price
+
+
+# Задания: job(web3, chain_name) -> build(sender) -> поля транзакции без газа и nonce
+def gm_job(web3, chain_name):
+    import onchaingm
+    contract = onchaingm.get_gm_contract(web3, chain_name)
+    if not contract.address:
+        raise ValueError(f'нет контракта onchaingm в {chain_name}')
+    data = contract.encode_abi('sendGM', args=[onchaingm.GREETING])
+    return lambda sender: {'to': contract.address, 'data': data}
+
+def send_job(web3, chain_name):
+    # Перевод самому себе, как в send_token
+    return lambda sender: {'to': sender, 'value': TRANSFER_AMOUNT}
+
+def deploy_job(web3, chain_name):
+    import create_token_class
+    _, contract_data = create_token_class.compile_contract(create_token_class.SOLIDITY_CODE)
+    contract = web3.eth.contract(abi=contract_data['abi'], bytecode=contract_data['bin'])
+    initial_supply = web3.to_wei(1000000, 'ether')
+
+    def build(sender):
+        token_name, token_symbol = create_token_class.generate_unique_token_name()
+        # Все поля заданы - build_transaction только кодирует конструктор, без RPC
+        tx = contract.constructor(token_name, token_symbol, initial_supply).build_transaction(
+            {'from': sender, 'gas': 0, 'gasPrice': 0, 'chainId': 0})
+        return {'data': tx['data']}
+    return build
+
+JOBS = {'gm': gm_job, 'send': send_job, 'deploy': deploy_job}
+
+
+def _connect(chain_name):
+    web3 = providers.make_web3(chain_registry.rpc(chain_name), chain_name=chain_name)
+    profile = chain_profile.get_profile(web3, chain_name)
+    if profile['is_poa']:
+        web3.middleware_onion.inject(ExtraDataToPOAMiddleware, layer=0)
+    return web3, profile
+
+def _open_lanes(web3, accounts, estimate_tx, chain_name=None, flow=None):
+    """Pre-flight всех аккаунтов параллельно; оценка газа - только для первого (через кэш)."""
+    def fetch(index):
+        if index == 0:
+            return gas_cache.fetch(web3, chain_name, accounts[0].address, estimate_tx)
+        return preflight.fetch(web3, accounts[index].address)
+    with ThreadPoolExecutor(max_workers=min(len(accounts), 8)) as pool:
+        snapshots = list(pool.map(fetch, range(len(accounts))))
+    lanes = [WalletLane(web3, account, snapshot, chain_name, flow) for account, snapshot in zip(accounts, snapshots)]
+    return lanes, snapshots[0]
+
+def run_chain(chain_name, accounts, job='gm', tx_count=TX_PER_CHAIN, receipt_timeout=RECEIPT_TIMEOUT):
+    """Отправляет tx_count транзакций в сети, распределяя их по аккаунтам пула."""
+    result = {'chain': chain_name, 'sent': 0, 'confirmed': 0, 'wallets': 0, 'latency': None, 'error': None}
+    start = time.monotonic()
+    try:
+        with metrics.phase(chain_name, 'connect', 'pool'):
+            web3, profile = _connect(chain_name)
+        build = JOBS[job](web3, chain_name)
+        first = accounts[0].address
+        estimate_tx = dict(build(first), **{'from': first})
+        with metrics.phase(chain_name, 'preflight', 'pool'):
+            lanes, snapshot = _open_lanes(web3, accounts, estimate_tx, chain_name, f'pool_{job}')
+        if snapshot.gas_estimate is None:
+            raise ValueError(f"ошибка оценки газа: {snapshot.errors.get('gas_estimate')}")
+        gas_limit = snapshot.gas_limit
+        fees = fee_oracle.quote(web3, chain_name, 'normal', snapshot,
+                                eip1559=False if profile['is_poa'] or not profile['eip1559'] else None)
+        scheduler = LaneScheduler(lanes)
+        result['wallets'] = len(lanes)
+
+        # Подписываем: по кругу между аккаунтами, которым хватает баланса
+        base = {'gas': gas_limit, 'chainId': snapshot.chain_id, **fees.tx_fields()}
+        cost = gas_limit * fees.max_price() + (build(first).get('value') or 0)
+        with metrics.phase(chain_name, 'sign', 'pool'):
+            for i in range(tx_count):
+                lane, nonce = scheduler.assign(cost)
+                if lane is None:
+                    print(f'{chain_name}: не хватает средств ни на одном аккаунте, подписано {i}')
+                    break
+                tx = dict(base, **build(lane.address), nonce=nonce)
+                tx['from'] = lane.address
+                signed_tx = lane.account.sign_transaction(tx)
+                lane.allocator.track(nonce, signed_tx.raw_transaction)
+
+        # Очереди разных аккаунтов независимы - отправляем вперемешку, по одному nonce
+        # каждого аккаунта за круг: первые транзакции всех аккаунтов уходят сразу
+        with metrics.phase(chain_name, 'broadcast', 'pool'):
+            queues = [(lane, sorted(lane.allocator.in_flight)) for lane in lanes]
+            for i in range(max((len(nonces) for _, nonces in queues), default=0)):
+                for lane, nonces in queues:
+                    if i < len(nonces) and lane.allocator.broadcast(nonces[i]):
+                        lane.sent += 1
+
+        # Квитанции всех аккаунтов - через общий трекер блоков сети
+        tracker = receipt_tracker.get_tracker(web3, chain_name)
+        fee_cap = fee_oracle.fee_cap(chain_name)
+
+        def collect(lane):
+            receipts = lane.allocator.wait_all(tracker, timeout=receipt_timeout,
+                                               from_block=snapshot.block_number, replacer=lane.replacer)
+            for receipt in receipts.values():
+                scheduler.settle(lane, receipt, cost)
+                gas_cache.learn(chain_name, estimate_tx, receipt, gas_limit)
+                metrics.record_tx(chain_name, f'pool_{job}', receipt['transactionHash'], receipt,
+                                  snapshot.gas_estimate, base, fee_cap)
+            for nonce in list(lane.allocator.in_flight):
+                scheduler.settle(lane, None, cost)
+        with metrics.phase(chain_name, 'confirm', 'pool'):
+            with ThreadPoolExecutor(max_workers=len(lanes)) as pool:
+                list(pool.map(collect, lanes))
+
+        result['sent'] = sum(lane.sent for lane in lanes)
+        result['confirmed'] = sum(lane.confirmed for lane in lanes)
+        if result['confirmed'] < result['sent']:
+            result['error'] = f"не подтверждено: {result['sent'] - result['confirmed']}"
+    except Exception as e:
+        print(f'ошибка в {chain_name}:\n{e}')
+        result['error'] = str(e) or type(e).__name__
+    finally:
+        result['latency'] = round(time.monotonic() - start, 2)
+        metrics.event('flow', flow=f'pool_{job}', **result)
+    return result
+
+def print_results(results):
+    print(f"{'chain':<14} {'wallets':>7} {'sent':>6} {'ok':>6} {'latency,s':>10}  error")
+    for r in results:
+        latency = r['latency'] if r['latency'] is not None else '-'
+        print(f"{r['chain']:<14} {r['wallets']:>7} {r['sent']:>6} {r['confirmed']:>6} {latency:>10}  {r['error'] or ''}")
+    print()
+
+def main(chain_list, job='gm', tx_count=TX_PER_CHAIN, max_workers=MAX_CHAIN_WORKERS,
+         private_keys=None, receipt_timeout=RECEIPT_TIMEOUT):
+    """Веер по всем сетям сразу; в каждой сети - по всем аккаунтам пула."""
+    accounts = load_accounts(private_keys)
+    if not accounts:
+        print("Приватные ключи не найдены")
+        return []
+    chain_list = chain_registry.select(chain_list, job)
+    print(f'аккаунтов в пуле: {len(accounts)}, сетей: {len(chain_list)}, задание: {job} x{tx_count}')
+    pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='wallet-pool')
+    futures = {pool.submit(run_chain, name, accounts, job, tx_count, receipt_timeout): name
+               for name in chain_list}
+    wait(futures)
+    pool.shutdown()
+    results = {futures[future]: future.result() for future in futures}
+    results = [results[name] for name in chain_list]
+    print_results(results)
+    return results
+
+if __name__ == "__main__":
+    chain_list = chain_registry.names('gm')
+    main(chain_list, job='gm')
+    print(f'script done\n')